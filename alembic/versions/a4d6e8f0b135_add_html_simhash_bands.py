@@ -0,0 +1,44 @@
+"""add html simhash and html_simhash_bands
+
+Revision ID: a4d6e8f0b135
+Revises: f1a3c5e7b902
+Create Date: 2026-10-17 14:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "a4d6e8f0b135"
+down_revision: Union[str, Sequence[str], None] = "f1a3c5e7b902"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("html", sa.Column("simhash", sa.String(length=16), nullable=True))
+    op.create_table(
+        "html_simhash_bands",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("html_id", sa.String(), nullable=False),
+        sa.Column("band", sa.Integer(), nullable=False),
+        sa.Column("value", sa.String(length=4), nullable=False),
+        sa.ForeignKeyConstraint(["html_id"], ["html.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        "ix_html_simhash_bands_band_value",
+        "html_simhash_bands",
+        ["band", "value"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_html_simhash_bands_band_value", table_name="html_simhash_bands")
+    op.drop_table("html_simhash_bands")
+    op.drop_column("html", "simhash")
@@ -0,0 +1,27 @@
+"""add projects model_cascade
+
+Revision ID: e7b2c4d6f813
+Revises: c3d9e5f7a2b4
+Create Date: 2026-10-17 10:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "e7b2c4d6f813"
+down_revision: Union[str, Sequence[str], None] = "c3d9e5f7a2b4"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("projects", sa.Column("model_cascade", sa.String(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("projects", "model_cascade")
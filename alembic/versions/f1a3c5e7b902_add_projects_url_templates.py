@@ -0,0 +1,27 @@
+"""add projects url_templates
+
+Revision ID: f1a3c5e7b902
+Revises: e7b2c4d6f813
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "f1a3c5e7b902"
+down_revision: Union[str, Sequence[str], None] = "e7b2c4d6f813"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("projects", sa.Column("url_templates", sa.Text(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("projects", "url_templates")
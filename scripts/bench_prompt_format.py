@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import re
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+from talk2dom.api.utils.document import ParsedDocument
+from talk2dom.api.utils.outline import build_prompt_html
+
+DEFAULT_FIXTURES = (
+    Path(__file__).resolve().parent.parent / "tests" / "fixtures" / "prompt_pages.json"
+)
+_ANCHOR_RE = re.compile(r"#([\w-]+)|\.([\w-]+)|=\s*['\"]([^'\"]+)['\"]")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Compare prompt size and selector accuracy across prompt formats."
+    )
+    parser.add_argument(
+        "--fixtures",
+        type=Path,
+        default=DEFAULT_FIXTURES,
+        help="JSON list of pages with instructions and expected selectors.",
+    )
+    parser.add_argument(
+        "--formats",
+        default="html,outline",
+        help="Comma separated prompt formats to compare.",
+    )
+    parser.add_argument(
+        "--llm",
+        action="store_true",
+        help="Also ask the configured model (TALK2DOM_MODEL_NAME) for selectors.",
+    )
+    return parser
+
+
+def _anchors(selector_type: str, selector_value: str) -> list[str]:
+    if selector_type in ("id", "name", "class name"):
+        return [selector_value]
+    return [
+        next(g for g in m.groups() if g) for m in _ANCHOR_RE.finditer(selector_value)
+    ]
+
+
+def _lxml_index(el) -> int:
+    parent = el.getparent()
+    if parent is None:
+        return 0
+    return [c for c in parent if isinstance(c.tag, str)].index(el)
+
+
+def _element_paths(doc: ParsedDocument, selector_type: str, selector_value: str):
+    """Tag/index paths of the matched elements, comparable across selector types."""
+    selector_type = selector_type.lower()
+    if selector_type == "xpath":
+        matches = [
+            el for el in doc.validator.tree.xpath(selector_value) if hasattr(el, "tag")
+        ]
+        return {
+            tuple((a.tag, _lxml_index(a)) for a in reversed([el, *el.iterancestors()]))
+            for el in matches
+        }
+    css = {
+        "id": f"#{selector_value}",
+        "name": f"[name='{selector_value}']",
+        "class name": f".{selector_value}",
+    }.get(selector_type, selector_value)
+    try:
+        matches = doc.soup.select(css)
+    except Exception:
+        return set()
+    paths = set()
+    for el in matches:
+        path = []
+        node = el
+        while node is not None and node.name != "[document]":
+            siblings = [c for c in node.parent.children if getattr(c, "name", None)]
+            path.append((node.name, siblings.index(node)))
+            node = node.parent
+        paths.add(tuple(reversed(path)))
+    return paths
+
+
+async def _ask_llm(instruction: str, prompt_html: str):
+    from talk2dom.core import acall_selector_llm
+
+    return await acall_selector_llm(
+        instruction,
+        prompt_html,
+        os.environ.get("TALK2DOM_MODEL_NAME"),
+        os.environ.get("TALK2DOM_MODEL_PROVIDER_NAME"),
+    )
+
+
+def run(fixtures: Path, formats: list[str], use_llm: bool = False) -> dict:
+    pages = json.loads(fixtures.read_text(encoding="utf-8"))
+    report = {
+        fmt: {"chars": 0, "anchors": 0, "correct": 0, "cases": 0} for fmt in formats
+    }
+    for page in pages:
+        doc = ParsedDocument(page["html"])
+        cleaned = doc.cleaned_html
+        for case in page["cases"]:
+            expected = _element_paths(
+                doc, case["selector_type"], case["selector_value"]
+            )
+            anchors = _anchors(case["selector_type"], case["selector_value"])
+            for fmt in formats:
+                prompt = build_prompt_html(cleaned, case["instruction"], fmt)
+                stats = report[fmt]
+                stats["cases"] += 1
+                stats["chars"] += len(prompt)
+                stats["anchors"] += all(anchor in prompt for anchor in anchors)
+                if use_llm:
+                    selector = asyncio.run(_ask_llm(case["instruction"], prompt))
+                    if selector is not None:
+                        got = _element_paths(
+                            doc, selector.selector_type, selector.selector_value
+                        )
+                        stats["correct"] += bool(expected) and got == expected
+    return report
+
+
+def main() -> int:
+    load_dotenv()
+    args = build_parser().parse_args()
+    formats = [fmt.strip() for fmt in args.formats.split(",") if fmt.strip()]
+    report = run(args.fixtures, formats, use_llm=args.llm)
+
+    baseline = report[formats[0]]["chars"] or 1
+    print(
+        f"{'format':<10} {'chars':>9} {'vs ' + formats[0]:>10} {'anchors':>9} {'accuracy':>9}"
+    )
+    for fmt, stats in report.items():
+        cases = stats["cases"] or 1
+        accuracy = f"{stats['correct'] / cases:.0%}" if args.llm else "-"
+        print(
+            f"{fmt:<10} {stats['chars']:>9} {stats['chars'] / baseline:>10.1%} "
+            f"{stats['anchors'] / cases:>9.0%} {accuracy:>9}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
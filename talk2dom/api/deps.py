@@ -1,10 +1,16 @@
 # talk2dom/api/deps.py
+import asyncio
 from datetime import datetime
 from functools import wraps
 
+from typing import Optional
+
 from fastapi.responses import JSONResponse
-from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import exists, func, select
+from sqlalchemy.orm import Session, aliased
 
+from talk2dom.db import context_cache, counters, usage_log
 from talk2dom.db.session import get_db
 from talk2dom.db.models import User, APIUsage, APIKey
 from talk2dom.api.limiter import limiter
@@ -38,138 +44,393 @@ def get_current_user(request: Request, db: Session = Depends(get_db)) -> User:
     return user
 
 
-async def get_api_key_user(
-    request: Request,
-    db: Session = Depends(get_db),
-):
+def _bearer_key(request: Request) -> str:
     auth_header = request.headers.get("Authorization")
     if not auth_header or not auth_header.startswith("Bearer "):
         raise HTTPException(status_code=401, detail="Missing or invalid API Key")
+    return auth_header.removeprefix("Bearer ").strip()
 
-    api_key = auth_header.split(" ")[1]
 
-    user = db.query(User).filter(User.api_keys.any(key=api_key)).first()
-    if not user:
-        raise HTTPException(status_code=403, detail="Invalid API Key")
-    logger.debug(f"User {user.id} has API Key {api_key}")
-    return user
+def _load_request_context(db: Session, api_key: str, project_id) -> Optional[dict]:
+    """Resolve key, its user, the project and its owner in a single query."""
+    owner = aliased(User)
+    member_count = (
+        select(func.count(ProjectMembership.id))
+        .where(ProjectMembership.project_id == Project.id)
+        .scalar_subquery()
+    )
+    is_member = (
+        exists()
+        .where(
+            ProjectMembership.project_id == Project.id,
+            ProjectMembership.user_id == User.id,
+        )
+        .correlate(Project, User)
+    )
+    row = (
+        db.query(
+            APIKey.id.label("api_key_id"),
+            APIKey.is_active.label("key_active"),
+            User.id.label("user_id"),
+            User.email.label("email"),
+            User.plan.label("plan"),
+            Project.id.label("project_id"),
+            Project.owner_id.label("owner_id"),
+            Project.model_cascade.label("model_cascade"),
+            Project.url_templates.label("url_templates"),
+            owner.plan.label("owner_plan"),
+            owner.subscription_credits.label("subscription_credits"),
+            owner.one_time_credits.label("one_time_credits"),
+            member_count.label("member_count"),
+            is_member.label("is_member"),
+        )
+        .join(User, User.id == APIKey.user_id)
+        .outerjoin(Project, Project.id == project_id)
+        .outerjoin(owner, owner.id == Project.owner_id)
+        .filter(APIKey.key == api_key)
+        .first()
+    )
+    if row is None:
+        return None
+    return {
+        "api_key_id": str(row.api_key_id),
+        # 早期创建的 key 没有 is_active 值,视为启用
+        "key_active": row.key_active is not False,
+        "user_id": str(row.user_id),
+        "email": row.email,
+        "plan": row.plan,
+        "project_id": str(row.project_id) if row.project_id is not None else None,
+        "owner_id": str(row.owner_id) if row.owner_id is not None else None,
+        "owner_plan": row.owner_plan,
+        "subscription_credits": int(row.subscription_credits or 0),
+        "one_time_credits": int(row.one_time_credits or 0),
+        "member_count": int(row.member_count or 0),
+        "has_access": row.project_id is not None
+        and (row.owner_id == row.user_id or bool(row.is_member)),
+        "model_cascade": row.model_cascade,
+        "url_templates": row.url_templates,
+    }
+
+
+async def get_request_context(
+    request: Request,
+    db: Session = Depends(get_db),
+) -> dict:
+    """Auth and tenant context of an API-key request, resolved once per request.
+
+    Built from one joined query and cached (L1, then Redis) for
+    ``T2D_AUTH_CACHE_TTL`` seconds; key, membership, plan and project changes
+    invalidate it through ``context_cache``.
+    """
+    api_key = _bearer_key(request)
+    project_id = request.query_params.get("project_id") or request.headers.get(
+        "X-Project-ID"
+    )
+    context = await context_cache.aget(api_key, project_id) if project_id else None
+    if context is None:
+        try:
+            project_uuid = UUID(project_id) if project_id else None
+        except ValueError:
+            # 非法的 project_id 当作不存在的项目
+            project_uuid = None
+        context = await run_in_threadpool(
+            _load_request_context, db, api_key, project_uuid
+        )
+        if context is None or not context["key_active"]:
+            raise HTTPException(status_code=403, detail="Invalid API Key")
+        if not project_id:
+            raise HTTPException(status_code=400, detail="Missing project_id")
+        if context["project_id"] is None:
+            raise HTTPException(status_code=404, detail="Project not found")
+        await context_cache.aset(api_key, project_id, context)
+    logger.debug(f"User {context['user_id']} has API Key {context['api_key_id']}")
+    request.state.request_context = context
+    # 项目级的模型级联配置,推理接口直接读取,不再查库
+    request.state.model_cascade = context["model_cascade"]
+    request.state.url_templates = context["url_templates"]
+    return context
+
+
+async def get_api_key_user(context: dict = Depends(get_request_context)) -> User:
+    # 只带上接口用到的字段,不挂在 session 上
+    return User(
+        id=UUID(context["user_id"]), email=context["email"], plan=context["plan"]
+    )
+
 
+async def get_api_key_id(context: dict = Depends(get_request_context)) -> str:
+    return context["api_key_id"]
 
-def get_api_key_id(
+
+async def get_current_project_id(
     request: Request,
-    db: Session = Depends(get_db),
+    context: dict = Depends(get_request_context),
 ) -> str:
-    auth_header = request.headers.get("Authorization")
-    if not auth_header or not auth_header.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Missing or invalid API Key")
+    return request.query_params.get("project_id") or request.headers.get("X-Project-ID")
+
+
+def _available_credits(user: User) -> int:
+    available = counters.balance(user)
+    if available is None:
+        available = int(user.subscription_credits) + int(user.one_time_credits)
+    return available
+
+
+def _check_context_quota(db: Session, context: dict, amount: int = 1) -> User:
+    # 与 _check_project_quota 相同的检查,数据来自已解析的请求上下文,不再查库
+    if not context["has_access"]:
+        logger.error(
+            f"User {context['user_id']} does not have access to project "
+            f"{context['project_id']}"
+        )
+        raise HTTPException(
+            status_code=403,
+            detail=f"The API Key can't access the project: {context['project_id']}",
+        )
+
+    project_owner = User(
+        id=UUID(context["owner_id"]),
+        plan=context["owner_plan"],
+        subscription_credits=context["subscription_credits"],
+        one_time_credits=context["one_time_credits"],
+    )
+    available = counters.balance(project_owner)
+    if available is None:
+        # 没有 Redis 计数器时,缓存里的余额可能过期,以数据库为准
+        project_owner = db.get(User, project_owner.id)
+        available = int(
+            project_owner.subscription_credits + project_owner.one_time_credits
+        )
+    if available < amount:
+        raise HTTPException(status_code=402, detail="Not enough credits")
+    if context["member_count"] > num_limit.get(project_owner.plan, 0):
+        raise HTTPException(
+            status_code=400,
+            detail="Member limit exceeded for your plan. Please upgrade your plan or remove member to continue.",
+        )
+    return project_owner
+
+
+def _check_project_quota(
+    db: Session, user: User, project_id, request=None, amount: int = 1
+) -> User:
+    """Check access, member limit and that ``amount`` credits are left."""
+    context = getattr(getattr(request, "state", None), "request_context", None)
+    if context is not None:
+        return _check_context_quota(db, context, amount)
+    if not has_project_access(db, user.id, project_id):
+        logger.error(f"User {user.id} does not have access to project {project_id}")
+        raise HTTPException(
+            status_code=403,
+            detail=f"The API Key can't access the project: {project_id}",
+        )
+
+    project_owner = get_project_owner(db, project_id)
+    if _available_credits(project_owner) < amount:
+        raise HTTPException(status_code=402, detail="Not enough credits")
+    members = (
+        db.query(ProjectMembership)
+        .filter(ProjectMembership.project_id == project_id)
+        .all()
+    )
+    if len(members) > num_limit.get(project_owner.plan, 0):
+        raise HTTPException(
+            status_code=400,
+            detail="Member limit exceeded for your plan. Please upgrade your plan or remove member to continue.",
+        )
+    return project_owner
+
+
+def _record_usage(
+    db: Session,
+    request: Request,
+    user: User,
+    credit_owner: User,
+    start: datetime,
+    end: datetime,
+    status_code: int,
+    event_name: str,
+    api_key_id=None,
+    project_id=None,
+):
+    duration_ms = int((end - start).total_seconds() * 1000)
+
+    call_llm = getattr(request.state, "call_llm", False)
+    # 批量接口在 request.state.usage_items 里给出每个条目的用量
+    items = getattr(request.state, "usage_items", None) if status_code == 200 else None
+    if not items:
+        items = [
+            {
+                "call_llm": call_llm,
+                "input_tokens": getattr(request.state, "input_tokens", None),
+                "output_tokens": getattr(request.state, "output_tokens", None),
+                "metadata": getattr(request.state, "usage_metadata", {}),
+            }
+        ]
+    rows = [
+        {
+            "api_key_id": api_key_id,
+            "user_id": user.id,
+            "project_id": project_id,
+            "endpoint": str(request.url.path),
+            "request_time": start,
+            "response_time": end,
+            "duration_ms": duration_ms,
+            "status_code": status_code,
+            "input_tokens": item.get("input_tokens"),
+            "output_tokens": item.get("output_tokens"),
+            "meta_data": item.get("metadata", {}),
+            "call_llm": item.get("call_llm", False),
+        }
+        for item in items
+    ]
+    credits = len(items) if status_code == 200 else 0
+    # 额度与调用次数记进 Redis 计数器后,由 reconciler 写回数据库
+    if credits and counters.charge(credit_owner, project_id, credits):
+        credits = 0
+    event = {
+        "rows": rows,
+        "credit_owner_id": credit_owner.id,
+        "credits": credits,
+        "project_id": project_id,
+    }
+    # 后台写入器在运行时只入队,用量与计数由它批量写入
+    if not usage_log.push(event):
+        for row in rows:
+            db.add(APIUsage(**row))
+        if credits:
+            # 来自缓存上下文的 owner 不在 session 里,扣费前按主键取回
+            consume_credit(db, db.get(User, credit_owner.id), amount=credits)
+            if project_id is not None:
+                (
+                    db.query(Project)
+                    .filter(Project.id == project_id)
+                    .update(
+                        {Project.api_call_count: Project.api_call_count + credits},
+                        synchronize_session=False,
+                    )
+                )
+        db.commit()
+    try:
+        ga.send(
+            user_id=user.id,
+            events=[
+                {
+                    "name": event_name,
+                    "params": {
+                        "url": str(request.url.path),
+                        "latency_ms": duration_ms,
+                        "status": status_code,
+                        "call_llm": call_llm,
+                    },
+                }
+            ],
+            user_properties={"plan": user.plan},
+        )
+    except Exception as e:
+        logger.warning(f"GA4 send failed: {e}")
+
+
+def _requested_credits(kwargs: dict) -> int:
+    # 批量接口每条指令扣一个额度,调用前就要够
+    instructions = getattr(kwargs.get("req"), "user_instructions", None)
+    return max(len(instructions), 1) if instructions else 1
 
-    api_key = auth_header.removeprefix("Bearer ").strip()
 
-    key_obj = db.query(APIKey).filter(APIKey.key == api_key).first()
-    if not key_obj:
-        raise HTTPException(status_code=403, detail="Invalid API Key")
-    logger.debug(f"User {key_obj.id} has API Key {api_key}")
-    return str(key_obj.id)
+def _failure(e: Exception) -> tuple:
+    # HTTPException(如截止时间耗尽的 504)保留自己的状态码,其余错误为 500
+    if isinstance(e, HTTPException):
+        return {"error": e.detail}, e.status_code
+    return {"error": str(e)}, 500
 
 
 def track_api_usage():
+    """Check project access/credits before the call and record usage after it.
+
+    Works on both sync and async endpoints; for async ones the blocking DB
+    work runs in the threadpool so the event loop is free while the endpoint
+    awaits the LLM.
+    """
+
     def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                request = kwargs.get("request")
+                db: Session = kwargs.get("db")
+                user = kwargs.get("user")
+                project_id = kwargs.get("project_id")
+
+                project_owner = await run_in_threadpool(
+                    _check_project_quota,
+                    db,
+                    user,
+                    project_id,
+                    request,
+                    _requested_credits(kwargs),
+                )
+
+                start = datetime.utcnow()
+                try:
+                    response_data = await func(*args, **kwargs)
+                    status_code = 200
+                except Exception as e:
+                    response_data, status_code = _failure(e)
+                end = datetime.utcnow()
+
+                await run_in_threadpool(
+                    _record_usage,
+                    db,
+                    request,
+                    user,
+                    project_owner,
+                    start,
+                    end,
+                    status_code,
+                    "locator_api_call",
+                    api_key_id=kwargs.get("api_key_id"),
+                    project_id=project_id,
+                )
+                if status_code != 200:
+                    return JSONResponse(content=response_data, status_code=status_code)
+                return response_data
+
+            return async_wrapper
+
         @wraps(func)
         def wrapper(*args, **kwargs):
             request = kwargs.get("request")
             db: Session = kwargs.get("db")
-            api_key_id = kwargs.get("api_key_id")
             user = kwargs.get("user")
             project_id = kwargs.get("project_id")
 
-            if not has_project_access(db, user.id, project_id):
-                logger.error(
-                    f"User {user.id} does not have access to project {project_id}"
-                )
-                raise HTTPException(
-                    status_code=403,
-                    detail=f"The API Key can't access the project: {project_id}",
-                )
-
-            project_owner = get_project_owner(db, project_id)
-            if (
-                int(project_owner.subscription_credits + project_owner.one_time_credits)
-                <= 0
-            ):
-                raise HTTPException(status_code=402, detail="Not enough credits")
-            members = (
-                db.query(ProjectMembership)
-                .filter(ProjectMembership.project_id == project_id)
-                .all()
+            project_owner = _check_project_quota(
+                db, user, project_id, request, _requested_credits(kwargs)
             )
-            if len(members) > num_limit.get(project_owner.plan, 0):
-                raise HTTPException(
-                    status_code=400,
-                    detail="Member limit exceeded for your plan. Please upgrade your plan or remove member to continue.",
-                )
 
             start = datetime.utcnow()
             try:
                 response_data = func(*args, **kwargs)
                 status_code = 200
             except Exception as e:
-                response_data = {"error": str(e)}
-                status_code = 500
-
+                response_data, status_code = _failure(e)
             end = datetime.utcnow()
-            duration_ms = int((end - start).total_seconds() * 1000)
-
-            input_tokens = getattr(request.state, "input_tokens", None)
-            output_tokens = getattr(request.state, "output_tokens", None)
-            metadata = getattr(request.state, "usage_metadata", {})
-            call_llm = getattr(request.state, "call_llm", False)
-            usage = APIUsage(
-                api_key_id=api_key_id,
-                user_id=user.id,
+
+            _record_usage(
+                db,
+                request,
+                user,
+                project_owner,
+                start,
+                end,
+                status_code,
+                "locator_api_call",
+                api_key_id=kwargs.get("api_key_id"),
                 project_id=project_id,
-                endpoint=str(request.url.path),
-                request_time=start,
-                response_time=end,
-                duration_ms=duration_ms,
-                status_code=status_code,
-                input_tokens=input_tokens,
-                output_tokens=output_tokens,
-                meta_data=metadata,
-                call_llm=call_llm,
             )
-            db.add(usage)
-
-            if status_code == 200:
-                consume_credit(db, project_owner, amount=1)
-                (
-                    db.query(Project)
-                    .filter(Project.id == project_id)
-                    .update(
-                        {Project.api_call_count: Project.api_call_count + 1},
-                        synchronize_session=False,
-                    )
-                )
-            db.commit()
-            try:
-                ga.send(
-                    user_id=user.id,
-                    events=[
-                        {
-                            "name": "locator_api_call",
-                            "params": {
-                                "url": str(request.url.path),
-                                "latency_ms": duration_ms,
-                                "status": status_code,
-                                "call_llm": call_llm,
-                            },
-                        }
-                    ],
-                    user_properties={"plan": user.plan},
-                )
-            except Exception as e:
-                logger.warning(f"GA4 send failed: {e}")
-            if status_code == 500:
-                return JSONResponse(content=response_data, status_code=500)
+            if status_code != 200:
+                return JSONResponse(content=response_data, status_code=status_code)
             return response_data
 
         return wrapper
@@ -177,73 +438,76 @@ def track_api_usage():
     return decorator
 
 
+def _check_user_credits(user: User):
+    if _available_credits(user) <= 0:
+        raise HTTPException(status_code=403, detail="Not enough credits")
+
+
 def playground_track_api_usage():
     def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                db: Session = kwargs.get("db")
+                request = kwargs.get("request")
+                user = kwargs.get("user")
+
+                _check_user_credits(user)
+
+                start = datetime.utcnow()
+                try:
+                    response_data = await func(*args, **kwargs)
+                    status_code = 200
+                except Exception as e:
+                    response_data, status_code = _failure(e)
+                end = datetime.utcnow()
+
+                await run_in_threadpool(
+                    _record_usage,
+                    db,
+                    request,
+                    user,
+                    user,
+                    start,
+                    end,
+                    status_code,
+                    "playground_locator_api_call",
+                )
+                if status_code != 200:
+                    raise HTTPException(detail=response_data, status_code=status_code)
+                return response_data
+
+            return async_wrapper
+
         @wraps(func)
         def wrapper(*args, **kwargs):
             db: Session = kwargs.get("db")
             request = kwargs.get("request")
             user = kwargs.get("user")
 
-            if (int(user.subscription_credits) + int(user.one_time_credits)) <= 0:
-                raise HTTPException(status_code=403, detail="Not enough credits")
+            _check_user_credits(user)
 
             start = datetime.utcnow()
             try:
                 response_data = func(*args, **kwargs)
                 status_code = 200
             except Exception as e:
-                response_data = {"error": str(e)}
-                status_code = 500
-
+                response_data, status_code = _failure(e)
             end = datetime.utcnow()
-            duration_ms = int((end - start).total_seconds() * 1000)
-
-            input_tokens = getattr(request.state, "input_tokens", None)
-            output_tokens = getattr(request.state, "output_tokens", None)
-            metadata = getattr(request.state, "usage_metadata", {})
-            call_llm = getattr(request.state, "call_llm", False)
-
-            usage = APIUsage(
-                api_key_id=None,
-                user_id=user.id,
-                project_id=None,
-                endpoint=str(request.url.path),
-                request_time=start,
-                response_time=end,
-                duration_ms=duration_ms,
-                status_code=status_code,
-                input_tokens=input_tokens,
-                output_tokens=output_tokens,
-                meta_data=metadata,
-                call_llm=call_llm,
-            )
-            db.add(usage)
-
-            if status_code == 200:
-                consume_credit(db, user, amount=1)
 
-            db.commit()
-            try:
-                ga.send(
-                    user_id=user.id,
-                    events=[
-                        {
-                            "name": "playground_locator_api_call",
-                            "params": {
-                                "url": str(request.url.path),
-                                "latency_ms": duration_ms,
-                                "status": status_code,
-                                "call_llm": call_llm,
-                            },
-                        }
-                    ],
-                    user_properties={"plan": user.plan},
-                )
-            except Exception as e:
-                logger.warning(f"GA4 send failed: {e}")
-            if status_code == 500:
-                raise HTTPException(detail=response_data, status_code=500)
+            _record_usage(
+                db,
+                request,
+                user,
+                user,
+                start,
+                end,
+                status_code,
+                "playground_locator_api_call",
+            )
+            if status_code != 200:
+                raise HTTPException(detail=response_data, status_code=status_code)
             return response_data
 
         return wrapper
@@ -291,6 +555,7 @@ def rate_limiter_by_user(plan_rates: dict = None):
 def handle_pending_invites(db: Session, user: User):
     invites = db.query(ProjectInvite).filter_by(email=user.email, accepted=False).all()
     logger.info(f"Found {len(invites)} invites for user {user.email}")
+    accepted = []
     for invite in invites:
         members = (
             db.query(Project)
@@ -308,24 +573,10 @@ def handle_pending_invites(db: Session, user: User):
         db.add(ProjectMembership(user_id=user.id, project_id=invite.project_id))
         invite.accepted = True
         invite.invited_user_id = user.id
+        accepted.append(invite.project_id)
     db.commit()
-
-
-async def get_current_project_id(
-    request: Request,
-    db: Session = Depends(get_db),
-) -> str:
-    project_id = request.query_params.get("project_id") or request.headers.get(
-        "X-Project-ID"
-    )
-    if not project_id:
-        raise HTTPException(status_code=400, detail="Missing project_id")
-
-    project = db.query(Project).filter(Project.id == project_id).first()
-    if not project:
-        raise HTTPException(status_code=404, detail="Project not found")
-    logger.debug(f"Get project ID: {project.id}")
-    return project_id
+    for project_id in accepted:
+        context_cache.invalidate_project(project_id)
 
 
 def get_project_owner(db: Session, project_id: UUID) -> User:
@@ -15,6 +15,8 @@ from talk2dom.api.routers import (
     admin,
 )
 from talk2dom.api.utils.sentry import init_sentry
+from talk2dom.api.utils import offload
+from talk2dom.db import cache, counters, usage_log
 
 from slowapi.errors import RateLimitExceeded
 from slowapi import _rate_limit_exceeded_handler
@@ -49,6 +51,16 @@ app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
 init_db()
 
+app.add_event_handler("startup", cache.start_invalidation_listener)
+app.add_event_handler("startup", cache.start_write_behind)
+app.add_event_handler("startup", usage_log.start)
+app.add_event_handler("startup", counters.start)
+app.add_event_handler("shutdown", cache.stop_invalidation_listener)
+app.add_event_handler("shutdown", cache.stop_write_behind)
+app.add_event_handler("shutdown", usage_log.stop)
+app.add_event_handler("shutdown", counters.stop)
+app.add_event_handler("shutdown", offload.shutdown)
+
 app.include_router(google.router, prefix="/api/v1/auth", tags=["google-auth"])
 
 app.include_router(email.router, prefix="/api/v1/auth", tags=["email-auth"])
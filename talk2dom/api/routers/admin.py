@@ -17,6 +17,7 @@ from sqlalchemy.orm import Session
 from talk2dom.api.deps import handle_pending_invites
 from talk2dom.api.limiter import limiter
 from talk2dom.api.utils import hash_helper
+from talk2dom.db import context_cache, counters
 from talk2dom.db.cache import compute_locator_id, invalidate_locator_cache
 from talk2dom.db.models import (
     APIKey,
@@ -78,6 +79,25 @@ def require_admin(request: Request, db: Session = Depends(get_db)) -> str:
     raise _login_redirect()
 
 
+def require_status_access(request: Request, db: Session = Depends(get_db)) -> str:
+    """Admin session, or ``Authorization: Bearer $ADMIN_TOKEN`` for scrapers."""
+    token = _admin_token()
+    scheme, _, credentials = request.headers.get("Authorization", "").partition(" ")
+    if (
+        token is not None
+        and scheme.lower() == "bearer"
+        and secrets.compare_digest(credentials.strip(), token)
+    ):
+        return "token"
+    if "session" in request.scope:
+        try:
+            return require_admin(request, db)
+        except HTTPException:
+            pass
+    # 监控接口给的是 JSON,不跳转登录页
+    raise HTTPException(status_code=401, detail="Admin access required")
+
+
 def _csrf_token(request: Request) -> str:
     token = request.session.get("admin_csrf")
     if not token:
@@ -798,6 +818,8 @@ async def admin_invite_member(
         invite.invited_user_id = invitee.id
     db.add(invite)
     db.commit()
+    if invitee:
+        context_cache.invalidate_project(project_id)
     logger.info(
         f"[admin:{actor}] invited {email} to project {project_id} "
         f"({'joined directly' if invitee else 'pending signup'})"
@@ -832,6 +854,7 @@ async def admin_remove_member(
     ).delete()
     db.delete(membership)
     db.commit()
+    context_cache.invalidate_project(membership.project_id)
     logger.info(
         f"[admin:{actor}] removed member {membership.user_id} "
         f"from project {membership.project_id}"
@@ -881,6 +904,7 @@ async def admin_delete_api_key(
         raise HTTPException(status_code=404, detail="API key not found")
     db.delete(key)
     db.commit()
+    context_cache.invalidate_key(key.key)
     logger.info(f"[admin:{actor}] deleted API key {key_id} of user {key.user_id}")
     return RedirectResponse(url=f"/admin/users/{back}?saved=1", status_code=303)
 
@@ -925,6 +949,9 @@ async def update_user(
     user.is_active = is_active is not None
     user.is_admin = is_admin is not None
     db.commit()
+    # 提交后再清掉 Redis 余额;管理员填写的额度覆盖尚未写回的扣减
+    counters.evict(user.id)
+    context_cache.invalidate_user(user.id)
 
     logger.info(
         f"[admin:{actor}] updated user {user.email}: ({before}) -> "
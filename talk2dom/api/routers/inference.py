@@ -1,18 +1,46 @@
-import hashlib
 import os
+from typing import Optional
 
 from fastapi import APIRouter, Depends, Request
 from urllib.parse import urlparse, urlunparse
 
-from talk2dom.core import call_selector_llm, retry
-from talk2dom.db.cache import get_cached_locator, save_locator
+from talk2dom.core import (
+    acall_element_index_llm,
+    acall_selector_batch_llm,
+    acall_selector_llm,
+    SelectorType,
+)
+from talk2dom.db import singleflight
+from talk2dom.db.cache import (
+    aget_backbone_signature,
+    aget_cached_locator,
+    aget_cached_locators,
+    aget_nearest_locators,
+    aget_negative_locator,
+    aget_similar_locator,
+    asave_locator,
+    asave_negative_locator,
+    compute_locator_id,
+)
 from talk2dom.db.session import Session, get_db
-from talk2dom.api.schemas import LocatorRequest, LocatorResponse
-from talk2dom.api.utils.validator import SelectorValidator
-from talk2dom.api.utils.html_cleaner import (
-    clean_html,
-    clean_html_keep_structure_only,
+from talk2dom.api.schemas import (
+    LocatorBatchItem,
+    LocatorBatchRequest,
+    LocatorBatchResponse,
+    LocatorRequest,
+    LocatorResponse,
 )
+from talk2dom.api.utils import (
+    cascade,
+    deadline,
+    element_index,
+    metrics,
+    offload,
+    outline,
+    pruner,
+    url_template,
+)
+from talk2dom.api.utils.document import ParsedDocument
 from loguru import logger
 from talk2dom.db.models import User
 from talk2dom.api.deps import (
@@ -32,30 +60,10 @@ MODEL_NAME = os.environ.get("TALK2DOM_MODEL_NAME")
 PROVIDER_NAME = os.environ.get("TALK2DOM_MODEL_PROVIDER_NAME")
 
 
-def _html_id(url_path: str, structure_html: str) -> str:
-    # 与 db.cache 的 html_id 计算保持一致,让 usage 记录能关联到 HTML 快照
-    src = (url_path or "").strip() or (structure_html or "")
-    return hashlib.sha256(src.encode("utf-8")).hexdigest()
-
-
-@router.post("/locator", response_model=LocatorResponse)
-@limiter.limit("60/minute")
-@retry()
-@track_api_usage()
-def locate(
-    req: LocatorRequest,
-    request: Request,
-    db: Session = Depends(get_db),
-    user: User = Depends(get_api_key_user),
-    api_key_id: str = Depends(get_api_key_id),
-    project_id: str = Depends(get_current_project_id),
-):
-    html = req.html
-    if not html:
-        raise Exception("html is empty")
+async def _clean(doc: ParsedDocument) -> tuple:
+    # 解析/清洗是 CPU 密集的,不在事件循环里做
     try:
-        cleaned_html = clean_html(html)
-        structure_html = clean_html_keep_structure_only(cleaned_html)
+        cleaned_html, structure_html = await doc.aclean()
         if cleaned_html is None:
             raise Exception(
                 "make sure the html is valid and has meaningful information"
@@ -63,85 +71,213 @@ def locate(
     except Exception as err:
         logger.error(f"Failed to clean html: {err}")
         raise
-    verifier = SelectorValidator(html)
+    return cleaned_html, structure_html
 
-    request.state.call_llm = False
-    parsed = urlparse(req.url)
+
+async def _prompt_html(
+    cleaned_html: str, instruction: str, indexed: bool = False
+) -> str:
+    """Page text for the prompt: pruned when over budget, optionally as an outline."""
+    if (
+        outline.PROMPT_FORMAT == "html"
+        and not indexed
+        and not pruner.should_prune(cleaned_html)
+    ):
+        return cleaned_html
+    prompt_html = await offload.run(
+        outline.build_prompt_html,
+        cleaned_html,
+        instruction,
+        outline.PROMPT_FORMAT,
+        indexed,
+        size=len(cleaned_html),
+    )
+    metrics.observe("prompt.kept_ratio", len(prompt_html) / max(len(cleaned_html), 1))
+    return prompt_html
+
+
+def _url_path(url: str) -> str:
+    parsed = urlparse(url)
     parsed = parsed._replace(query="")
-    url_path = urlunparse(parsed)
+    return urlunparse(parsed)
+
+
+async def _page_html_id(request, doc, url: Optional[str], url_path: str) -> tuple:
+    """Return ``(html_id, template)``; pages under one URL template share an html_id.
+
+    The shared id is only used while this page's backbone matches the one
+    stored for the template, otherwise the page keeps its own URL's id.
+    """
+    spec = getattr(request.state, "url_templates", None)
+    try:
+        rules = url_template.parse_rules(spec)
+    except ValueError as e:
+        logger.error(f"Invalid URL templates {spec!r}: {e}")
+        rules = []
+    templated = url_template.template(url, rules) if url_path else ""
+    if not templated or templated == url_template.normalize(url):
+        return await doc.ahtml_id(url_path), None
+    html_id = doc.html_id(templated)
+    stored = await aget_backbone_signature(html_id)
+    if stored is not None:
+        # 直接扫描原始 html 的标签,命中缓存时不必清洗整页
+        signature = await offload.run(
+            url_template.backbone_signature, doc.html, size=len(doc.html)
+        )
+        if stored != signature:
+            metrics.incr("url_template.mismatch")
+            return doc.html_id(url_path), None
+    metrics.incr("url_template.shared")
+    return html_id, templated
 
-    usage_meta = {
-        "url": url_path,
-        "user_instruction": req.user_instruction,
-        "html_id": _html_id(url_path, structure_html),
-    }
-    request.state.usage_metadata = usage_meta
 
-    selector_type, selector_value, action = get_cached_locator(
-        req.user_instruction, structure_html, url_path, project_id
+def _deadline_header(request) -> Optional[str]:
+    headers = getattr(request, "headers", None)
+    return headers.get(deadline.HEADER) if headers is not None else None
+
+
+def _split_action(action: Optional[str]) -> tuple:
+    return action.split(":") if action and action.find(":") >= 0 else ("", "")
+
+
+async def _cached_selector(req, doc, url_path, html_id, project_id) -> Optional[tuple]:
+    """Return ``(action_type, action_value, selector_type, selector_value)`` on a verified hit."""
+    selector_type, selector_value, action = await aget_cached_locator(
+        req.user_instruction, None, url_path, project_id, html_id=html_id
     )
-    if selector_type and selector_value:
-        if verifier.verify(selector_type, selector_value):
-            logger.info(
-                f"Location verified: type: {selector_type}, value: {selector_value}"
-            )
-            action_type, action_value = (
-                action.split(":") if action and action.find(":") >= 0 else ("", "")
-            )
-            usage_meta.update(
-                {
-                    "selector_type": selector_type,
-                    "selector_value": selector_value,
-                    "action_type": action_type,
-                    "action_value": action_value,
-                    "cache_hit": True,
-                }
-            )
-            return LocatorResponse(
-                action_type=action_type,
-                action_value=action_value,
-                selector_type=selector_type,
-                selector_value=selector_value,
-            )
-    selector = call_selector_llm(
+    if not (selector_type and selector_value):
+        return None
+    if not await doc.averify(selector_type, selector_value):
+        return None
+    logger.info(f"Location verified: type: {selector_type}, value: {selector_value}")
+    return (*_split_action(action), selector_type, selector_value)
+
+
+async def _similar_selector(req, doc, html_id, project_id) -> Optional[tuple]:
+    """A verified locator cached for a near-duplicate instruction on the same page."""
+    similar = await aget_similar_locator(req.user_instruction, html_id, project_id)
+    if similar is None:
+        return None
+    selector_type, selector_value, action, score = similar
+    if not (selector_type and selector_value):
+        return None
+    # 精确匹配已经 miss,校验不过就要清洗页面,放进同一次解析里
+    (verified,) = await doc.analyze([(selector_type, selector_value)], clean=True)
+    if not verified:
+        return None
+    logger.info(f"Similar instruction reused ({score:.2f}): {selector_value}")
+    return (*_split_action(action), selector_type, selector_value), score
+
+
+async def _nearest_selector(req, doc, html_id, project_id) -> Optional[tuple]:
+    """Try selectors cached on structurally near-identical snapshots of a URL-less page."""
+    cleaned_html, structure_html = await doc.aclean()
+    candidates = await aget_nearest_locators(
+        req.user_instruction, structure_html, html_id, project_id
+    )
+    verdicts = await doc.analyze([(c[0], c[1]) for c in candidates])
+    for (selector_type, selector_value, action, distance), verified in zip(
+        candidates, verdicts
+    ):
+        if not verified:
+            continue
+        logger.info(f"Nearest snapshot reused (distance {distance}): {selector_value}")
+        # 写到本页面的键下,下次直接精确命中
+        await asave_locator(
+            req.user_instruction,
+            structure_html,
+            selector_type,
+            selector_value,
+            action=action,
+            project_id=project_id,
+            html=cleaned_html,
+            html_id=html_id,
+        )
+        return (*_split_action(action), selector_type, selector_value), distance
+    return None
+
+
+async def _cached_not_found(locator_id, doc) -> Optional[tuple]:
+    """A recent "not found" for this instruction on this exact html."""
+    action = await aget_negative_locator(locator_id, doc.digest)
+    if action is None:
+        return None
+    return (*_split_action(action), SelectorType.NOT_FOUND.value, "")
+
+
+async def _pick_element(req, cleaned_html, prompt_html, tier, llm_metadata):
+    """Element-index mode: the model picks a numbered node, we write the selector."""
+    pick = await deadline.retry_call(
+        acall_element_index_llm,
         req.user_instruction,
-        cleaned_html,
-        MODEL_NAME,
-        PROVIDER_NAME,
+        prompt_html,
+        tier.model,
+        tier.provider,
         req.conversation_history,
-        metadata={
-            "langfuse_user_id": user.email,
-            "project_id": project_id,
-            "email": user.email,
-        },
+        metadata=llm_metadata,
     )
-    logger.info(f"Location found: {selector}")
-    request.state.call_llm = True
-    if selector is None:
-        raise Exception("LLM invoke failed")
-    action_type, action_value, selector_type, selector_value = (
-        selector.action_type,
-        selector.action_value,
-        selector.selector_type,
-        selector.selector_value,
-    )
-    request.state.input_tokens = len(req.user_instruction) + len(cleaned_html)
-    request.state.output_tokens = len(selector_type) + len(selector_value)
-    usage_meta.update(
-        {
-            "selector_type": selector_type,
-            "selector_value": selector_value,
-            "action_type": action_type,
-            "action_value": action_value,
-            "cache_hit": False,
-        }
+    logger.info(f"Element picked: {pick}")
+    if pick is None:
+        return None
+    selector_type, selector_value = await offload.run(
+        element_index.build_selector,
+        cleaned_html,
+        pick.element_index,
+        size=len(cleaned_html),
     )
+    metrics.incr(f"selector.index.{selector_type.replace(' ', '_')}")
+    return pick.action_type, pick.action_value, selector_type, selector_value
 
-    if verifier.verify(selector_type, selector_value):
+
+async def _infer_selector(
+    req, doc, url_path, html_id, project_id, llm_metadata, tiers
+) -> tuple:
+    """Ask the model cascade for a selector; returns ``(found, input_tokens, trace)``."""
+    cleaned_html, structure_html = await _clean(doc)
+    indexed = element_index.SELECTOR_MODE == "index"
+    prompt_html = await _prompt_html(cleaned_html, req.user_instruction, indexed)
+
+    async def attempt(tier):
+        if indexed:
+            return await _pick_element(
+                req, cleaned_html, prompt_html, tier, llm_metadata
+            )
+        selector = await deadline.retry_call(
+            acall_selector_llm,
+            req.user_instruction,
+            prompt_html,
+            tier.model,
+            tier.provider,
+            req.conversation_history,
+            metadata=llm_metadata,
+        )
+        logger.info(f"Location found: {selector}")
+        if selector is None:
+            return None
+        return (
+            selector.action_type,
+            selector.action_value,
+            selector.selector_type,
+            selector.selector_value,
+        )
+
+    async def accept(found):
+        # 校验仍在完整页面上进行;未通过(或 not found)时升级到下一个模型
+        return await doc.averify(found[2], found[3])
+
+    found, trace = await cascade.run(
+        tiers, attempt, accept, hedge_with=cascade.hedge_tier(tiers[0])
+    )
+    if found is None:
+        if deadline.expired():
+            raise deadline.DeadlineExceeded()
+        raise Exception("LLM invoke failed")
+    action_type, action_value, selector_type, selector_value = found
+    if cascade.accepted(trace):
         logger.info(
             f"Location verified: type: {selector_type}, value: {selector_value}"
         )
-        save_locator(
+        await asave_locator(
             req.user_instruction,
             structure_html,
             selector_type,
@@ -150,13 +286,122 @@ def locate(
             url=url_path,
             project_id=project_id,
             html=cleaned_html,
+            html_id=html_id,
+        )
+    # 每个尝试过的模型都收到了同一份 prompt
+    input_tokens = (len(req.user_instruction) + len(prompt_html)) * len(trace)
+    return found, input_tokens, trace
+
+
+async def _locate(
+    req: LocatorRequest,
+    request: Request,
+    project_id: Optional[str],
+    llm_metadata: dict,
+) -> LocatorResponse:
+    html = req.html
+    if not html:
+        raise Exception("html is empty")
+    doc = ParsedDocument(html)
+    deadline.start(_deadline_header(request))
+
+    request.state.call_llm = False
+    url_path = _url_path(req.url)
+
+    # 有 url 时缓存键只由 url(或其模板)决定,命中缓存只需解析 html 做校验,不必清洗
+    html_id, templated = await _page_html_id(request, doc, req.url, url_path)
+    usage_meta = {
+        "url": url_path,
+        "user_instruction": req.user_instruction,
+        "html_id": html_id,
+    }
+    if templated:
+        usage_meta["url_template"] = templated
+    request.state.usage_metadata = usage_meta
+
+    locator_id = compute_locator_id(req.user_instruction, html_id, url_path, project_id)
+    found = await _cached_selector(req, doc, url_path, html_id, project_id)
+    if found is not None:
+        usage_meta["cache_match"] = "exact"
+        metrics.incr("locator_cache.exact_hit")
+    else:
+        # 换个说法的同一条指令("click login" / "click the Login button")复用已有结果
+        similar = await _similar_selector(req, doc, html_id, project_id)
+        if similar is not None:
+            found, score = similar
+            usage_meta["cache_match"] = "fuzzy"
+            usage_meta["similarity"] = round(score, 3)
+            metrics.incr("locator_cache.fuzzy_hit")
+    if found is None and not url_path:
+        # 没有 url 时键是骨架的精确哈希,多一个 <div> 就会 miss,找结构最接近的快照
+        nearest = await _nearest_selector(req, doc, html_id, project_id)
+        if nearest is not None:
+            found, distance = nearest
+            usage_meta["cache_match"] = "nearest"
+            usage_meta["hamming_distance"] = distance
+            metrics.incr("locator_cache.nearest_hit")
+    if found is None:
+        # 元素还没渲染出来时客户端会反复轮询,短时间内不再为同一页面调用 LLM
+        found = await _cached_not_found(locator_id, doc)
+        if found is not None:
+            usage_meta["negative_cache_hit"] = True
+    cache_hit = found is not None
+    if not cache_hit:
+        tiers = cascade.resolve_tiers(
+            getattr(request.state, "model_cascade", None), MODEL_NAME, PROVIDER_NAME
         )
-        return LocatorResponse(
-            action_type=action_type,
-            action_value=action_value,
-            selector_type=selector_type,
-            selector_value=selector_value,
+
+        async def produce():
+            found, input_tokens, trace = await _infer_selector(
+                req, doc, url_path, html_id, project_id, llm_metadata, tiers
+            )
+            # 带上页面摘要,follower 据此判断能否直接复用
+            return found, input_tokens, trace, doc.digest
+
+        async def poll():
+            hit = await _cached_selector(req, doc, url_path, html_id, project_id)
+            if hit is None:
+                hit = await _cached_not_found(locator_id, doc)
+            return None if hit is None else (hit, None, None, doc.digest)
+
+        # 同一 locator 的并发 miss 只调用一次 LLM,其余请求等待 leader 的结果
+        (found, input_tokens, trace, digest), role = await singleflight.run(
+            locator_id, produce, poll
         )
+        if role == "local" and digest != doc.digest:
+            # 同一 locator 只说明 html_id 相同,leader 的页面可能和本请求不同:
+            # selector 要在本页面上校验,"not found" 只对 leader 的页面成立
+            if found[2] == SelectorType.NOT_FOUND or not await doc.averify(
+                found[2], found[3]
+            ):
+                metrics.incr("singleflight.follower_rejected")
+                (found, input_tokens, trace, _), role = await produce(), "leader"
+        if role == "leader":
+            request.state.call_llm = True
+            request.state.input_tokens = input_tokens
+            usage_meta["model"] = cascade.answered_by(trace)
+            if len(tiers) > 1 or "hedged" in trace[0]:
+                usage_meta["cascade"] = trace
+            if found[2] == SelectorType.NOT_FOUND:
+                await asave_negative_locator(
+                    locator_id, doc.digest, ":".join(found[:2])
+                )
+        else:
+            usage_meta["coalesced"] = role
+        cache_hit = role == "remote"
+
+    action_type, action_value, selector_type, selector_value = found
+    if not cache_hit:
+        request.state.output_tokens = len(selector_type) + len(selector_value)
+    usage_meta.update(
+        {
+            "selector_type": selector_type,
+            "selector_value": selector_value,
+            "action_type": action_type,
+            "action_value": action_value,
+            "cache_hit": cache_hit,
+        }
+    )
     return LocatorResponse(
         action_type=action_type,
         action_value=action_value,
@@ -165,123 +410,193 @@ def locate(
     )
 
 
+@router.post("/locator", response_model=LocatorResponse)
+@limiter.limit("60/minute")
+@track_api_usage()
+async def locate(
+    req: LocatorRequest,
+    request: Request,
+    db: Session = Depends(get_db),
+    user: User = Depends(get_api_key_user),
+    api_key_id: str = Depends(get_api_key_id),
+    project_id: str = Depends(get_current_project_id),
+):
+    return await _locate(
+        req,
+        request,
+        project_id,
+        llm_metadata={
+            "langfuse_user_id": user.email,
+            "project_id": project_id,
+            "email": user.email,
+        },
+    )
+
+
 @router.post("/locator-playground", response_model=LocatorResponse)
 @limiter.limit("60/minute")
 @playground_track_api_usage()
-def locate_playground(
+async def locate_playground(
     req: LocatorRequest,
     request: Request,
     db: Session = Depends(get_db),
     user=Depends(get_current_user),
+):
+    return await _locate(
+        req,
+        request,
+        None,
+        llm_metadata={
+            "langfuse_user_id": user.email,
+            "email": user.email,
+        },
+    )
+
+
+@router.post("/locator/batch", response_model=LocatorBatchResponse)
+@limiter.limit("60/minute")
+@track_api_usage()
+async def locate_batch(
+    req: LocatorBatchRequest,
+    request: Request,
+    db: Session = Depends(get_db),
+    user: User = Depends(get_api_key_user),
+    api_key_id: str = Depends(get_api_key_id),
+    project_id: str = Depends(get_current_project_id),
 ):
     html = req.html
     if not html:
         raise Exception("html is empty")
-    try:
-        cleaned_html = clean_html(html)
-        structure_html = clean_html_keep_structure_only(cleaned_html)
-        if cleaned_html is None:
-            raise Exception(
-                "make sure the html is valid and has meaningful information"
-            )
-        verifier = SelectorValidator(html)
-    except Exception as err:
-        logger.error(f"Failed to clean html: {err}")
-        raise
-
-    parsed = urlparse(req.url)
-    parsed = parsed._replace(query="")
-    url_path = urlunparse(parsed)
+    if not req.user_instructions:
+        raise Exception("user_instructions is empty")
+    doc = ParsedDocument(html)
+    deadline.start(_deadline_header(request))
 
     request.state.call_llm = False
-    usage_meta = {
-        "url": url_path,
-        "user_instruction": req.user_instruction,
-        "html_id": _html_id(url_path, structure_html),
-    }
-    request.state.usage_metadata = usage_meta
+    url_path = _url_path(req.url)
+    html_id, _ = await _page_html_id(request, doc, req.url, url_path)
+    instructions = req.user_instructions
+
+    results = [None] * len(instructions)
+    cached = await aget_cached_locators(instructions, url_path, project_id, html_id)
+    hits = [i for i, (type_, value, _) in enumerate(cached) if type_ and value]
+    # 所有缓存的 selector 一次解析校验完;有条目没缓存时顺便清洗
+    verdicts = await doc.analyze(
+        [tuple(cached[i][:2]) for i in hits], clean=len(hits) < len(instructions)
+    )
+    for i, verified in zip(hits, verdicts):
+        if verified:
+            selector_type, selector_value, action = cached[i]
+            results[i] = (*_split_action(action), selector_type, selector_value)
 
-    selector_type, selector_value, action = get_cached_locator(
-        req.user_instruction, structure_html, url_path
+    misses = [i for i, found in enumerate(results) if found is None]
+    tiers = cascade.resolve_tiers(
+        getattr(request.state, "model_cascade", None), MODEL_NAME, PROVIDER_NAME
     )
-    if selector_type and selector_value:
-        if verifier.verify(selector_type, selector_value):
-            logger.info(
-                f"Location verified: type: {selector_type}, value: {selector_value}"
+    input_tokens = 0
+    if misses:
+        cleaned_html, structure_html = await _clean(doc)
+        prompt_html = await _prompt_html(
+            cleaned_html, " ".join(instructions[i] for i in misses)
+        )
+        pending = list(misses)
+
+        async def attempt(tier):
+            return await deadline.retry_call(
+                acall_selector_batch_llm,
+                [instructions[i] for i in pending],
+                prompt_html,
+                tier.model,
+                tier.provider,
+                req.conversation_history,
+                metadata={
+                    "langfuse_user_id": user.email,
+                    "project_id": project_id,
+                    "email": user.email,
+                },
             )
-            action_type, action_value = (
-                action.split(":") if action and action.find(":") >= 0 else ("", "")
+
+        async def accept(selectors):
+            # 只有未通过校验的条目升级到下一个模型
+            logger.info(f"Locations found: {selectors}")
+            answered = list(zip(list(pending), selectors))
+            verdicts = await doc.analyze(
+                [(s.selector_type, s.selector_value) for _, s in answered]
             )
-            usage_meta.update(
-                {
-                    "selector_type": selector_type,
-                    "selector_value": selector_value,
-                    "action_type": action_type,
-                    "action_value": action_value,
-                    "cache_hit": True,
-                }
+            for (i, selector), verified in zip(answered, verdicts):
+                results[i] = (
+                    selector.action_type,
+                    selector.action_value,
+                    selector.selector_type,
+                    selector.selector_value,
+                )
+                if verified:
+                    pending.remove(i)
+            return not pending
+
+        _, trace = await cascade.run(tiers, attempt, accept)
+        request.state.call_llm = True
+        if any(results[i] is None for i in misses):
+            if deadline.expired():
+                raise deadline.DeadlineExceeded()
+            raise Exception("LLM invoke failed")
+        # 一次调用共享同一份 html,按条目均摊
+        input_tokens = len(prompt_html) * len(trace) // len(misses)
+        for i in misses:
+            if i in pending:
+                continue
+            action_type, action_value, selector_type, selector_value = results[i]
+            await asave_locator(
+                instructions[i],
+                structure_html,
+                selector_type,
+                selector_value,
+                action=":".join((action_type, action_value)),
+                url=url_path,
+                project_id=project_id,
+                html=cleaned_html,
+                html_id=html_id,
             )
-            return LocatorResponse(
+
+    items = []
+    usage_items = []
+    for i, instruction in enumerate(instructions):
+        action_type, action_value, selector_type, selector_value = results[i]
+        cache_hit = i not in misses
+        items.append(
+            LocatorBatchItem(
+                user_instruction=instruction,
                 action_type=action_type,
                 action_value=action_value,
                 selector_type=selector_type,
                 selector_value=selector_value,
+                cache_hit=cache_hit,
             )
-    selector = call_selector_llm(
-        req.user_instruction,
-        cleaned_html,
-        MODEL_NAME,
-        PROVIDER_NAME,
-        req.conversation_history,
-        metadata={
-            "langfuse_user_id": user.email,
-            "email": user.email,
-        },
-    )
-    logger.info(f"Location found: {selector}")
-    request.state.call_llm = True
-    if selector is None:
-        raise Exception("LLM invoke failed")
-    action_type, action_value, selector_type, selector_value = (
-        selector.action_type,
-        selector.action_value,
-        selector.selector_type,
-        selector.selector_value,
-    )
-    request.state.input_tokens = len(req.user_instruction) + len(cleaned_html)
-    request.state.output_tokens = len(selector_type) + len(selector_value)
-    usage_meta.update(
-        {
-            "selector_type": selector_type,
-            "selector_value": selector_value,
-            "action_type": action_type,
-            "action_value": action_value,
-            "cache_hit": False,
-        }
-    )
-
-    if verifier.verify(selector_type, selector_value):
-        logger.info(
-            f"Location verified: type: {selector_type}, value: {selector_value}"
         )
-        save_locator(
-            req.user_instruction,
-            structure_html,
-            selector_type,
-            selector_value,
-            action=":".join((action_type, action_value)),
-            url=url_path,
-            html=cleaned_html,
-        )
-        return LocatorResponse(
-            action_type=action_type,
-            action_value=action_value,
-            selector_type=selector_type,
-            selector_value=selector_value,
+        usage_items.append(
+            {
+                "call_llm": not cache_hit,
+                "input_tokens": (
+                    None if cache_hit else len(instruction) + input_tokens
+                ),
+                "output_tokens": (
+                    None if cache_hit else len(selector_type) + len(selector_value)
+                ),
+                "metadata": {
+                    "url": url_path,
+                    "user_instruction": instruction,
+                    "html_id": html_id,
+                    "selector_type": selector_type,
+                    "selector_value": selector_value,
+                    "action_type": action_type,
+                    "action_value": action_value,
+                    "cache_hit": cache_hit,
+                    "batch_size": len(instructions),
+                },
+            }
         )
-    return LocatorResponse(
-        action_type=action_type,
-        action_value=action_value,
-        selector_type=selector_type,
-        selector_value=selector_value,
-    )
+        if not cache_hit and len(tiers) > 1:
+            usage_items[-1]["metadata"]["cascade"] = trace
+    # track_api_usage 按条目记录用量和扣费
+    request.state.usage_items = usage_items
+    return LocatorBatchResponse(results=items)
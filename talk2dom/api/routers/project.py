@@ -5,6 +5,7 @@ from sqlalchemy import func, cast, Date
 from datetime import datetime, timedelta
 
 from uuid import UUID
+from talk2dom.db import context_cache
 from talk2dom.db.session import get_db
 from talk2dom.db.models import User
 from talk2dom.db.models import (
@@ -15,6 +16,7 @@ from talk2dom.db.models import (
     UILocatorCache,
 )
 from talk2dom.api.deps import get_current_user
+from talk2dom.api.utils import cascade, url_template
 from talk2dom.api.schemas import (
     ProjectCreate,
     ProjectResponse,
@@ -236,7 +238,23 @@ def update_project(
         raise HTTPException(status_code=403, detail="Only owner can update the project")
 
     project.name = project_update.name
+    if project_update.model_cascade is not None:
+        spec = project_update.model_cascade.strip()
+        if spec:
+            try:
+                cascade.parse_cascade(spec)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+        project.model_cascade = spec or None
+    if project_update.url_templates is not None:
+        spec = project_update.url_templates.strip()
+        try:
+            url_template.parse_rules(spec)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        project.url_templates = spec or None
     db.commit()
+    context_cache.invalidate_project(project.id)
     db.refresh(project)
 
     return project
@@ -265,6 +283,7 @@ def delete_project(
 
     db.delete(project)
     db.commit()
+    context_cache.invalidate_project(project_id)
     return
 
 
@@ -308,6 +327,7 @@ def remove_member(
     ).delete()
 
     db.commit()
+    context_cache.invalidate_project(project_id)
     return
 
 
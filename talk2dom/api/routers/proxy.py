@@ -5,6 +5,7 @@ from talk2dom.db.models import User
 from talk2dom.api.deps import (
     get_current_user,
 )
+from talk2dom.api.utils import offload
 
 import httpx
 from bs4 import BeautifulSoup
@@ -255,7 +256,10 @@ async def proxy(
         )
 
         if rewrite:
-            html = _rewrite_links(html, base_url=url, proxy_prefix=proxy_prefix_abs)
+            # 大页面的 BeautifulSoup 改写交给进程池,不占住 GIL
+            html = await offload.run(
+                _rewrite_links, html, url, proxy_prefix_abs, size=len(html)
+            )
 
         return Response(
             content=html, headers=resp_headers, media_type="text/html; charset=utf-8"
@@ -1,4 +1,8 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends
+
+from talk2dom.api.routers.admin import require_status_access
+from talk2dom.api.utils import breaker, metrics
+from talk2dom.db import cache, local_cache
 
 router = APIRouter()
 
@@ -6,3 +10,33 @@ router = APIRouter()
 @router.get("/healthz")
 async def healthz():
     return {"status": "ok"}
+
+
+@router.get("/metrics", dependencies=[Depends(require_status_access)])
+async def get_metrics():
+    return metrics.snapshot()
+
+
+@router.get("/breakers", dependencies=[Depends(require_status_access)])
+async def get_breakers():
+    """Circuit breaker state per LLM provider, and the configured fallback."""
+    return {"fallback": breaker.FALLBACK_MODEL or None, "breakers": breaker.snapshot()}
+
+
+@router.get("/cache", dependencies=[Depends(require_status_access)])
+async def get_cache():
+    """Locator lookups answered by each tier: in-process L1, Redis (L2) and the DB."""
+    counters = metrics.snapshot()["counters"]
+    tiers = ("l1_hit", "l2_hit", "db_hit", "miss")
+    counts = {tier: counters.get(f"locator_cache.{tier}", 0) for tier in tiers}
+    total = sum(counts.values())
+    return {
+        "lookups": total,
+        **counts,
+        "ratios": {
+            tier: round(count / total, 4) if total else 0.0
+            for tier, count in counts.items()
+        },
+        "l1": local_cache.locators.stats(),
+        "redis_pool": cache.pool_stats(),
+    }
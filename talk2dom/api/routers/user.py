@@ -3,6 +3,7 @@ from fastapi.responses import RedirectResponse
 from fastapi.templating import Jinja2Templates
 
 from sqlalchemy.orm import Session
+from talk2dom.db import context_cache, counters
 from talk2dom.db.models import User, APIKey
 from talk2dom.db.session import get_db
 from talk2dom.api.deps import get_current_user
@@ -22,14 +23,15 @@ UI_DOMAIN = os.getenv("UI_DOMAIN", "http://localhost:3000")
 
 @router.get("/me")
 async def me(user: User = Depends(get_current_user)):
+    subscription_credits, one_time_credits = counters.balances(user)
     return {
         "id": str(user.id),
         "email": user.email,
         "name": user.name,
         "provider": user.provider,
         "plan": user.plan,
-        "one_time_credits": user.one_time_credits,
-        "subscription_credits": user.subscription_credits,
+        "one_time_credits": one_time_credits,
+        "subscription_credits": subscription_credits,
         "subscription_status": user.subscription_status,
         "subscription_end_date": user.subscription_end_date,
         "is_active": user.is_active,
@@ -108,6 +110,7 @@ def delete_api_key(
         raise HTTPException(status_code=404, detail="API key not found")
     db.delete(key)
     db.commit()
+    context_cache.invalidate_key(key.key)
     return {"detail": "API key deleted"}
 
 
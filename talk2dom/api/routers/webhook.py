@@ -2,6 +2,7 @@ import os
 import stripe
 from fastapi import APIRouter, Request, Header, HTTPException
 from loguru import logger
+from talk2dom.db import context_cache, counters
 from talk2dom.db.models import User
 from talk2dom.db.session import get_db, Session
 from datetime import datetime
@@ -14,6 +15,18 @@ STRIPE_WEBHOOK_SECRET = os.environ.get("STRIPE_WEBHOOK_SECRET")
 plan_credits_map = {"free": 0, "developer": 1000, "pro": 5000}
 
 
+def _reset_subscription_credits(db: Session, user: User, credits: int) -> None:
+    user.subscription_credits = credits
+    db.commit()
+    # 提交后再清掉 Redis 里的余额,之后的请求从新的数据库行加载;
+    # 未写回的订阅额度扣减随重置作废,一次性额度的保留
+    _, pending_one_time = counters.evict(user.id)
+    if pending_one_time:
+        db.refresh(user)
+        user.one_time_credits = max(user.one_time_credits + pending_one_time, 0)
+        db.commit()
+
+
 @router.post("/stripe")
 async def stripe_webhook(request: Request, stripe_signature: str = Header(...)):
     payload = await request.body()
@@ -46,9 +59,11 @@ async def stripe_webhook(request: Request, stripe_signature: str = Header(...)):
         if not user:
             logger.warning(f"No user found for email {email}")
             return
-        if credit:
+        if credit and not counters.top_up(user.id, int(credit)):
             user.one_time_credits += int(credit)
             db.commit()
+            # 余额直接写库时,请求上下文缓存里的旧余额要作废
+            context_cache.invalidate_user(user.id)
 
     elif event["type"] == "invoice.payment_succeeded":
         logger.info("💰 Invoice payment succeeded.")
@@ -67,13 +82,13 @@ async def stripe_webhook(request: Request, stripe_signature: str = Header(...)):
             user.plan = plan
             user.stripe_customer_id = customer_id
             user.stripe_subscription_id = subscription_id
-            user.subscription_credits = credits_remaining  # Reset credits
             user.subscription_end_date = datetime.utcfromtimestamp(
                 subscription["items"]["data"][0]["current_period_end"]
             )
             user.subscription_status = invoice["status"]
             logger.info(f"User {user.email} upgraded to {plan}.")
-            db.commit()
+            _reset_subscription_credits(db, user, credits_remaining)
+            context_cache.invalidate_user(user.id)
         else:
             logger.warning(f"No user found with subscription {subscription_id}")
 
@@ -94,13 +109,15 @@ async def stripe_webhook(request: Request, stripe_signature: str = Header(...)):
             credits_remaining = plan_credits_map.get(plan, 0)
 
             user.plan = plan
-            if not subscription["cancel_at_period_end"]:
-                user.subscription_credits = credits_remaining
             user.subscription_end_date = datetime.utcfromtimestamp(
                 subscription["items"]["data"][0]["current_period_end"]
             )
             user.subscription_status = invoice["status"]
-            db.commit()
+            if subscription["cancel_at_period_end"]:
+                db.commit()
+            else:
+                _reset_subscription_credits(db, user, credits_remaining)
+            context_cache.invalidate_user(user.id)
             logger.info(f"Updated user {user.email} to plan {plan}.")
 
     elif event["type"] == "customer.subscription.deleted":
@@ -119,6 +136,7 @@ async def stripe_webhook(request: Request, stripe_signature: str = Header(...)):
             user.subscription_end_date = None
             user.subscription_status = subscription["status"]
             db.commit()
+            context_cache.invalidate_user(user.id)
             logger.info(f"User {user.email} downgraded to Free.")
 
     elif event["type"] == "invoice.payment_failed":
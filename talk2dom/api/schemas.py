@@ -1,8 +1,12 @@
+import os
 from enum import Enum
-from pydantic import BaseModel, UUID4, EmailStr
+from pydantic import BaseModel, UUID4, EmailStr, Field
 from typing import Optional, List
 from datetime import datetime
 
+# 一次批量请求最多的指令数,全部进同一个 prompt
+BATCH_MAX_INSTRUCTIONS = int(os.getenv("T2D_BATCH_MAX_INSTRUCTIONS", "50"))
+
 
 class ViewMode(str, Enum):
     mobile = "mobile"
@@ -27,6 +31,29 @@ class LocatorResponse(BaseModel):
     page_html: Optional[str] = None
 
 
+class LocatorBatchRequest(BaseModel):
+    url: str
+    html: Optional[str] = None
+    user_instructions: List[str] = Field(
+        min_length=1, max_length=BATCH_MAX_INSTRUCTIONS
+    )
+    conversation_history: Optional[List[List[str]]] = None
+    view: Optional[ViewMode] = ViewMode.desktop
+
+
+class LocatorBatchItem(BaseModel):
+    user_instruction: str
+    action_type: Optional[str] = None
+    action_value: Optional[str] = None
+    selector_type: str
+    selector_value: str
+    cache_hit: bool = False
+
+
+class LocatorBatchResponse(BaseModel):
+    results: List[LocatorBatchItem]
+
+
 class ProjectCreate(BaseModel):
     name: str
     description: Optional[str] = None
@@ -42,6 +69,8 @@ class ProjectResponse(BaseModel):
     member_count: Optional[int] = None
     api_calls: Optional[int] = None
     is_active: Optional[bool] = None
+    model_cascade: Optional[str] = None
+    url_templates: Optional[str] = None
 
     class Config:
         orm_mode = True
@@ -84,6 +113,9 @@ class LoginRequest(BaseModel):
 
 class ProjectUpdateRequest(BaseModel):
     name: str
+    # None 表示不修改,空字符串表示恢复全局配置
+    model_cascade: Optional[str] = None
+    url_templates: Optional[str] = None
 
 
 class ForgotPasswordRequest(BaseModel):
@@ -0,0 +1,137 @@
+import os
+import threading
+import time
+from collections import deque
+
+from loguru import logger
+
+from talk2dom.api.utils import metrics
+
+# 滚动窗口内调用数达到 MIN_CALLS 后,错误率或慢调用率超过阈值即熔断
+WINDOW_SECONDS = float(os.getenv("T2D_BREAKER_WINDOW_S", "60"))
+MIN_CALLS = int(os.getenv("T2D_BREAKER_MIN_CALLS", "10"))
+ERROR_RATE = float(os.getenv("T2D_BREAKER_ERROR_RATE", "0.5"))
+SLOW_CALL_MS = int(os.getenv("T2D_BREAKER_SLOW_MS", "15000"))
+SLOW_RATE = float(os.getenv("T2D_BREAKER_SLOW_RATE", "0.8"))
+# 熔断后多久放行一个半开探测请求
+OPEN_SECONDS = float(os.getenv("T2D_BREAKER_OPEN_S", "30"))
+# 熔断时替代的 provider:model
+FALLBACK_MODEL = os.getenv("T2D_FALLBACK_MODEL", "").strip()
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class CircuitBreaker:
+    """Rolling error-rate / slow-call breaker for one LLM provider."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.reason = ""
+        self._calls = deque()  # (timestamp, ok, latency_ms)
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def _trim(self, now: float) -> None:
+        while self._calls and now - self._calls[0][0] > WINDOW_SECONDS:
+            self._calls.popleft()
+
+    def _stats(self) -> dict:
+        total = len(self._calls)
+        errors = sum(1 for _, ok, _ in self._calls if not ok)
+        slow = sum(1 for _, ok, ms in self._calls if ok and ms >= SLOW_CALL_MS)
+        return {
+            "calls": total,
+            "error_rate": round(errors / total, 3) if total else 0.0,
+            "slow_rate": round(slow / total, 3) if total else 0.0,
+        }
+
+    def _open(self, now: float, reason: str) -> None:
+        self.state = OPEN
+        self.opened_at = now
+        self.reason = reason
+        self._probing = False
+        metrics.incr(f"breaker.{self.name}.opened")
+        logger.warning(f"Circuit breaker for {self.name} opened: {reason}")
+
+    def available(self) -> bool:
+        """Whether a call could go through now; does not take the half-open probe."""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN:
+                return time.monotonic() - self.opened_at >= OPEN_SECONDS
+            return not self._probing
+
+    def allow(self) -> bool:
+        """Admit a call; once the open period is over only one probe at a time."""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            now = time.monotonic()
+            if self.state == OPEN and now - self.opened_at >= OPEN_SECONDS:
+                self.state = HALF_OPEN
+                self._probing = False
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            metrics.incr(f"breaker.{self.name}.rejected")
+            return False
+
+    def abandon(self) -> None:
+        """A call admitted by ``allow`` was cancelled before it finished."""
+        with self._lock:
+            self._probing = False
+
+    def record(self, ok: bool, latency_ms: float) -> None:
+        with self._lock:
+            now = time.monotonic()
+            if self.state == HALF_OPEN:
+                if ok and latency_ms < SLOW_CALL_MS:
+                    logger.info(f"Circuit breaker for {self.name} closed")
+                    self.state = CLOSED
+                    self.reason = ""
+                    self._probing = False
+                    self._calls.clear()
+                else:
+                    self._open(now, "half-open probe failed")
+                return
+            self._calls.append((now, ok, latency_ms))
+            self._trim(now)
+            if self.state != CLOSED or len(self._calls) < MIN_CALLS:
+                return
+            stats = self._stats()
+            if stats["error_rate"] >= ERROR_RATE:
+                self._open(now, f"error rate {stats['error_rate']:.0%}")
+            elif stats["slow_rate"] >= SLOW_RATE:
+                self._open(now, f"slow call rate {stats['slow_rate']:.0%}")
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            self._trim(time.monotonic())
+            return {"state": self.state, "reason": self.reason, **self._stats()}
+
+
+_breakers: dict = {}
+_breakers_lock = threading.Lock()
+
+
+def get(name) -> CircuitBreaker:
+    name = name or "default"
+    breaker = _breakers.get(name)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.setdefault(name, CircuitBreaker(name))
+    return breaker
+
+
+def snapshot() -> dict:
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return {breaker.name: breaker.snapshot() for breaker in breakers}
+
+
+def reset() -> None:
+    with _breakers_lock:
+        _breakers.clear()
@@ -0,0 +1,218 @@
+import asyncio
+import os
+import time
+from typing import List, NamedTuple, Optional
+
+from loguru import logger
+
+from talk2dom.api.utils import breaker, deadline, hedge, metrics
+
+# 逗号分隔的 provider:model[@超时秒数],按顺序从便宜的快模型升级到强模型
+MODEL_CASCADE = os.getenv("T2D_MODEL_CASCADE", "").strip()
+
+
+class ModelTier(NamedTuple):
+    provider: Optional[str]
+    model: Optional[str]
+    timeout: Optional[float] = None
+
+    @property
+    def label(self) -> str:
+        return f"{self.provider}:{self.model}"
+
+
+def parse_cascade(spec: str) -> List[ModelTier]:
+    """Parse ``"openai:gpt-4o-mini@8, openai:gpt-4o@30"`` into tiers."""
+    tiers = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        timeout = None
+        if "@" in part:
+            part, seconds = part.rsplit("@", 1)
+            timeout = float(seconds)
+            if timeout <= 0:
+                raise ValueError(f"Tier timeout must be positive: {seconds}")
+        provider, sep, model = part.partition(":")
+        if not sep or not provider.strip() or not model.strip():
+            raise ValueError(f"Expected provider:model, got {part!r}")
+        tiers.append(ModelTier(provider.strip(), model.strip(), timeout))
+    if not tiers:
+        raise ValueError("Empty model cascade")
+    return tiers
+
+
+def resolve_tiers(override: Optional[str], model, provider) -> List[ModelTier]:
+    """Project override, else ``T2D_MODEL_CASCADE``, else the single global model."""
+    for spec in (override, MODEL_CASCADE):
+        if not spec:
+            continue
+        try:
+            return parse_cascade(spec)
+        except ValueError as e:
+            logger.error(f"Invalid model cascade {spec!r}: {e}")
+    return [ModelTier(provider, model)]
+
+
+def hedge_tier(primary: ModelTier) -> Optional[ModelTier]:
+    """The ``T2D_HEDGE_MODEL`` tier for ``primary``, None when hedging is off."""
+    if not hedge.HEDGE_MODEL:
+        return None
+    try:
+        secondary = parse_cascade(hedge.HEDGE_MODEL)[0]
+    except ValueError as e:
+        logger.error(f"Invalid T2D_HEDGE_MODEL {hedge.HEDGE_MODEL!r}: {e}")
+        return None
+    if (secondary.provider, secondary.model) == (primary.provider, primary.model):
+        return None
+    if not breaker.get(secondary.provider).available():
+        return None
+    return secondary
+
+
+def _route(tier: ModelTier) -> tuple:
+    """Return ``(tier, step)``: ``tier``, the fallback if its breaker is open, or None."""
+    if breaker.get(tier.provider).allow():
+        return tier, {}
+    step = {"breaker_open": tier.label}
+    if not breaker.FALLBACK_MODEL:
+        return None, step
+    try:
+        fallback = parse_cascade(breaker.FALLBACK_MODEL)[0]
+    except ValueError as e:
+        logger.error(f"Invalid T2D_FALLBACK_MODEL {breaker.FALLBACK_MODEL!r}: {e}")
+        return None, step
+    if fallback.provider == tier.provider or not breaker.get(fallback.provider).allow():
+        return None, step
+    metrics.incr("breaker.fallbacks")
+    return fallback._replace(timeout=tier.timeout), step
+
+
+def _admit(tier: ModelTier) -> bool:
+    return breaker.get(tier.provider).allow()
+
+
+def _tracked(attempt):
+    """Feed every provider call's outcome and latency to its circuit breaker."""
+
+    async def call(tier):
+        provider_breaker = breaker.get(tier.provider)
+        start = time.perf_counter()
+        try:
+            result = await attempt(tier)
+        except asyncio.CancelledError:
+            provider_breaker.abandon()
+            raise
+        except Exception:
+            provider_breaker.record(False, (time.perf_counter() - start) * 1000)
+            raise
+        provider_breaker.record(
+            result is not None, (time.perf_counter() - start) * 1000
+        )
+        return result
+
+    return call
+
+
+async def _try_tier(tier, attempt, accept, secondary) -> tuple:
+    """Return ``(candidate, outcome, step)`` for one tier, hedged when ``secondary`` is set."""
+    if secondary is not None:
+        # 对冲调用和主调用一样先经过熔断器的 allow(),结果由 _tracked 记录
+        candidate, ok, info = await hedge.race(
+            tier, secondary, attempt, accept, admit=_admit
+        )
+        step = {"hedged": info["hedged"]}
+        if info["hedged"] and info["winner"]:
+            step["winner"] = info["winner"]
+            if info["winner"] == "hedge":
+                step["model"] = secondary.label
+        if candidate is None:
+            return None, "error", step
+        return candidate, "accepted" if ok else "rejected", step
+    candidate = await attempt(tier)
+    if candidate is None:
+        return None, "error", {}
+    return candidate, "accepted" if await accept(candidate) else "rejected", {}
+
+
+async def _run_tier(tier, attempt, accept, secondary) -> tuple:
+    timeout = deadline.bound(tier.timeout)
+    try:
+        return await asyncio.wait_for(
+            _try_tier(tier, attempt, accept, secondary), timeout
+        )
+    except asyncio.TimeoutError:
+        if timeout != tier.timeout:
+            return None, "deadline", {}
+        # 超时取消的调用没有记录结果,这里按失败计入熔断器
+        breaker.get(tier.provider).record(False, tier.timeout * 1000)
+        return None, "timeout", {}
+    except Exception as e:
+        logger.warning(f"Model tier {tier.label} failed: {e}")
+        return None, "error", {}
+
+
+async def run(
+    tiers: List[ModelTier], attempt, accept, hedge_with: Optional[ModelTier] = None
+) -> tuple:
+    """Call ``attempt(tier)`` tier by tier until ``accept(result)`` holds.
+
+    A tier that times out, fails or is rejected escalates to the next one; a
+    tier whose provider breaker is open is replaced by ``T2D_FALLBACK_MODEL``
+    or skipped. With ``hedge_with`` the first tier is raced against that
+    model once it runs slower than usual. Nothing runs past the request
+    deadline. Returns ``(result, trace)``: the accepted result, or the last
+    one any tier produced, and one ``{tier, model, latency_ms, outcome}``
+    entry per tier tried.
+    """
+    result = None
+    trace = []
+    attempt = _tracked(attempt)
+    for i, requested in enumerate(tiers):
+        if deadline.expired():
+            metrics.incr("deadline.exceeded")
+            break
+        start = time.perf_counter()
+        tier, step = _route(requested)
+        if tier is None:
+            tier, candidate, outcome = requested, None, "skipped"
+        else:
+            secondary = hedge_with if i == 0 else None
+            candidate, outcome, extra = await _run_tier(
+                tier, attempt, accept, secondary
+            )
+            step.update(extra)
+        latency_ms = (time.perf_counter() - start) * 1000
+        if candidate is not None:
+            result = candidate
+
+        metrics.incr(f"cascade.tier{i}.{outcome}")
+        metrics.observe(f"cascade.tier{i}.latency_ms", latency_ms)
+        trace.append(
+            {
+                "tier": i,
+                "model": tier.label,
+                "latency_ms": round(latency_ms),
+                "outcome": outcome,
+                **step,
+            }
+        )
+        if outcome in ("accepted", "deadline"):
+            break
+        if i + 1 < len(tiers):
+            logger.info(f"Escalating from {tier.label} after {outcome}")
+            metrics.incr("cascade.escalations")
+    return result, trace
+
+
+def accepted(trace: list) -> bool:
+    return any(step["outcome"] == "accepted" for step in trace)
+
+
+def answered_by(trace: list) -> str:
+    """Model whose answer was returned: the accepted one, else the last that answered."""
+    for step in reversed(trace):
+        if step["outcome"] in ("accepted", "rejected"):
+            return step["model"]
+    return trace[-1]["model"] if trace else ""
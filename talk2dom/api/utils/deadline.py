@@ -0,0 +1,94 @@
+import asyncio
+import contextvars
+import os
+import random
+from typing import Optional
+
+from fastapi import HTTPException
+from loguru import logger
+
+from talk2dom.api.utils import metrics
+
+# 单个请求的总时间预算,客户端可用 X-Deadline-Ms 调小(不超过 MAX_MS);0 表示不限
+DEFAULT_MS = int(os.getenv("T2D_REQUEST_DEADLINE_MS", "60000"))
+MAX_MS = int(os.getenv("T2D_MAX_DEADLINE_MS", "120000"))
+# LLM 调用失败后的重试次数与退避基数(全抖动指数退避)
+LLM_ATTEMPTS = int(os.getenv("T2D_LLM_RETRY_ATTEMPTS", "3"))
+BACKOFF_MS = int(os.getenv("T2D_LLM_RETRY_BACKOFF_MS", "500"))
+HEADER = "X-Deadline-Ms"
+
+_deadline: contextvars.ContextVar = contextvars.ContextVar("t2d_deadline", default=None)
+
+
+class DeadlineExceeded(HTTPException):
+    def __init__(self, detail: str = "Deadline exceeded before a selector was found"):
+        super().__init__(status_code=504, detail=detail)
+
+
+def start(header_value: Optional[str] = None) -> Optional[float]:
+    """Start the request's time budget; returns it in seconds (None when unlimited)."""
+    budget_ms = DEFAULT_MS
+    if header_value:
+        try:
+            requested = int(header_value)
+        except ValueError:
+            logger.warning(f"Ignoring invalid {HEADER}: {header_value!r}")
+        else:
+            if requested > 0:
+                budget_ms = min(requested, MAX_MS) if MAX_MS else requested
+    if budget_ms <= 0:
+        _deadline.set(None)
+        return None
+    _deadline.set(asyncio.get_running_loop().time() + budget_ms / 1000)
+    return budget_ms / 1000
+
+
+def remaining() -> Optional[float]:
+    """Seconds left in the current request's budget, None when there is none."""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - asyncio.get_running_loop().time()
+
+
+def expired() -> bool:
+    left = remaining()
+    return left is not None and left <= 0
+
+
+def bound(timeout: Optional[float]) -> Optional[float]:
+    """``timeout`` shortened so it never runs past the deadline."""
+    left = remaining()
+    if left is None:
+        return timeout
+    left = max(left, 0)
+    return left if timeout is None else min(timeout, left)
+
+
+async def retry_call(func, *args, attempts: Optional[int] = None, **kwargs):
+    """Await ``func(*args, **kwargs)`` until it returns something other than None.
+
+    Only the wrapped stage is repeated. Sleeps use full-jitter exponential
+    backoff, and no attempt or sleep is started that would overrun the
+    request deadline; in that case None is returned.
+    """
+    attempts = attempts or LLM_ATTEMPTS
+    for attempt in range(1, attempts + 1):
+        try:
+            result = await asyncio.wait_for(func(*args, **kwargs), bound(None))
+        except asyncio.TimeoutError:
+            metrics.incr("deadline.exceeded")
+            return None
+        if result is not None:
+            return result
+        if attempt == attempts:
+            break
+        delay = random.uniform(0, BACKOFF_MS / 1000 * 2 ** (attempt - 1))
+        left = remaining()
+        if left is not None and delay >= left:
+            metrics.incr("deadline.retry_skipped")
+            break
+        logger.warning(f"[Retry] Attempt {attempt} failed. Retrying in {delay:.2f}s...")
+        metrics.incr("llm.retries")
+        await asyncio.sleep(delay)
+    return None
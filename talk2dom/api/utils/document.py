@@ -0,0 +1,135 @@
+import hashlib
+from functools import cached_property
+from typing import Optional
+
+from bs4 import BeautifulSoup
+
+from talk2dom.api.utils import html_cleaner, offload
+from talk2dom.api.utils.validator import SelectorValidator
+
+
+def _sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _analyze_worker(html: str, engine: str, checks: list, clean: bool) -> tuple:
+    # 一次解析里完成清洗和所有校验,只把结果传回主进程
+    return ParsedDocument(html, engine)._analyze(checks, clean)
+
+
+class ParsedDocument:
+    """One HTML snapshot, parsed once and shared by every stage of a request.
+
+    Cleaning, the structure-only backbone, the cache digests and selector
+    verification all read the same parse; nothing is computed until asked for.
+    With the lxml engine the bs4 soup is only built if a CSS selector has to
+    be verified.
+    """
+
+    def __init__(self, html: str, engine: Optional[str] = None):
+        self.html = html
+        self.engine = engine or html_cleaner.ENGINE
+        # (selector_type, selector) -> 校验结果,同一请求内不重复校验
+        self._verdicts = {}
+
+    @property
+    def soup(self) -> BeautifulSoup:
+        # 校验器持有唯一的一份 soup,渲染与 CSS 校验共用
+        return self.validator.soup
+
+    @cached_property
+    def _lxml_body(self):
+        if self.engine != "lxml":
+            return None
+        return html_cleaner.parse_with_lxml(self.html)
+
+    @cached_property
+    def _rendered(self) -> tuple:
+        if self._lxml_body is not None:
+            rendered = html_cleaner.render_lxml(self._lxml_body)
+            if rendered is not None:
+                return rendered
+        body = html_cleaner.find_body(self.soup)
+        # 等价于 clean_html_keep_structure_only(clean_html(html)),但不再重新解析
+        return html_cleaner.render_cleaned(body), html_cleaner.render_structure(body)
+
+    @property
+    def cleaned_html(self) -> str:
+        return self._rendered[0]
+
+    @property
+    def structure_html(self) -> str:
+        return self._rendered[1]
+
+    @cached_property
+    def digest(self) -> str:
+        return _sha256(self.html)
+
+    @cached_property
+    def structure_digest(self) -> str:
+        return _sha256(self.structure_html)
+
+    def html_id(self, url: str = "") -> str:
+        # 与 db.cache.compute_html_id 保持一致: 有 url 时按 url,否则按骨架
+        url = (url or "").strip()
+        return _sha256(url) if url else self.structure_digest
+
+    @cached_property
+    def validator(self) -> SelectorValidator:
+        tree = None
+        if self._lxml_body is not None:
+            tree = self._lxml_body.getroottree().getroot()
+        return SelectorValidator(self.html, tree=tree)
+
+    def verify(self, type_: str, selector: str) -> bool:
+        return self.validator.verify(type_, selector)
+
+    def _parsed(self) -> bool:
+        # 本进程里是否已经有可复用的解析结果
+        validator = self.__dict__.get("validator")
+        return self.__dict__.get("_lxml_body") is not None or (
+            validator is not None and validator._soup is not None
+        )
+
+    def _analyze(self, checks: list, clean: bool) -> tuple:
+        rendered = self._rendered if clean else None
+        return rendered, [self.verify(type_, selector) for type_, selector in checks]
+
+    async def analyze(self, checks=(), clean: bool = False) -> list:
+        """Verify ``(selector_type, selector)`` pairs and optionally clean, in one pass.
+
+        Large pages not yet parsed in this process are shipped to the process
+        pool once for the whole batch; verdicts are remembered for the request.
+        """
+        checks = list(checks)
+        pending = [
+            check for check in dict.fromkeys(checks) if check not in self._verdicts
+        ]
+        clean = clean and "_rendered" not in self.__dict__
+        if pending or clean:
+            size = len(self.html)
+            if not self._parsed() and offload.should_offload(size):
+                rendered, verdicts = await offload.run(
+                    _analyze_worker, self.html, self.engine, pending, clean, size=size
+                )
+                if rendered is not None:
+                    self._rendered = rendered
+            else:
+                _, verdicts = await offload.run(self._analyze, pending, clean)
+            self._verdicts.update(zip(pending, verdicts))
+        return [self._verdicts[check] for check in checks]
+
+    async def aclean(self) -> tuple:
+        """Return ``(cleaned_html, structure_html)`` without blocking the event loop."""
+        await self.analyze(clean=True)
+        return self._rendered
+
+    async def ahtml_id(self, url: str = "") -> str:
+        # 没有 url 时按骨架计算,先在线程池/进程池里清洗
+        if not (url or "").strip():
+            await self.aclean()
+        return self.html_id(url)
+
+    async def averify(self, type_: str, selector: str) -> bool:
+        (verdict,) = await self.analyze([(type_, selector)])
+        return verdict
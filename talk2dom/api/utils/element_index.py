@@ -0,0 +1,160 @@
+import os
+import re
+from typing import Optional
+
+from lxml import etree
+from loguru import logger
+
+# "selector"(默认,模型直接写选择器)或 "index"(模型返回元素编号,服务端生成选择器)
+SELECTOR_MODE = os.getenv("T2D_SELECTOR_MODE", "selector").strip().lower()
+INDEX_ATTRIBUTE = "data-t2d-idx"
+NOT_FOUND = ("not found", "")
+
+# 依次尝试的可读属性,只用于目标元素本身
+_ANCHOR_ATTRIBUTES = ("data-testid", "aria-label", "placeholder", "title", "alt")
+_IDENT_RE = re.compile(r"^[A-Za-z_][\w-]*$")
+_DIGITS_RE = re.compile(r"\d{4,}")
+_TOKEN_RE = re.compile(r"[-_:]+")
+
+
+def _looks_generated(value: str) -> bool:
+    """UUIDs, hashes and counters such as ``ember1234`` or ``a3f9c2e1b7``."""
+    if _DIGITS_RE.search(value):
+        return True
+    return any(
+        len(token) >= 8
+        and any(c.isdigit() for c in token)
+        and any(c.isalpha() for c in token)
+        for token in _TOKEN_RE.split(value)
+    )
+
+
+def _stable_ident(value: Optional[str]) -> bool:
+    return bool(value) and bool(_IDENT_RE.match(value)) and not _looks_generated(value)
+
+
+def _literal(value: str) -> Optional[str]:
+    if "'" not in value:
+        return f"'{value}'"
+    if '"' not in value:
+        return f'"{value}"'
+    return None
+
+
+def _parse(cleaned_html: str):
+    """Return ``(tree, root)`` where root is ``<body>`` when there is one."""
+    try:
+        tree = etree.HTML(cleaned_html)
+    except (ValueError, etree.LxmlError):
+        return None, None
+    if tree is None:
+        return None, None
+    body = tree.find("body")
+    return tree, body if body is not None else tree
+
+
+def _elements(root) -> list:
+    # 编号从 1 开始,0 留给 "没有这个元素"
+    return [el for el in root.iterdescendants() if isinstance(el.tag, str)]
+
+
+def annotate(cleaned_html: str) -> str:
+    """Tag every element of the cleaned html with its ``data-t2d-idx`` number.
+
+    Numbers follow document order, so re-parsing the same cleaned html in
+    ``build_selector`` finds the same element without keeping any state
+    between the prompt and the answer.
+    """
+    _, root = _parse(cleaned_html)
+    if root is None:
+        return cleaned_html
+    for i, el in enumerate(_elements(root), 1):
+        el.set(INDEX_ATTRIBUTE, str(i))
+    return etree.tostring(root, method="html", encoding="unicode")
+
+
+def _count(tree, xpath: str) -> int:
+    try:
+        return len(tree.xpath(xpath))
+    except etree.XPathError:
+        return 0
+
+
+def _unique_attribute(tree, el, attr: str) -> Optional[str]:
+    value = el.get(attr)
+    if not value or "\\" in value:
+        return None
+    literal = _literal(value)
+    if literal is None or _count(tree, f"//*[@{attr}={literal}]") != 1:
+        return None
+    return value
+
+
+def _css_path(tree, el, root) -> Optional[str]:
+    """Shortest ``a > b:nth-of-type(n)`` chain that matches only ``el``.
+
+    Positions count same-tag siblings, which the cleaner never removes
+    (blacklisted tags are different tags), so the path holds on the raw page.
+    """
+    css, xpath = [], []
+    node = el
+    while node is not None and node is not root.getparent():
+        if not _IDENT_RE.match(node.tag):
+            return None
+        node_id = node.get("id")
+        if (
+            node is not el
+            and _stable_ident(node_id)
+            and _count(tree, f"//*[@id='{node_id}']") == 1
+        ):
+            css.append(f"#{node_id}")
+            return " > ".join(reversed(css))
+        parent = node.getparent()
+        same_tag = [] if parent is None else [c for c in parent if c.tag == node.tag]
+        if len(same_tag) > 1:
+            position = same_tag.index(node) + 1
+            css.append(f"{node.tag}:nth-of-type({position})")
+            xpath.append(f"{node.tag}[{position}]")
+        else:
+            css.append(node.tag)
+            xpath.append(node.tag)
+        if _count(tree, "//" + "/".join(reversed(xpath))) == 1:
+            return " > ".join(reversed(css))
+        node = parent
+    return None
+
+
+def selector_for(tree, el, root) -> tuple:
+    """Derive ``(selector_type, selector_value)`` for ``el`` from the parse tree.
+
+    Preference order: a unique static id, a unique name, a unique readable
+    attribute, the shortest unique CSS path, and finally an absolute XPath.
+    """
+    if _stable_ident(el.get("id")) and _unique_attribute(tree, el, "id"):
+        return "id", el.get("id")
+    name = el.get("name")
+    if name and "'" not in name and _unique_attribute(tree, el, "name"):
+        return "name", name
+    if _IDENT_RE.match(el.tag):
+        for attr in _ANCHOR_ATTRIBUTES:
+            value = _unique_attribute(tree, el, attr)
+            if value is not None and "'" not in value:
+                return "css selector", f"{el.tag}[{attr}='{value}']"
+    path = _css_path(tree, el, root)
+    if path is not None:
+        return "css selector", path
+    return "xpath", tree.getroottree().getpath(el)
+
+
+def build_selector(cleaned_html: str, index: int) -> tuple:
+    """Turn the element number the model picked into a concrete selector."""
+    if not index or index < 0:
+        return NOT_FOUND
+    tree, root = _parse(cleaned_html)
+    if root is None:
+        return NOT_FOUND
+    elements = _elements(root)
+    if index > len(elements):
+        logger.warning(f"Element index {index} out of range ({len(elements)})")
+        return NOT_FOUND
+    return selector_for(tree, elements[index - 1], root)
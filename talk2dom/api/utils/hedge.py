@@ -0,0 +1,97 @@
+import asyncio
+import os
+from collections import deque
+from typing import Optional
+
+from loguru import logger
+
+from talk2dom.api.utils import metrics
+
+# 备用模型 provider:model,主模型迟迟不返回时把同一个 prompt 也发给它;留空不对冲
+HEDGE_MODEL = os.getenv("T2D_HEDGE_MODEL", "").strip()
+# 主模型最近延迟的这个分位数作为对冲等待时间
+HEDGE_PERCENTILE = float(os.getenv("T2D_HEDGE_PERCENTILE", "95"))
+# 样本不足时的等待时间
+HEDGE_DELAY_MS = int(os.getenv("T2D_HEDGE_DELAY_MS", "2000"))
+MIN_SAMPLES = 20
+WINDOW = 200
+
+_latencies: dict = {}
+
+
+def record(label: str, seconds: float) -> None:
+    _latencies.setdefault(label, deque(maxlen=WINDOW)).append(seconds)
+
+
+def delay_for(label: str) -> float:
+    """Seconds to wait for ``label`` before hedging: its recent latency percentile."""
+    samples = _latencies.get(label)
+    if not samples or len(samples) < MIN_SAMPLES:
+        return HEDGE_DELAY_MS / 1000
+    ordered = sorted(samples)
+    rank = round(HEDGE_PERCENTILE / 100 * (len(ordered) - 1))
+    return ordered[min(max(rank, 0), len(ordered) - 1)]
+
+
+def _result(task) -> Optional[object]:
+    if task.cancelled():
+        return None
+    error = task.exception()
+    if error is not None:
+        logger.warning(f"Hedged call failed: {error}")
+        return None
+    return task.result()
+
+
+async def race(primary, secondary, attempt, accept, admit=None) -> tuple:
+    """Run ``attempt(primary)``; if it is slower than usual also run ``attempt(secondary)``.
+
+    The hedge only fires if ``admit(secondary)`` allows it (e.g. its circuit
+    breaker). The first answer that passes ``accept`` wins and the other call
+    is cancelled. Returns ``(result, accepted, info)`` where ``info`` says
+    whether the hedge fired and which side won.
+    """
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    primary_task = asyncio.ensure_future(attempt(primary))
+    roles = {primary_task: "primary"}
+    info = {"hedged": False, "winner": None}
+
+    try:
+        done, _ = await asyncio.wait({primary_task}, timeout=delay_for(primary.label))
+        if not done and admit is not None and not admit(secondary):
+            metrics.incr("hedge.breaker_rejected")
+        elif not done:
+            info["hedged"] = True
+            metrics.incr("hedge.fired")
+            logger.info(f"Hedging {primary.label} with {secondary.label}")
+            roles[asyncio.ensure_future(attempt(secondary))] = "hedge"
+
+        fallback = None
+        pending = set(roles)
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                if task is primary_task:
+                    record(primary.label, loop.time() - start)
+                result = _result(task)
+                if result is None:
+                    continue
+                if await accept(result):
+                    info["winner"] = roles[task]
+                    if info["hedged"]:
+                        metrics.incr(f"hedge.won_by_{roles[task]}")
+                    return result, True, info
+                if fallback is None:
+                    fallback = result
+                    info["winner"] = roles[task]
+        return fallback, False, info
+    finally:
+        for task in roles:
+            if not task.done():
+                task.cancel()
+                if task is primary_task:
+                    # 被取消的主调用至少用了这么久,仍计入样本以免低估尾延迟
+                    record(primary.label, loop.time() - start)
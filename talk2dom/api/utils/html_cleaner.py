@@ -1,13 +1,24 @@
-from bs4 import BeautifulSoup, Comment
+import os
+import re
+from collections import Counter
+from html.entities import name2codepoint
+from typing import Optional
+
+from bs4 import BeautifulSoup, Comment, Tag
+from bs4.builder import HTMLParserTreeBuilder, HTMLTreeBuilder
+from bs4.formatter import HTMLFormatter
+from lxml import etree
 from urllib.parse import urljoin
 
 from loguru import logger
 
+# "bs4" (default) or "lxml"; the lxml engine renders byte-identical output and
+# hands a document back to bs4 whenever libxml2 would build a different tree.
+ENGINE = os.getenv("T2D_HTML_CLEANER", "bs4").strip().lower()
 
-def clean_html_keep_structure_only(raw_html: str) -> str:
-    soup = BeautifulSoup(raw_html, "html.parser")
-
-    blacklist = [
+# 定义不需要的标签
+BLACKLIST = frozenset(
+    [
         "script",
         "style",
         "meta",
@@ -18,52 +29,273 @@ def clean_html_keep_structure_only(raw_html: str) -> str:
         "object",
         "embed",
     ]
-    for tag in soup(blacklist):
-        tag.decompose()
+)
 
-    for comment in soup.find_all(string=lambda text: isinstance(text, Comment)):
-        comment.extract()
 
-    for tag in soup.find_all():
-        tag.attrs = {}
+class _NoAttributesFormatter(HTMLFormatter):
+    """Render tags as if their attributes had been wiped."""
 
-    for element in soup.find_all(string=True):
-        if element.parent.name not in ["script", "style"]:
-            element.extract()
-    logger.debug("Keep structured html")
-    return str(soup).replace("\n", "").replace("\t", "").strip()
+    def attributes(self, tag):
+        return []
 
 
-def clean_html(raw_html: str) -> str:
-    soup = BeautifulSoup(raw_html, "html.parser")
+_STRUCTURE_FORMATTER = _NoAttributesFormatter()
+
+
+def _iter_kept_nodes(root: Tag, keep_strings: bool = True):
+    """Walk ``root`` in document order, skipping blacklisted subtrees and comments.
+
+    The walk does not touch the tree, so the same soup can be rendered in
+    several ways (and still be used for selector verification) without being
+    parsed again. Feeding the result to ``Tag.decode(iterator=...)`` renders
+    exactly what ``str()`` would after decomposing the skipped nodes.
+    """
+    yield root
+    stack = [iter(root.contents)]
+    while stack:
+        for node in stack[-1]:
+            if isinstance(node, Tag):
+                if node.name in BLACKLIST:
+                    continue
+                yield node
+                stack.append(iter(node.contents))
+                break
+            if keep_strings and not isinstance(node, Comment):
+                yield node
+        else:
+            stack.pop()
+
+
+def find_body(soup: BeautifulSoup) -> Tag:
+    """Return the first ``<body>`` outside blacklisted tags, or the soup itself."""
+    for node in _iter_kept_nodes(soup, keep_strings=False):
+        if node.name == "body" and not isinstance(node, BeautifulSoup):
+            return node
+    return soup
+
+
+def render_cleaned(root: Tag) -> str:
+    out = root.decode(iterator=_iter_kept_nodes(root))
+    return out.replace("\n", "").replace("\r", "").replace("\t", "").strip()
+
+
+def render_structure(root: Tag) -> str:
+    out = root.decode(
+        iterator=_iter_kept_nodes(root, keep_strings=False),
+        formatter=_STRUCTURE_FORMATTER,
+    )
+    return out.replace("\n", "").replace("\t", "").strip()
 
-    # 定义不需要的标签
-    blacklist = [
-        "script",
-        "style",
-        "meta",
-        "link",
-        "noscript",
-        "iframe",
-        "svg",
-        "object",
-        "embed",
-    ]
 
-    for tag in soup(blacklist):
-        tag.decompose()
+# ------------------ lxml engine ------------------
 
-    for comment in soup.find_all(string=lambda text: isinstance(text, Comment)):
-        comment.extract()
+_VOID_TAGS = frozenset(HTMLParserTreeBuilder().empty_element_tags)
+_LIST_ATTRIBUTES = HTMLTreeBuilder.DEFAULT_CDATA_LIST_ATTRIBUTES
+_MINIMAL = HTMLFormatter.REGISTRY["minimal"]
+_PRESERVE_WHITESPACE_TAGS = HTMLTreeBuilder.DEFAULT_PRESERVE_WHITESPACE_TAGS
+_ASCII_SPACES = BeautifulSoup.ASCII_SPACES
+_BENIGN_ERRORS = frozenset([etree.ErrorTypes.HTML_UNKNOWN_TAG])
+# libxml2 把这些标签的内容当作纯文本,html.parser 的处理随 Python 版本而不同
+_RCDATA_TAGS = frozenset(["textarea", "title"])
+_RAWTEXT_TAGS = frozenset(["xmp", "noembed", "noframes", "plaintext"])
 
-    if soup.body is not None:
-        body = soup.body
-    else:
-        body = soup
+_NONWHITESPACE_RE = re.compile(r"\S+")
+_RAW_TEXT_RE = re.compile(
+    r"<(script|style)\b.*?</\1\s*>|<!--.*?-->", re.IGNORECASE | re.DOTALL
+)
+_END_TAG_RE = re.compile(r"</([a-zA-Z][^\s/>]*)")
+_BODY_START_RE = re.compile(r"<body[\s/>]", re.IGNORECASE)
+_BODY_END_RE = re.compile(r"</body\s*>", re.IGNORECASE)
+_ENTITY_RE = re.compile(r"&(#[xX]?[0-9a-fA-F]+|[a-zA-Z][a-zA-Z0-9]*)(;?)")
+_TAG_RE = re.compile(r"<[^>]*>")
+_START_TAG_RE = re.compile(r"<[a-zA-Z][^>]*>")
+_ATTR_RE = re.compile(
+    r"""[\s"'][^\s"'<>/=]+(?:\s*=\s*(?:"[^"]*"|'[^']*'|[^\s"'=<>`]+))?"""
+)
 
-    cleaned = str(body).replace("\n", "").replace("\r", "").replace("\t", "")
+
+def _safe_entity(name: str, terminated: bool) -> bool:
+    # html.parser/bs4 and libxml2 only agree on terminated HTML 4 references
+    if not terminated:
+        return False
+    if not name.startswith("#"):
+        return name in name2codepoint
+    try:
+        code = int(name[2:], 16) if name[1] in "xX" else int(name[1:])
+    except ValueError:
+        return False
+    # bs4 maps 128-159 through windows-1252, libxml2 does not
+    return 9 <= code < 128 or 160 <= code < 0xD800 or 0xE000 <= code <= 0x10FFFF
+
+
+def parse_with_lxml(raw_html: str):
+    """Parse with libxml2 and return ``<body>`` if the tree matches html.parser's.
+
+    libxml2 repairs markup (implied end tags, misplaced content) while
+    html.parser keeps the tree as written, so any sign of a repair sends the
+    document back to the bs4 engine.
+    """
+    # 只检查 script/style/注释之外的部分,它们的内容两边都按原文处理
+    scan = _RAW_TEXT_RE.sub("", raw_html)
+    if len(_BODY_START_RE.findall(scan)) != 1 or "\r" in scan:
+        return None
+    # 除开头的 doctype 外,CDATA、声明和处理指令在 libxml2 里都会被丢弃或改写
+    declarations = scan.count("<!")
+    if declarations > 1 or "<?" in scan:
+        return None
+    if declarations and scan.lstrip()[:9].lower() != "<!doctype":
+        return None
+    body_ends = list(_BODY_END_RE.finditer(scan))
+    if len(body_ends) != 1:
+        return None
+    after_body = scan[body_ends[0].end() :]
+    if _TAG_RE.sub("", after_body).strip() or re.search("<[a-zA-Z]", after_body):
+        return None
+    if "&" in scan:
+        for name, terminator in set(_ENTITY_RE.findall(scan)):
+            if not _safe_entity(name, bool(terminator)):
+                return None
+
+    parser = etree.HTMLParser(recover=True)
+    try:
+        root = etree.fromstring(raw_html, parser)
+    except (ValueError, etree.LxmlError):
+        return None
+    if root is None:
+        return None
+    if any(e.type not in _BENIGN_ERRORS for e in parser.error_log):
+        return None
+
+    # 每个非 void 元素都必须有显式的结束标签,否则 libxml2 可能隐式闭合了它;
+    # libxml2 还会静默丢弃重复属性(保留第一个),而 bs4 保留最后一个
+    elements = Counter()
+    attributes = 0
+    for el in root.iter():
+        tag = el.tag
+        if not isinstance(tag, str) or tag in ("script", "style"):
+            continue
+        attributes += len(el.attrib)
+        if tag not in _VOID_TAGS:
+            elements[tag] += 1
+    end_tags = Counter(name.lower() for name in _END_TAG_RE.findall(scan))
+    end_tags.pop("script", None)
+    end_tags.pop("style", None)
+    if end_tags != elements:
+        return None
+    if attributes != len(_ATTR_RE.findall("".join(_START_TAG_RE.findall(scan)))):
+        return None
+    return root.find("body")
+
+
+def _lxml_start_tag(el, keep_attrs: bool) -> Optional[str]:
+    tag = el.tag
+    close = "/>" if tag in _VOID_TAGS else ">"
+    if not keep_attrs or not el.attrib:
+        return f"<{tag}{close}"
+    list_attrs = _LIST_ATTRIBUTES["*"] | _LIST_ATTRIBUTES.get(tag, set())
+    parts = [tag]
+    for key, val in sorted(el.attrib.items()):
+        # 命名空间属性,或无法区分 `disabled` 与 `disabled="disabled"`
+        if key.startswith("{") or val == key:
+            return None
+        if key in list_attrs:
+            val = " ".join(_NONWHITESPACE_RE.findall(val))
+        parts.append(
+            key + "=" + _MINIMAL.quoted_attribute_value(_MINIMAL.attribute_value(val))
+        )
+    return "<" + " ".join(parts) + close
+
+
+def _lxml_text(text: str, preserve: bool) -> str:
+    # 与 bs4 一致: pre/textarea 之外只含 ASCII 空白的字符串会被折叠
+    if not preserve and not text.strip(_ASCII_SPACES):
+        return "\n" if "\n" in text else " "
+    return _MINIMAL.substitute(text)
+
+
+def _lxml_render(root, keep_text: bool) -> Optional[str]:
+    out = [_lxml_start_tag(root, keep_text)]
+    preserve = 0
+    if keep_text and root.text:
+        out.append(_lxml_text(root.text, False))
+    stack = [(root, iter(root))]
+    while stack:
+        el, children = stack[-1]
+        for child in children:
+            tag = child.tag
+            if tag is etree.Comment or tag in BLACKLIST:
+                if keep_text and child.tail:
+                    out.append(_lxml_text(child.tail, preserve > 0))
+                continue
+            if not isinstance(tag, str):
+                return None
+            start = _lxml_start_tag(child, keep_text)
+            if start is None:
+                return None
+            out.append(start)
+            if tag in _VOID_TAGS:
+                if len(child) or child.text:
+                    return None
+                if keep_text and child.tail:
+                    out.append(_lxml_text(child.tail, preserve > 0))
+                continue
+            if tag in _RAWTEXT_TAGS or (
+                tag in _RCDATA_TAGS and child.text and "<" in child.text
+            ):
+                return None
+            if tag in _PRESERVE_WHITESPACE_TAGS:
+                preserve += 1
+            if keep_text and child.text:
+                out.append(_lxml_text(child.text, preserve > 0))
+            stack.append((child, iter(child)))
+            break
+        else:
+            stack.pop()
+            out.append(f"</{el.tag}>")
+            if el.tag in _PRESERVE_WHITESPACE_TAGS:
+                preserve -= 1
+            if stack and keep_text and el.tail:
+                out.append(_lxml_text(el.tail, preserve > 0))
+    if out[0] is None:
+        return None
+    return "".join(out)
+
+
+def render_lxml(body) -> Optional[tuple]:
+    """Return ``(cleaned, structure)`` for a body from ``parse_with_lxml``."""
+    cleaned = _lxml_render(body, keep_text=True)
+    structure = _lxml_render(body, keep_text=False)
+    if cleaned is None or structure is None:
+        return None
+    return (
+        cleaned.replace("\n", "").replace("\r", "").replace("\t", "").strip(),
+        structure.replace("\n", "").replace("\t", "").strip(),
+    )
+
+
+def lxml_clean(raw_html: str) -> Optional[tuple]:
+    """Return ``(cleaned, structure)`` rendered with lxml, or None to use bs4."""
+    body = parse_with_lxml(raw_html)
+    if body is None:
+        return None
+    return render_lxml(body)
+
+
+def clean_html_keep_structure_only(raw_html: str) -> str:
+    soup = BeautifulSoup(raw_html, "html.parser")
+    logger.debug("Keep structured html")
+    return render_structure(soup)
+
+
+def clean_html(raw_html: str) -> str:
+    if ENGINE == "lxml":
+        rendered = lxml_clean(raw_html)
+        if rendered is not None:
+            logger.debug("Cleaned html with lxml")
+            return rendered[0]
+    soup = BeautifulSoup(raw_html, "html.parser")
     logger.debug("Cleaned html")
-    return cleaned.strip()
+    return render_cleaned(find_body(soup))
 
 
 def convert_relative_paths_to_absolute(html: str, base_url: str) -> str:
@@ -0,0 +1,80 @@
+import math
+import os
+import re
+from collections import Counter
+from typing import Optional
+
+# 模糊匹配的最低相似度(0~1),默认 0 只做精确匹配
+FUZZY_THRESHOLD = float(os.getenv("T2D_FUZZY_THRESHOLD", "0"))
+
+# in/on/to/up/as 之类的小词会改变目标("sign in" / "sign up"),不能去掉
+STOPWORDS = frozenset(
+    "a an the at of from by for with and or then "
+    "please this that these those it its me my i you your".split()
+)
+# 只说明元素种类的词,比较内容词时忽略("click login" / "click the login button")
+_GENERIC = frozenset("button btn link field input box icon element".split())
+_SYNONYMS = {"press": "click", "tap": "click"}
+_WORD_RE = re.compile(r"[^\W_]+", re.UNICODE)
+_TERM_RE = re.compile(r"[a-z0-9]+|[^\W\d_a-z]+", re.UNICODE)
+_CAMEL_RE = re.compile(r"(?<=[a-z0-9])(?=[A-Z])")
+
+
+def terms(text: str) -> list:
+    """Words plus character trigrams, so "login" also matches "log-in"/"loginBtn".
+
+    Shared by fuzzy instruction matching and prompt pruning.
+    """
+    words = _TERM_RE.findall(_CAMEL_RE.sub(" ", text).lower())
+    result = list(words)
+    for word in words:
+        padded = f"#{word}#"
+        result.extend(padded[i : i + 3] for i in range(len(padded) - 2))
+    return result
+
+
+def canonicalize(instruction: str) -> str:
+    """Lowercase, drop punctuation and stopwords, collapse whitespace."""
+    words = _WORD_RE.findall((instruction or "").lower())
+    return " ".join(word for word in words if word not in STOPWORDS)
+
+
+def _content(canonical: str) -> set:
+    return {
+        _SYNONYMS.get(word, word) for word in canonical.split() if word not in _GENERIC
+    }
+
+
+def similarity(a: str, b: str) -> float:
+    """Cosine similarity of two canonical instructions over words and char trigrams.
+
+    Instructions score 0 unless they use the same content words, so "Save"
+    and "Save As" or "select" and "deselect" never match, however alike
+    they read; only wording such as articles or "button" may differ.
+    """
+    if a == b:
+        return 1.0
+    if _content(a) != _content(b):
+        return 0.0
+    va, vb = Counter(terms(a)), Counter(terms(b))
+    dot = sum(count * vb[term] for term, count in va.items() if term in vb)
+    if not dot:
+        return 0.0
+    norm = math.sqrt(sum(c * c for c in va.values()) * sum(c * c for c in vb.values()))
+    return dot / norm
+
+
+def best_match(
+    canonical: str, candidates: dict, threshold: Optional[float] = None
+) -> Optional[tuple]:
+    """Return ``(candidate, score)`` for the most similar key of ``candidates``."""
+    if threshold is None:
+        threshold = FUZZY_THRESHOLD
+    if threshold <= 0:
+        return None
+    best = None
+    for candidate in candidates:
+        score = similarity(canonical, candidate)
+        if score >= threshold and (best is None or score > best[1]):
+            best = (candidate, score)
+    return best
@@ -0,0 +1,48 @@
+import threading
+from collections import defaultdict
+
+# 进程内的轻量指标,通过 /api/v1/status/metrics 暴露
+_lock = threading.Lock()
+_counters = defaultdict(int)
+_gauges = {}
+_timings = {}
+
+
+def incr(name: str, value: int = 1) -> None:
+    with _lock:
+        _counters[name] += value
+
+
+def gauge(name: str, value) -> None:
+    with _lock:
+        _gauges[name] = value
+
+
+def observe(name: str, value: float) -> None:
+    """Record one sample (e.g. a duration in ms) for ``name``."""
+    with _lock:
+        count, total, peak = _timings.get(name, (0, 0.0, 0.0))
+        _timings[name] = (count + 1, total + value, max(peak, value))
+
+
+def snapshot() -> dict:
+    with _lock:
+        return {
+            "counters": dict(_counters),
+            "gauges": dict(_gauges),
+            "timings": {
+                name: {
+                    "count": count,
+                    "avg": round(total / count, 3) if count else 0.0,
+                    "max": round(peak, 3),
+                }
+                for name, (count, total, peak) in _timings.items()
+            },
+        }
+
+
+def reset() -> None:
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
+        _timings.clear()
@@ -0,0 +1,88 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+from loguru import logger
+from starlette.concurrency import run_in_threadpool
+
+from talk2dom.api.utils import metrics
+
+# 0 关闭进程池,所有 CPU 密集任务都在线程池里执行
+POOL_SIZE = int(os.getenv("T2D_PROCESS_POOL_SIZE", "0"))
+# 小于该字节数的页面直接在本进程处理,避免序列化/跨进程开销
+MIN_SIZE = int(os.getenv("T2D_PROCESS_POOL_MIN_BYTES", "262144"))
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+_inflight = 0
+
+
+def _pool() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                # spawn: 不继承父进程里的线程、连接和事件循环
+                _executor = ProcessPoolExecutor(
+                    max_workers=POOL_SIZE,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+                logger.info(f"Started process pool with {POOL_SIZE} workers")
+    return _executor
+
+
+def should_offload(size: int) -> bool:
+    return POOL_SIZE > 0 and size >= MIN_SIZE
+
+
+def _timed_call(func, args, submitted_at: float):
+    started_at = time.time()
+    result = func(*args)
+    return result, started_at - submitted_at, time.time() - started_at
+
+
+def _track_inflight(delta: int) -> None:
+    global _inflight
+    with _executor_lock:
+        _inflight += delta
+        metrics.gauge("offload.process.inflight", _inflight)
+
+
+async def run(func, *args, size: int = 0):
+    """Run a CPU-bound ``func(*args)`` without blocking the event loop.
+
+    Pages of at least ``T2D_PROCESS_POOL_MIN_BYTES`` go to the process pool
+    (``func`` and its arguments must then be picklable); everything else runs
+    in the threadpool.
+    """
+    if not should_offload(size):
+        metrics.incr("offload.inline")
+        return await run_in_threadpool(func, *args)
+
+    metrics.incr("offload.process.submitted")
+    _track_inflight(1)
+    loop = asyncio.get_running_loop()
+    try:
+        result, queue_wait, run_time = await loop.run_in_executor(
+            _pool(), _timed_call, func, args, time.time()
+        )
+    except Exception:
+        metrics.incr("offload.process.failed")
+        raise
+    finally:
+        _track_inflight(-1)
+    metrics.observe("offload.process.queue_wait_ms", queue_wait * 1000)
+    metrics.observe("offload.process.run_ms", run_time * 1000)
+    return result
+
+
+def shutdown() -> None:
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
@@ -0,0 +1,134 @@
+import os
+import re
+
+from lxml import etree
+
+from talk2dom.api.utils import element_index, pruner
+
+# 提示词里页面的序列化格式: "html"(默认,清洗后的 html)或 "outline"
+PROMPT_FORMAT = os.getenv("T2D_PROMPT_FORMAT", "html").strip().lower()
+MAX_TEXT = int(os.getenv("T2D_OUTLINE_TEXT_CHARS", "80"))
+MAX_CLASSES = 4
+MAX_CLASS_LEN = 32
+MAX_ATTR_LEN = 80
+
+# 写 id/name/class/CSS/XPath 选择器需要的属性,其余(style、data-* 等)丢弃
+KEEP_ATTRIBUTES = (
+    "name",
+    "type",
+    "role",
+    "aria-label",
+    "placeholder",
+    "href",
+    "for",
+    "title",
+    "alt",
+    "value",
+    "data-testid",
+)
+
+OUTLINE_HEADER = (
+    "# Page outline: one element per line, indentation is nesting, in document order.\n"
+    '# tag#id.class[attr="value"] "text"; selectors must target the original page.\n'
+)
+
+_SPACE_RE = re.compile(r"\s+")
+_OMITTED_RE = re.compile(r"\s*(\d+) omitted\s*")
+
+
+def _truncate(text: str, limit: int) -> str:
+    return text if len(text) <= limit else text[: limit - 1] + "…"
+
+
+def _quote(value: str) -> str:
+    return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def _line(el) -> str:
+    parts = [el.tag]
+    el_id = el.get("id")
+    if el_id:
+        parts.append(f"#{el_id}" if " " not in el_id else f"[id={_quote(el_id)}]")
+    classes = [
+        cls for cls in (el.get("class") or "").split() if len(cls) <= MAX_CLASS_LEN
+    ]
+    parts.extend(f".{cls}" for cls in classes[:MAX_CLASSES])
+    for attr in KEEP_ATTRIBUTES:
+        value = el.get(attr)
+        if value is None:
+            continue
+        if attr == "href" and value.startswith(("data:", "javascript:")):
+            continue
+        value = _truncate(_SPACE_RE.sub(" ", value).strip(), MAX_ATTR_LEN)
+        parts.append(f"[{attr}={_quote(value)}]")
+
+    text = " ".join(
+        chunk
+        for chunk in [el.text] + [child.tail for child in el]
+        if chunk and chunk.strip()
+    )
+    text = _SPACE_RE.sub(" ", text).strip()
+    line = "".join(parts)
+    index = el.get(element_index.INDEX_ATTRIBUTE)
+    if index:
+        line = f"[{index}] {line}"
+    if text:
+        line += " " + _quote(_truncate(text, MAX_TEXT))
+    return line
+
+
+def to_outline(html: str) -> str:
+    """Serialize cleaned html as an indented, attribute-whitelisted outline.
+
+    Every element keeps its own line so child/descendant and positional
+    selectors written against the outline still hold on the real page;
+    only attributes that selectors use survive, and text is truncated.
+    """
+    try:
+        tree = etree.HTML(html)
+    except (ValueError, etree.LxmlError):
+        return html
+    if tree is None:
+        return html
+    body = tree.find("body")
+    root = body if body is not None else tree
+
+    lines = [OUTLINE_HEADER.rstrip("\n")]
+    stack = [(root, 0)]
+    while stack:
+        el, depth = stack.pop()
+        if el.tag is etree.Comment:
+            # pruner 留下的 "N omitted" 标记
+            match = _OMITTED_RE.fullmatch(el.text or "")
+            if match:
+                lines.append("  " * depth + f"… {match.group(1)} omitted")
+            continue
+        if not isinstance(el.tag, str):
+            continue
+        lines.append("  " * depth + _line(el))
+        stack.extend((child, depth + 1) for child in reversed(el))
+    return "\n".join(lines)
+
+
+def serialize_for_prompt(html: str, prompt_format: str = PROMPT_FORMAT) -> str:
+    if prompt_format == "outline":
+        return to_outline(html)
+    return html
+
+
+def build_prompt_html(
+    cleaned_html: str,
+    instruction: str,
+    prompt_format: str = PROMPT_FORMAT,
+    indexed: bool = False,
+) -> str:
+    """Prune to the instruction's regions, then serialize in ``prompt_format``.
+
+    With ``indexed`` every element carries its element-index number (an
+    ``[n]`` prefix in the outline, a ``data-t2d-idx`` attribute in html).
+    """
+    if indexed:
+        cleaned_html = element_index.annotate(cleaned_html)
+    return serialize_for_prompt(
+        pruner.prune_html(cleaned_html, instruction), prompt_format
+    )
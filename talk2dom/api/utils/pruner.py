@@ -0,0 +1,195 @@
+import html
+import math
+import os
+from collections import Counter
+
+from lxml import etree
+
+from talk2dom.api.utils.instruction import terms
+
+# 提示词里 html 的 token 预算(按 4 字符 ≈ 1 token 估算),0 表示不裁剪
+TOKEN_BUDGET = int(os.getenv("T2D_PROMPT_TOKEN_BUDGET", "0"))
+CHARS_PER_TOKEN = 4
+# 单个命中区域向上扩展(带上 label、相邻按钮等上下文)的最大字符数
+REGION_CHARS = int(os.getenv("T2D_PRUNE_REGION_CHARS", "1500"))
+MIN_RELATIVE_SCORE = 0.2
+
+_SCORED_ATTRIBUTES = (
+    "id",
+    "name",
+    "aria-label",
+    "placeholder",
+    "title",
+    "alt",
+    "value",
+)
+
+
+def _features(el) -> str:
+    parts = [el.tag]
+    for attr in _SCORED_ATTRIBUTES:
+        value = el.get(attr)
+        if value:
+            parts.append(value)
+    if el.text:
+        parts.append(el.text)
+    for child in el:
+        if child.tail:
+            parts.append(child.tail)
+    return " ".join(parts)
+
+
+def _open_tag(el) -> str:
+    attrs = "".join(
+        f' {key}="{html.escape(value)}"'
+        for key, value in el.attrib.items()
+        if isinstance(key, str) and not key.startswith("{")
+    )
+    return f"<{el.tag}{attrs}>"
+
+
+def _subtree_sizes(root) -> dict:
+    """Approximate serialized size of every element, computed bottom-up."""
+    sizes = {}
+    for el in reversed(list(root.iter())):
+        if not isinstance(el.tag, str):
+            sizes[el] = 0
+            continue
+        size = 2 * len(el.tag) + 5 + len(el.text or "")
+        size += sum(len(f' {k}="{v}"') for k, v in el.attrib.items())
+        for child in el:
+            size += sizes.get(child, 0) + len(child.tail or "")
+        sizes[el] = size
+    return sizes
+
+
+def score_elements(root, instruction: str) -> dict:
+    """TF-IDF cosine similarity between the instruction and each element's own text/attributes."""
+    docs = {}
+    df = Counter()
+    for el in root.iter():
+        if not isinstance(el.tag, str):
+            continue
+        counts = Counter(terms(_features(el)))
+        if counts:
+            docs[el] = counts
+            df.update(counts.keys())
+    query = Counter(terms(instruction))
+    if not docs or not query:
+        return {}
+
+    n = len(docs)
+    idf = {term: math.log((n + 1) / (count + 1)) + 1 for term, count in df.items()}
+    q_vec = {
+        term: count * idf.get(term, math.log(n + 1) + 1)
+        for term, count in query.items()
+    }
+    q_norm = math.sqrt(sum(w * w for w in q_vec.values()))
+
+    scores = {}
+    for el, counts in docs.items():
+        dot = sum(
+            counts[term] * idf[term] * weight
+            for term, weight in q_vec.items()
+            if term in counts
+        )
+        if dot <= 0:
+            continue
+        d_norm = math.sqrt(sum((c * idf[t]) ** 2 for t, c in counts.items()))
+        scores[el] = dot / (q_norm * d_norm)
+    return scores
+
+
+def _render(el, full: set, ancestors: set, out: list) -> None:
+    if el in full:
+        out.append(
+            etree.tostring(el, method="html", encoding="unicode", with_tail=False)
+        )
+        return
+    out.append(_open_tag(el))
+    omitted = 0
+    for child in el:
+        if child in full or child in ancestors:
+            if omitted:
+                out.append(f"<!-- {omitted} omitted -->")
+                omitted = 0
+            _render(child, full, ancestors, out)
+        elif isinstance(child.tag, str):
+            omitted += 1
+    if omitted:
+        out.append(f"<!-- {omitted} omitted -->")
+    out.append(f"</{el.tag}>")
+
+
+def should_prune(cleaned_html: str, token_budget: int = TOKEN_BUDGET) -> bool:
+    return token_budget > 0 and len(cleaned_html) > token_budget * CHARS_PER_TOKEN
+
+
+def prune_html(
+    cleaned_html: str, instruction: str, token_budget: int = TOKEN_BUDGET
+) -> str:
+    """Keep the regions most relevant to ``instruction`` within ``token_budget``.
+
+    Elements are ranked by TF-IDF similarity of their visible text and
+    identifying attributes; each hit is widened to its largest ancestor that
+    still fits ``REGION_CHARS`` and kept whole, its ancestors are kept as bare
+    tags so selectors stay anchored. Pages already within budget, or with
+    nothing that matches, are returned unchanged.
+    """
+    if not should_prune(cleaned_html, token_budget):
+        return cleaned_html
+    budget = token_budget * CHARS_PER_TOKEN
+    try:
+        tree = etree.HTML(cleaned_html)
+    except (ValueError, etree.LxmlError):
+        return cleaned_html
+    if tree is None:
+        return cleaned_html
+    body = tree.find("body")
+    root = body if body is not None else tree
+
+    scores = score_elements(root, instruction)
+    if not scores:
+        return cleaned_html
+    sizes = _subtree_sizes(root)
+    parents = {child: el for el in root.iter() for child in el}
+
+    # 只保留与最佳匹配相差不大的候选,避免弱的 trigram 命中占满预算
+    floor = max(scores.values()) * MIN_RELATIVE_SCORE
+    full, ancestors = set(), set()
+    used = 0
+    for el, score in sorted(scores.items(), key=lambda item: -item[1]):
+        if score < floor:
+            break
+        region = el
+        while (
+            region in parents
+            and parents[region] is not root
+            and sizes[parents[region]] <= REGION_CHARS
+        ):
+            region = parents[region]
+        if region in full or any(a in full for a in _chain(region, parents)):
+            continue
+        if used + sizes[region] > budget:
+            continue
+        # 被新区域包含的旧区域不再单独计入
+        for kept in [k for k in full if region in _chain(k, parents)]:
+            full.discard(kept)
+            used -= sizes[kept]
+        full.add(region)
+        ancestors.update(_chain(region, parents))
+        used += sizes[region]
+    if not full:
+        return cleaned_html
+
+    out = []
+    _render(root, full, ancestors, out)
+    return "".join(out)
+
+
+def _chain(el, parents: dict) -> list:
+    chain = []
+    while el in parents:
+        el = parents[el]
+        chain.append(el)
+    return chain
@@ -0,0 +1,60 @@
+import hashlib
+import os
+import re
+from collections import Counter
+from typing import List, Optional
+
+BITS = 64
+# 指纹切成 BANDS 段分别建索引;汉明距离 < BANDS 的两个指纹至少有一段完全相同
+BANDS = 4
+BAND_BITS = BITS // BANDS
+SHINGLE = 4
+# 认为是"同一页面"的最大汉明距离,0 表示关闭近似查找
+MAX_DISTANCE = min(int(os.getenv("T2D_SIMHASH_MAX_DISTANCE", "3")), BANDS - 1)
+
+_TAG_RE = re.compile(r"<(/?[a-zA-Z][\w:-]*)")
+
+
+def _shingles(structure_html: str) -> Counter:
+    tokens = [token.lower() for token in _TAG_RE.findall(structure_html or "")]
+    if len(tokens) < SHINGLE:
+        return Counter([" ".join(tokens)]) if tokens else Counter()
+    return Counter(
+        " ".join(tokens[i : i + SHINGLE]) for i in range(len(tokens) - SHINGLE + 1)
+    )
+
+
+def _hash(shingle: str) -> int:
+    digest = hashlib.blake2b(shingle.encode("utf-8"), digest_size=BITS // 8).digest()
+    return int.from_bytes(digest, "big")
+
+
+def fingerprint(structure_html: Optional[str]) -> int:
+    """64-bit SimHash of a structure-only backbone over shingles of its tag stream."""
+    weights = [0] * BITS
+    for shingle, count in _shingles(structure_html or "").items():
+        h = _hash(shingle)
+        for bit in range(BITS):
+            weights[bit] += count if h >> bit & 1 else -count
+    return sum(1 << bit for bit in range(BITS) if weights[bit] > 0)
+
+
+def to_hex(fp: int) -> str:
+    return f"{fp:0{BITS // 4}x}"
+
+
+def from_hex(value: str) -> int:
+    return int(value, 16)
+
+
+def bands(fp: int) -> List[str]:
+    """The fingerprint's bands as hex strings, most significant first."""
+    mask = (1 << BAND_BITS) - 1
+    return [
+        f"{fp >> (BAND_BITS * (BANDS - 1 - i)) & mask:0{BAND_BITS // 4}x}"
+        for i in range(BANDS)
+    ]
+
+
+def distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
@@ -0,0 +1,157 @@
+import hashlib
+import os
+import re
+from typing import List, Optional
+from urllib.parse import urlparse, urlunparse
+
+from talk2dom.api.utils.html_cleaner import BLACKLIST
+
+# 自动把路径里的数字 / UUID / 哈希 / slug 段替换成占位符,让同一模板的页面共用缓存
+# 会改变缓存键,默认关闭
+AUTO_DETECT = os.getenv("T2D_URL_TEMPLATING", "0").lower() in ("1", "true", "yes")
+
+_NUMERIC_RE = re.compile(r"^\d+$")
+_UUID_RE = re.compile(
+    r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$", re.IGNORECASE
+)
+_HEX_RE = re.compile(r"^[0-9a-f]{16,}$", re.IGNORECASE)
+# 末尾带数字 id 的 slug,例如 blue-cotton-shirt-48213 或 sku_12ab34
+_SLUG_ID_RE = re.compile(r"^[a-z0-9]+(?:[-_][a-z0-9]+)*[-_][a-z]*\d+[a-z0-9]*$", re.I)
+# 至少四个单词的 slug,例如 how-to-reset-your-password
+_SLUG_WORDS_RE = re.compile(r"^[a-z0-9]+(?:-[a-z0-9]+){3,}$", re.IGNORECASE)
+# ;jsessionid=... 之类的路径参数
+_PATH_PARAMS_RE = re.compile(r";[^/]*")
+_TAG_RE = re.compile(r"<(/?)([a-zA-Z][\w:-]*)[^>]*?(/?)>")
+_VOID_TAGS = frozenset(
+    "area base br col embed hr img input link meta param source track wbr".split()
+)
+_COMMENT_RE = re.compile(r"<!--.*?(?:-->|$)", re.S)
+_SKIPPED_RE = re.compile(
+    r"<(%s)\b.*?</\1\s*>" % "|".join(sorted(BLACKLIST)), re.S | re.IGNORECASE
+)
+_BODY_RE = re.compile(r"<body\b[^>]*>", re.IGNORECASE)
+# 解析器会补上或省略的标签,不计入路径
+_IMPLIED_TAGS = frozenset("html head body tbody".split())
+_IMPLIED_END = frozenset("li p option tr td th dt dd".split())
+
+
+def parse_rules(spec: Optional[str]) -> List[tuple]:
+    """Parse ``"/product/{sku}, /blog/*"`` into per-segment templates.
+
+    ``{name}`` and ``*`` match any single path segment; other segments must
+    match literally.
+    """
+    rules = []
+    for part in re.split(r"[,\n]", spec or ""):
+        part = part.strip()
+        if not part:
+            continue
+        if not part.startswith("/"):
+            raise ValueError(f"URL template must start with '/': {part!r}")
+        segments = tuple(part.strip("/").split("/"))
+        if any(not segment for segment in segments):
+            raise ValueError(f"Empty path segment in URL template: {part!r}")
+        rules.append(segments)
+    return rules
+
+
+def _is_placeholder(segment: str) -> bool:
+    return segment == "*" or (segment.startswith("{") and segment.endswith("}"))
+
+
+def _auto_segment(segment: str) -> str:
+    if _NUMERIC_RE.match(segment):
+        return "{id}"
+    if _UUID_RE.match(segment):
+        return "{uuid}"
+    if _HEX_RE.match(segment) and any(c.isdigit() for c in segment):
+        return "{hash}"
+    if _SLUG_ID_RE.match(segment) or _SLUG_WORDS_RE.match(segment):
+        return "{slug}"
+    return segment
+
+
+def _apply_rules(segments: List[str], rules: List[tuple]) -> Optional[List[str]]:
+    for rule in rules:
+        if len(rule) != len(segments):
+            continue
+        if all(
+            _is_placeholder(expected) or expected == actual
+            for expected, actual in zip(rule, segments)
+        ):
+            return list(rule)
+    return None
+
+
+def _template_path(path: str, rules: List[tuple], auto: bool) -> str:
+    segments = [segment for segment in path.split("/") if segment]
+    templated = _apply_rules(segments, rules)
+    if templated is None:
+        templated = [_auto_segment(s) for s in segments] if auto else segments
+    return "/" + "/".join(templated) if templated else path[:1]
+
+
+def template(url: Optional[str], rules: Optional[List[tuple]] = None) -> str:
+    """Map a page URL to the template shared by structurally identical pages.
+
+    The query string, path parameters and any fragment other than a
+    ``#/route`` are dropped (so tracking parameters never reach the cache
+    key), the host is lowercased, and path segments are replaced by a project
+    rule or, when auto-detection is on, by the ``{id}`` / ``{uuid}`` /
+    ``{hash}`` / ``{slug}`` placeholders. Hash routes are templated the same way.
+    """
+    return _template(url, rules or [], AUTO_DETECT)
+
+
+def normalize(url: Optional[str]) -> str:
+    """``url`` as ``template`` writes it, without replacing any segment."""
+    return _template(url, [], False)
+
+
+def _template(url: Optional[str], rules: List[tuple], auto: bool) -> str:
+    parsed = urlparse((url or "").strip())
+    path = _template_path(_PATH_PARAMS_RE.sub("", parsed.path), rules, auto)
+    # 单页应用的 #/route 才是真正的页面,保留
+    route = parsed.fragment.split("?", 1)[0]
+    fragment = _template_path(route, rules, auto) if route.startswith("/") else ""
+    return urlunparse(
+        parsed._replace(
+            scheme=parsed.scheme.lower(),
+            netloc=parsed.netloc.lower(),
+            path=path,
+            params="",
+            query="",
+            fragment=fragment,
+        )
+    )
+
+
+def backbone_signature(html: Optional[str]) -> str:
+    """Hash of the distinct tag paths under ``<body>``.
+
+    Repeated siblings collapse, so a product page with three reviews and one
+    with thirty share a signature while a different layout does not. Raw
+    HTML and its structure-only backbone give the same signature, so a page
+    can be checked against a stored backbone with a regex scan instead of a
+    full parse.
+    """
+    markup = _SKIPPED_RE.sub("", _COMMENT_RE.sub("", html or ""))
+    body = _BODY_RE.search(markup)
+    if body is not None:
+        markup = markup[body.end() :]
+    stack, paths = [], set()
+    for closing, tag, self_closing in _TAG_RE.findall(markup):
+        tag = tag.lower()
+        if tag in _IMPLIED_TAGS or tag in BLACKLIST:
+            continue
+        if closing:
+            if tag in stack:
+                del stack[len(stack) - 1 - stack[::-1].index(tag) :]
+            continue
+        if tag in _IMPLIED_END and stack and stack[-1] == tag:
+            # <li>a<li>b 里第二个 <li> 隐式结束了第一个
+            stack.pop()
+        paths.add("/".join(stack + [tag]))
+        if not self_closing and tag not in _VOID_TAGS:
+            stack.append(tag)
+    return hashlib.sha256("\n".join(sorted(paths)).encode("utf-8")).hexdigest()
@@ -1,12 +1,27 @@
+from typing import Optional
+
 from bs4 import BeautifulSoup
 from lxml import etree
 
 
 class SelectorValidator:
-    def __init__(self, html: str):
+    def __init__(self, html: str, soup: Optional[BeautifulSoup] = None, tree=None):
         self.html = html
-        self.soup = BeautifulSoup(html, "html.parser")
-        self.tree = etree.HTML(html)
+        self._soup = soup
+        self._tree = tree
+
+    @property
+    def soup(self) -> BeautifulSoup:
+        if self._soup is None:
+            self._soup = BeautifulSoup(self.html, "html.parser")
+        return self._soup
+
+    @property
+    def tree(self):
+        # lxml 树只在校验 xpath 时才需要,按需构建
+        if self._tree is None:
+            self._tree = etree.HTML(self.html)
+        return self._tree
 
     def verify(self, type_: str, selector: str) -> bool:
         try:
@@ -1,9 +1,12 @@
 import os
 import time
 import functools
+import threading
 from pathlib import Path
 
 from enum import Enum
+from typing import List
+
 from pydantic import BaseModel, Field
 
 from langchain.chat_models import init_chat_model
@@ -40,6 +43,9 @@ def retry(
         backoff: Multiplier applied to delay after each failure.
         logger_enabled: Whether to log retry attempts.
 
+    Only for blocking callables; coroutines are retried with
+    ``deadline.retry_call`` so retries respect the request deadline.
+
     Usage:
         @retry(max_attempts=5, delay=2)
         def unstable_operation():
@@ -70,9 +76,19 @@ def retry(
     return decorator
 
 
+# prompt 文件内容缓存,文件修改(mtime 变化)后自动重新读取
+_prompts: dict = {}
+
+
 def load_prompt(file_path: str) -> str:
     prompt_path = Path(__file__).parent / "prompts" / file_path
-    return prompt_path.read_text(encoding="utf-8").strip()
+    mtime = prompt_path.stat().st_mtime_ns
+    cached = _prompts.get(prompt_path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    text = prompt_path.read_text(encoding="utf-8").strip()
+    _prompts[prompt_path] = (mtime, text)
+    return text
 
 
 # ------------------ Pydantic Schema ------------------
@@ -97,6 +113,22 @@ class Selector(BaseModel):
     action_value: str = Field(description="The action value, the str you want to type")
 
 
+class ElementPick(BaseModel):
+    element_index: int = Field(
+        description="The number of the target element, 0 if no such element exists"
+    )
+    action_type: str = Field(
+        description="The action type, only include: click, type, and empty"
+    )
+    action_value: str = Field(description="The action value, the str you want to type")
+
+
+class SelectorBatch(BaseModel):
+    selectors: List[Selector] = Field(
+        description="One selector per numbered instruction, in the same order"
+    )
+
+
 class Validator(BaseModel):
     result: bool = Field(description="Whether the user description is true/false")
     reason: str = Field(description="The reason why the user description is true/false")
@@ -105,6 +137,45 @@ class Validator(BaseModel):
 # ------------------ LLM Function Call ------------------
 
 
+# (model, provider, tool) -> bound chain. The chat model keeps its HTTP
+# client, so connections and TLS sessions are reused across requests.
+_chains: dict = {}
+_chains_lock = threading.Lock()
+
+
+def get_chain(model, model_provider, tool):
+    key = (model, model_provider, tool)
+    chain = _chains.get(key)
+    if chain is not None:
+        return chain
+    with _chains_lock:
+        chain = _chains.get(key)
+        if chain is None:
+            logger.info(f"Initializing LLM chain for {model_provider}:{model}")
+            llm = init_chat_model(model, model_provider=model_provider)
+            chain = llm.bind_tools([tool]) | PydanticToolsParser(tools=[tool])
+            _chains[key] = chain
+    return chain
+
+
+def clear_chains() -> None:
+    with _chains_lock:
+        _chains.clear()
+
+
+def _selector_query(
+    user_instruction, html, conversation_history=None, prompt="locator_prompt.txt"
+) -> str:
+    query = load_prompt(prompt)
+    if conversation_history:
+        query += "\n\n## Conversation History:"
+        for user_message, assistant_message in conversation_history:
+            query += f"\n\nUser: {user_message}\n\nAssistant: {assistant_message}"
+    query += f"\n\n## HTML: \n{html}\n\nUser: {user_instruction}\n\nAssistant:"
+    logger.debug(f"Query for LLM: {query[0:100]}")
+    return query
+
+
 def call_selector_llm(
     user_instruction,
     html,
@@ -114,31 +185,120 @@ def call_selector_llm(
     metadata={},
 ) -> Selector:
     logger.warning("Calling LLM for selector generation...")
-    llm = init_chat_model(model, model_provider=model_provider)
-    chain = llm.bind_tools([Selector]) | PydanticToolsParser(tools=[Selector])
+    chain = get_chain(model, model_provider, Selector)
+    query = _selector_query(user_instruction, html, conversation_history)
+    try:
+        response = chain.invoke(
+            query, config={"callbacks": [langfuse_handler], "metadata": metadata}
+        )[0]
+        return response
+    except Exception as e:
+        logger.error(f"Query failed: {e}")
+
+
+async def acall_selector_llm(
+    user_instruction,
+    html,
+    model,
+    model_provider,
+    conversation_history=None,
+    metadata={},
+) -> Selector:
+    """Async variant of ``call_selector_llm`` built on ``chain.ainvoke``."""
+    logger.warning("Calling LLM for selector generation...")
+    chain = get_chain(model, model_provider, Selector)
+    query = _selector_query(user_instruction, html, conversation_history)
+    try:
+        response = (
+            await chain.ainvoke(
+                query, config={"callbacks": [langfuse_handler], "metadata": metadata}
+            )
+        )[0]
+        return response
+    except Exception as e:
+        logger.error(f"Query failed: {e}")
+
+
+async def acall_element_index_llm(
+    user_instruction,
+    html,
+    model,
+    model_provider,
+    conversation_history=None,
+    metadata={},
+) -> ElementPick:
+    """Ask for the number of the target element in an index-annotated page."""
+    logger.warning("Calling LLM for element index...")
+    chain = get_chain(model, model_provider, ElementPick)
+    query = _selector_query(
+        user_instruction, html, conversation_history, "locator_index_prompt.txt"
+    )
+    try:
+        response = (
+            await chain.ainvoke(
+                query, config={"callbacks": [langfuse_handler], "metadata": metadata}
+            )
+        )[0]
+        return response
+    except Exception as e:
+        logger.error(f"Query failed: {e}")
+
 
+def _selector_batch_query(instructions, html, conversation_history=None) -> str:
     query = load_prompt("locator_prompt.txt")
+    query += (
+        "\n\n## Batch\n"
+        "Several instructions refer to the same HTML. Apply the rules to each "
+        "numbered instruction independently and return exactly one selector per "
+        "instruction, in the same order, in a single function call."
+    )
     if conversation_history:
         query += "\n\n## Conversation History:"
         for user_message, assistant_message in conversation_history:
             query += f"\n\nUser: {user_message}\n\nAssistant: {assistant_message}"
-    query += f"\n\n## HTML: \n{html}\n\nUser: {user_instruction}\n\nAssistant:"
+    numbered = "\n".join(f"{i}. {text}" for i, text in enumerate(instructions, 1))
+    query += f"\n\n## HTML: \n{html}\n\nUser instructions:\n{numbered}\n\nAssistant:"
     logger.debug(f"Query for LLM: {query[0:100]}")
+    return query
+
+
+async def acall_selector_batch_llm(
+    instructions,
+    html,
+    model,
+    model_provider,
+    conversation_history=None,
+    metadata={},
+) -> List[Selector]:
+    """Resolve several instructions against one HTML in a single LLM call.
+
+    Returns one ``Selector`` per instruction (in order), or None on failure.
+    """
+    logger.warning(f"Calling LLM for {len(instructions)} selectors...")
+    chain = get_chain(model, model_provider, SelectorBatch)
+    query = _selector_batch_query(instructions, html, conversation_history)
     try:
-        response = chain.invoke(
-            query, config={"callbacks": [langfuse_handler], "metadata": metadata}
+        response = (
+            await chain.ainvoke(
+                query, config={"callbacks": [langfuse_handler], "metadata": metadata}
+            )
         )[0]
-        return response
     except Exception as e:
         logger.error(f"Query failed: {e}")
+        return None
+    if len(response.selectors) != len(instructions):
+        logger.error(
+            f"Batch query returned {len(response.selectors)} selectors for {len(instructions)} instructions"
+        )
+        return None
+    return response.selectors
 
 
 def call_validator_llm(
     user_instruction, html, css_style, model, model_provider, conversation_history=None
 ) -> Validator:
     logger.warning("Calling validator LLM...")
-    llm = init_chat_model(model, model_provider=model_provider)
-    chain = llm.bind_tools([Validator]) | PydanticToolsParser(tools=[Validator])
+    chain = get_chain(model, model_provider, Validator)
 
     query = load_prompt("validator_prompt.txt")
     if conversation_history:
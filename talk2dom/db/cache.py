@@ -1,30 +1,93 @@
-from talk2dom.db.models import UILocatorCache, HTML
+from talk2dom.api.utils import instruction as instruction_utils
+from talk2dom.api.utils import metrics, offload, simhash, url_template
+from talk2dom.db import local_cache, write_behind
+from talk2dom.db.models import UILocatorCache, HTML, HTMLSimhashBand
 from talk2dom.db.session import SessionLocal
+from sqlalchemy import or_
 from sqlalchemy.dialects.postgresql import insert
 from datetime import datetime
 
+import asyncio
 import hashlib
 from loguru import logger
 from typing import Optional
 import os
 import redis  # type: ignore
+import redis.asyncio as aioredis  # type: ignore
 
 _redis_client = None
+_aredis_client = None
 
+# 连接池大小;池满时最多等 _POOL_TIMEOUT 秒拿连接,超时按 Redis 不可用处理
+_MAX_CONNECTIONS = int(os.getenv("T2D_REDIS_MAX_CONNECTIONS", "50"))
+_POOL_TIMEOUT = float(os.getenv("T2D_REDIS_POOL_TIMEOUT", "1"))
+_SOCKET_TIMEOUT = float(os.getenv("T2D_REDIS_SOCKET_TIMEOUT", "0.5"))
 
-def _redis():
-    global _redis_client
-    if _redis_client is not None:
-        return _redis_client
-    url = (
+
+def _redis_url() -> str:
+    return (
         os.getenv("T2D_REDIS_URL")
         or os.getenv("REDIS_URL")
         or "redis://localhost:6379/0"
     )
-    _redis_client = redis.from_url(url, decode_responses=True, socket_timeout=0.5)
+
+
+def _pool_kwargs() -> dict:
+    return {
+        "max_connections": _MAX_CONNECTIONS,
+        "timeout": _POOL_TIMEOUT,
+        "decode_responses": True,
+        "socket_timeout": _SOCKET_TIMEOUT,
+        "socket_connect_timeout": _SOCKET_TIMEOUT,
+    }
+
+
+def _redis():
+    global _redis_client
+    if _redis_client is not None:
+        return _redis_client
+    pool = redis.BlockingConnectionPool.from_url(_redis_url(), **_pool_kwargs())
+    _redis_client = redis.Redis(connection_pool=pool)
     return _redis_client
 
 
+def _aredis():
+    """Async client used by the async locator endpoints."""
+    global _aredis_client
+    if _aredis_client is not None:
+        return _aredis_client
+    pool = aioredis.BlockingConnectionPool.from_url(_redis_url(), **_pool_kwargs())
+    _aredis_client = aioredis.Redis(connection_pool=pool)
+    return _aredis_client
+
+
+def _pool_usage(client) -> Optional[dict]:
+    if client is None:
+        return None
+    pool = client.connection_pool
+    if hasattr(pool, "_in_use_connections"):
+        in_use = len(pool._in_use_connections)
+        idle = len(pool._available_connections)
+    else:
+        # 同步 BlockingConnectionPool: 队列里的 None 是尚未创建的连接
+        idle = sum(1 for conn in list(pool.pool.queue) if conn is not None)
+        in_use = len(pool._connections) - idle
+    return {"in_use": in_use, "idle": idle, "max": pool.max_connections}
+
+
+def pool_stats() -> dict:
+    """Connection usage of the sync and async Redis pools (also recorded as gauges)."""
+    stats = {}
+    for name, client in (("sync", _redis_client), ("async", _aredis_client)):
+        usage = _pool_usage(client)
+        if usage is None:
+            continue
+        stats[name] = usage
+        metrics.gauge(f"redis.pool.{name}.in_use", usage["in_use"])
+        metrics.gauge(f"redis.pool.{name}.idle", usage["idle"])
+    return stats
+
+
 # Redis cache settings
 _TTL_SECONDS = int(os.getenv("T2D_REDIS_TTL", "86400"))  # default 1 day
 _NS = os.getenv("T2D_REDIS_NS", "t2d:v1")
@@ -40,23 +103,31 @@ def _redis_set_locator(
     selector_value: Optional[str],
     action: Optional[str],
 ) -> None:
-    r = _redis()
     logger.debug(f"Redis set locator {locator_id}")
+    mapping = _locator_mapping(selector_type, selector_value, action)
+    # HSET 与 EXPIRE 放在同一个 pipeline 里,一次往返
+    with _redis().pipeline(transaction=False) as pipe:
+        pipe.hset(_locator_key(locator_id), mapping=mapping)
+        if _TTL_SECONDS > 0:
+            pipe.expire(_locator_key(locator_id), _TTL_SECONDS)
+        pipe.execute()
+    local_cache.locators.set(locator_id, _locator_from_hash(mapping))
+
+
+def _locator_mapping(
+    selector_type: Optional[str],
+    selector_value: Optional[str],
+    action: Optional[str],
+) -> dict:
     # Use a compact hash to avoid JSON overhead
-    mapping = {
+    return {
         "t": selector_type or "",
         "v": selector_value or "",
         "a": action or "",
     }
-    r.hset(_locator_key(locator_id), mapping=mapping)
-    if _TTL_SECONDS > 0:
-        r.expire(_locator_key(locator_id), _TTL_SECONDS)
 
 
-def _redis_get_locator(locator_id: str) -> tuple:
-    r = _redis()
-    data = r.hgetall(_locator_key(locator_id))
-    logger.debug(f"Redis get locator {locator_id}")
+def _locator_from_hash(data: dict) -> tuple:
     if not data:
         return None, None, None
     t = data.get("t") or None
@@ -67,6 +138,177 @@ def _redis_get_locator(locator_id: str) -> tuple:
     return t, v, a
 
 
+def _redis_get_locator(locator_id: str) -> tuple:
+    r = _redis()
+    data = r.hgetall(_locator_key(locator_id))
+    logger.debug(f"Redis get locator {locator_id}")
+    return _locator_from_hash(data)
+
+
+async def _aredis_set_locator(
+    locator_id: str,
+    selector_type: Optional[str],
+    selector_value: Optional[str],
+    action: Optional[str],
+) -> None:
+    await _aredis_set_locators({locator_id: (selector_type, selector_value, action)})
+
+
+async def _aredis_set_locators(rows: dict) -> None:
+    """Write ``{locator_id: (type, value, action)}`` in one pipeline round trip."""
+    if not rows:
+        return
+    logger.debug(f"Redis set {len(rows)} locators")
+    mappings = {locator_id: _locator_mapping(*row) for locator_id, row in rows.items()}
+    async with _aredis().pipeline(transaction=False) as pipe:
+        for locator_id, mapping in mappings.items():
+            pipe.hset(_locator_key(locator_id), mapping=mapping)
+            if _TTL_SECONDS > 0:
+                pipe.expire(_locator_key(locator_id), _TTL_SECONDS)
+        await pipe.execute()
+    for locator_id, mapping in mappings.items():
+        local_cache.locators.set(locator_id, _locator_from_hash(mapping))
+
+
+async def _aredis_get_locator(locator_id: str) -> tuple:
+    r = _aredis()
+    data = await r.hgetall(_locator_key(locator_id))
+    logger.debug(f"Redis get locator {locator_id}")
+    return _locator_from_hash(data)
+
+
+async def _aredis_get_locators(locator_ids: list) -> dict:
+    """``{locator_id: (type, value, action)}`` for many ids in one pipeline round trip."""
+    if not locator_ids:
+        return {}
+    async with _aredis().pipeline(transaction=False) as pipe:
+        for locator_id in locator_ids:
+            pipe.hgetall(_locator_key(locator_id))
+        hashes = await pipe.execute()
+    return {
+        locator_id: _locator_from_hash(data)
+        for locator_id, data in zip(locator_ids, hashes)
+    }
+
+
+# ------------------ L1 invalidation ------------------
+_INVALIDATION_CHANNEL = f"{_NS}:invalidate"
+_listener = None
+
+
+def _publish_invalidation(locator_id: str) -> None:
+    try:
+        _redis().publish(_INVALIDATION_CHANNEL, local_cache.message(locator_id))
+    except Exception as e:
+        logger.warning(f"L1 invalidation publish failed for {locator_id}: {e}")
+
+
+async def _apublish_invalidation(locator_id: str) -> None:
+    try:
+        await _aredis().publish(_INVALIDATION_CHANNEL, local_cache.message(locator_id))
+    except Exception as e:
+        logger.warning(f"L1 invalidation publish failed for {locator_id}: {e}")
+
+
+def start_invalidation_listener() -> None:
+    """Subscribe to other pods' locator invalidations (app startup)."""
+    global _listener
+    if _listener is None:
+        # 订阅连接会长时间空闲,不能用带 socket_timeout 的共享客户端
+        _listener = local_cache.InvalidationListener(
+            lambda: redis.from_url(
+                _redis_url(), decode_responses=True, health_check_interval=30
+            ),
+            _INVALIDATION_CHANNEL,
+        )
+    _listener.start()
+
+
+def stop_invalidation_listener() -> None:
+    if _listener is not None:
+        _listener.stop()
+
+
+# "not found" 结果的短期缓存,键里带原始 html 的摘要,页面一变就失效;0 表示关闭
+_NEGATIVE_TTL_SECONDS = int(os.getenv("T2D_NEGATIVE_TTL", "30"))
+
+
+def _negative_key(locator_id: str, html_digest: str) -> str:
+    return f"{_NS}:neg:{locator_id}:{html_digest}"
+
+
+async def aget_negative_locator(locator_id: str, html_digest: str) -> Optional[str]:
+    """Return the cached action if this exact page recently had no such element."""
+    if _NEGATIVE_TTL_SECONDS <= 0:
+        return None
+    try:
+        action = await _aredis().get(_negative_key(locator_id, html_digest))
+    except Exception as e:
+        logger.warning(f"Negative cache lookup failed for {locator_id}: {e}")
+        return None
+    metrics.incr("negative_cache.hit" if action is not None else "negative_cache.miss")
+    return action
+
+
+async def asave_negative_locator(
+    locator_id: str, html_digest: str, action: Optional[str] = None
+) -> None:
+    if _NEGATIVE_TTL_SECONDS <= 0:
+        return
+    try:
+        await _aredis().set(
+            _negative_key(locator_id, html_digest),
+            action or "",
+            ex=_NEGATIVE_TTL_SECONDS,
+        )
+        metrics.incr("negative_cache.store")
+    except Exception as e:
+        logger.warning(f"Negative cache store failed for {locator_id}: {e}")
+
+
+def _backbone_key(html_id: str) -> str:
+    return f"{_NS}:bb:{html_id}"
+
+
+def _db_get_backbone(html_id: str) -> Optional[str]:
+    session = SessionLocal()
+    try:
+        row = session.query(HTML.backbone).filter(HTML.id == html_id).first()
+        return row[0] if row else None
+    finally:
+        session.close()
+
+
+async def aget_backbone_signature(html_id: str) -> Optional[str]:
+    """Signature of the backbone stored for ``html_id``, None if none is stored yet."""
+    if SessionLocal is None:
+        return None
+    key = _backbone_key(html_id)
+    try:
+        signature = await _aredis().get(key)
+    except Exception as e:
+        logger.warning(f"Backbone signature lookup failed for {html_id}: {e}")
+        signature = None
+    if signature:
+        return signature
+    backbone = await asyncio.to_thread(_db_get_backbone, html_id)
+    if backbone is None:
+        return None
+    signature = url_template.backbone_signature(backbone)
+    try:
+        await _aredis().set(
+            key, signature, ex=_TTL_SECONDS if _TTL_SECONDS > 0 else None
+        )
+    except Exception as e:
+        logger.warning(f"Backbone signature store failed for {html_id}: {e}")
+    return signature
+
+
+def compute_html_id(url: Optional[str], html: Optional[str]) -> str:
+    src = (url or "").strip() or (html or "")
+    return hashlib.sha256(src.encode("utf-8")).hexdigest()
+
+
 def compute_locator_id(
     instruction: str,
     html_id: str,
@@ -83,39 +325,346 @@ def compute_locator_id(
     return uuid
 
 
+def _db_get_locator(locator_id: str) -> Optional[tuple]:
+    session = SessionLocal()
+    try:
+        row = session.query(UILocatorCache).filter_by(id=locator_id).first()
+        if not row:
+            logger.debug(f"DB miss for locator ID: {locator_id}")
+            return None
+        logger.debug(f"DB hit for locator ID: {locator_id}")
+        return row.selector_type, row.selector_value, row.action
+    finally:
+        session.close()
+
+
 def get_cached_locator(
     instruction: str,
     html: str,
     url: Optional[str] = None,
     project_id: Optional[str] = "",
+    html_id: Optional[str] = None,
 ) -> tuple:
     if SessionLocal is None:
         return None, None, None
 
-    src = (url or "").strip() or (html or "")
-    html_id = hashlib.sha256(src.encode("utf-8")).hexdigest()
+    html_id = html_id or compute_html_id(url, html)
     locator_id = compute_locator_id(instruction, html_id, url, project_id)
 
+    hit = local_cache.locators.get(locator_id)
+    if hit is not None:
+        metrics.incr("locator_cache.l1_hit")
+        return hit
+
     # Try Redis first
     t, v, a = _redis_get_locator(locator_id)
     if t or v or a:
         logger.debug(f"Redis hit for locator ID: {locator_id}")
+        metrics.incr("locator_cache.l2_hit")
+        local_cache.locators.set(locator_id, (t, v, a))
         return t, v, a
 
+    row = _db_get_locator(locator_id)
+    if row is None:
+        metrics.incr("locator_cache.miss")
+        return None, None, None
+    metrics.incr("locator_cache.db_hit")
+    # Backfill Redis for subsequent lookups
+    _redis_set_locator(locator_id, *row)
+    return row
+
+
+async def aget_cached_locator(
+    instruction: str,
+    html: str,
+    url: Optional[str] = None,
+    project_id: Optional[str] = "",
+    html_id: Optional[str] = None,
+) -> tuple:
+    """Async ``get_cached_locator``: async Redis, DB fallback off the event loop."""
+    if SessionLocal is None:
+        return None, None, None
+
+    html_id = html_id or compute_html_id(url, html)
+    locator_id = compute_locator_id(instruction, html_id, url, project_id)
+
+    hit = local_cache.locators.get(locator_id)
+    if hit is not None:
+        metrics.incr("locator_cache.l1_hit")
+        return hit
+
+    t, v, a = await _aredis_get_locator(locator_id)
+    if t or v or a:
+        logger.debug(f"Redis hit for locator ID: {locator_id}")
+        metrics.incr("locator_cache.l2_hit")
+        local_cache.locators.set(locator_id, (t, v, a))
+        return t, v, a
+
+    row = await asyncio.to_thread(_db_get_locator, locator_id)
+    if row is None:
+        metrics.incr("locator_cache.miss")
+        return None, None, None
+    metrics.incr("locator_cache.db_hit")
+    await _aredis_set_locator(locator_id, *row)
+    return row
+
+
+def _db_get_locators(locator_ids: list) -> dict:
     session = SessionLocal()
     try:
-        row = session.query(UILocatorCache).filter_by(id=locator_id).first()
-        if not row:
-            logger.debug(f"DB miss for locator ID: {locator_id}")
-            return None, None, None
-        logger.debug(f"DB hit for locator ID: {locator_id}")
-        # Backfill Redis for subsequent lookups
-        _redis_set_locator(
-            locator_id, row.selector_type, row.selector_value, row.action
+        rows = (
+            session.query(UILocatorCache)
+            .filter(UILocatorCache.id.in_(locator_ids))
+            .all()
+        )
+        return {
+            row.id: (row.selector_type, row.selector_value, row.action) for row in rows
+        }
+    finally:
+        session.close()
+
+
+async def aget_cached_locators(
+    instructions: list,
+    url: Optional[str] = None,
+    project_id: Optional[str] = "",
+    html_id: Optional[str] = None,
+) -> list:
+    """Batch ``aget_cached_locator`` for several instructions on one page.
+
+    Redis is read in one pipeline round trip and the misses are looked up in a
+    single DB query. Returns one ``(type, value, action)`` tuple per instruction.
+    """
+    if SessionLocal is None or not instructions:
+        return [(None, None, None)] * len(instructions)
+
+    locator_ids = [
+        compute_locator_id(instruction, html_id, url, project_id)
+        for instruction in instructions
+    ]
+    results = [local_cache.locators.get(locator_id) for locator_id in locator_ids]
+    metrics.incr("locator_cache.l1_hit", sum(1 for r in results if r is not None))
+    remote = [
+        locator_id for locator_id, result in zip(locator_ids, results) if result is None
+    ]
+    if not remote:
+        return results
+
+    fetched = await _aredis_get_locators(remote)
+    for locator_id, result in fetched.items():
+        if any(result):
+            local_cache.locators.set(locator_id, result)
+    results = [
+        fetched[locator_id] if result is None else result
+        for locator_id, result in zip(locator_ids, results)
+    ]
+
+    missing = [locator_id for locator_id in remote if not any(fetched[locator_id])]
+    metrics.incr("locator_cache.l2_hit", len(remote) - len(missing))
+    if not missing:
+        logger.debug(f"Redis hit for all {len(locator_ids)} locators")
+        return results
+
+    found = await asyncio.to_thread(_db_get_locators, missing)
+    metrics.incr("locator_cache.db_hit", len(found))
+    metrics.incr("locator_cache.miss", len(missing) - len(found))
+    # Backfill Redis for subsequent lookups
+    await _aredis_set_locators(found)
+    logger.debug(
+        f"Batch lookup: {len(locator_ids) - len(missing)} Redis hits, {len(found)} DB hits"
+    )
+    return [
+        found.get(locator_id, result) if not any(result) else result
+        for locator_id, result in zip(locator_ids, results)
+    ]
+
+
+# ------------------ Similar-instruction index ------------------
+# 每个 (html_id, project) 一个 Redis hash: 规范化后的指令 -> locator_id
+_INDEX_MAX_ENTRIES = 1000
+
+
+def _index_key(html_id: str, project_id) -> str:
+    return f"{_NS}:idx:{html_id}:{project_id or ''}"
+
+
+def _evictable(fields, keep: set, excess: int) -> list:
+    return [f for f in fields if f not in keep][:excess]
+
+
+def _redis_index_locator(html_id, project_id, instruction, locator_id) -> None:
+    key = _index_key(html_id, project_id)
+    field = instruction_utils.canonicalize(instruction)
+    try:
+        client = _redis()
+        with client.pipeline(transaction=False) as pipe:
+            pipe.hset(key, mapping={field: locator_id})
+            if _TTL_SECONDS > 0:
+                pipe.expire(key, _TTL_SECONDS)
+            pipe.hlen(key)
+            size = pipe.execute()[-1]
+        # 超出上限时随机淘汰旧指令, 保留刚写入的
+        excess = int(size or 0) - _INDEX_MAX_ENTRIES
+        if excess > 0:
+            victims = _evictable(client.hrandfield(key, excess + 1), {field}, excess)
+            if victims:
+                client.hdel(key, *victims)
+    except Exception as e:
+        logger.warning(f"Instruction index update failed for {locator_id}: {e}")
+
+
+async def _aredis_hset(key: str, mapping: dict) -> None:
+    client = _aredis()
+    async with client.pipeline(transaction=False) as pipe:
+        pipe.hset(key, mapping=mapping)
+        if _TTL_SECONDS > 0:
+            pipe.expire(key, _TTL_SECONDS)
+        pipe.hlen(key)
+        size = (await pipe.execute())[-1]
+    excess = int(size or 0) - _INDEX_MAX_ENTRIES
+    if excess > 0:
+        victims = _evictable(
+            await client.hrandfield(key, excess + len(mapping)), set(mapping), excess
+        )
+        if victims:
+            await client.hdel(key, *victims)
+
+
+async def _aredis_index_locator(html_id, project_id, instruction, locator_id) -> None:
+    key = _index_key(html_id, project_id)
+    try:
+        await _aredis_hset(
+            key, {instruction_utils.canonicalize(instruction): locator_id}
+        )
+    except Exception as e:
+        logger.warning(f"Instruction index update failed for {locator_id}: {e}")
+
+
+def _db_index_entries(html_id: str, project_id) -> dict:
+    session = SessionLocal()
+    try:
+        query = session.query(UILocatorCache.id, UILocatorCache.user_instruction)
+        query = query.filter(UILocatorCache.html_id == html_id)
+        if project_id:
+            query = query.filter(UILocatorCache.project_id == project_id)
+        else:
+            query = query.filter(UILocatorCache.project_id.is_(None))
+        rows = query.limit(_INDEX_MAX_ENTRIES).all()
+        return {
+            instruction_utils.canonicalize(user_instruction): locator_id
+            for locator_id, user_instruction in rows
+        }
+    finally:
+        session.close()
+
+
+async def _index_entries(html_id: str, project_id) -> dict:
+    key = _index_key(html_id, project_id)
+    entries = await _aredis().hgetall(key)
+    if entries:
+        return entries
+    # Redis 里没有时从库里重建索引
+    entries = await asyncio.to_thread(_db_index_entries, html_id, project_id)
+    if entries:
+        await _aredis_hset(key, entries)
+    return entries
+
+
+async def aget_similar_locator(
+    instruction: str,
+    html_id: str,
+    project_id: Optional[str] = "",
+) -> Optional[tuple]:
+    """Cached locator of the most similar instruction on the same page.
+
+    Returns ``(selector_type, selector_value, action, similarity)`` or None.
+    Typing actions are only reused for the same canonical instruction, since
+    the typed text comes from the instruction itself.
+    """
+    if SessionLocal is None or instruction_utils.FUZZY_THRESHOLD <= 0:
+        return None
+    canonical = instruction_utils.canonicalize(instruction)
+    if not canonical:
+        return None
+    try:
+        entries = await _index_entries(html_id, project_id)
+        match = instruction_utils.best_match(canonical, entries)
+        if match is None:
+            return None
+        locator_id = entries[match[0]]
+        t, v, a = await _aredis_get_locator(locator_id)
+        if not (t or v or a):
+            row = await asyncio.to_thread(_db_get_locator, locator_id)
+            if row is None:
+                return None
+            t, v, a = row
+    except Exception as e:
+        logger.warning(f"Similar-instruction lookup failed: {e}")
+        return None
+    if match[1] < 1.0 and (a or "").startswith("type"):
+        return None
+    logger.debug(f"Similar instruction {match[0]!r} ({match[1]:.2f}) for {canonical!r}")
+    return t, v, a, match[1]
+
+
+# ------------------ Nearest backbone snapshots ------------------
+_NEAREST_LIMIT = 3
+
+
+def _db_nearest_html_ids(fp: int, exclude: str) -> list:
+    session = SessionLocal()
+    try:
+        band_filters = [
+            (HTMLSimhashBand.band == i) & (HTMLSimhashBand.value == value)
+            for i, value in enumerate(simhash.bands(fp))
+        ]
+        rows = (
+            session.query(HTML.id, HTML.simhash)
+            .join(HTMLSimhashBand, HTMLSimhashBand.html_id == HTML.id)
+            .filter(or_(*band_filters), HTML.id != exclude)
+            .distinct()
+            .limit(200)
+            .all()
         )
-        return row.selector_type, row.selector_value, row.action
     finally:
         session.close()
+    nearest = []
+    for html_id, value in rows:
+        d = simhash.distance(fp, simhash.from_hex(value))
+        if d <= simhash.MAX_DISTANCE:
+            nearest.append((d, html_id))
+    nearest.sort()
+    return nearest[:_NEAREST_LIMIT]
+
+
+async def aget_nearest_locators(
+    instruction: str,
+    structure_html: str,
+    html_id: str,
+    project_id: Optional[str] = "",
+) -> list:
+    """Locators cached for this instruction on structurally near-identical snapshots.
+
+    Returns ``[(selector_type, selector_value, action, distance), ...]``,
+    nearest first; callers must still verify them against the page.
+    """
+    if SessionLocal is None or simhash.MAX_DISTANCE <= 0:
+        return []
+    found = []
+    try:
+        fp = await offload.run(
+            simhash.fingerprint, structure_html, size=len(structure_html)
+        )
+        nearest = await asyncio.to_thread(_db_nearest_html_ids, fp, html_id)
+        for d, near_id in nearest:
+            t, v, a = await aget_cached_locator(
+                instruction, None, None, project_id, html_id=near_id
+            )
+            if t and v:
+                found.append((t, v, a, d))
+    except Exception as e:
+        logger.warning(f"Nearest snapshot lookup failed: {e}")
+    return found
 
 
 def locator_exists(locator_id) -> bool:
@@ -142,37 +691,155 @@ def locator_exists(locator_id) -> bool:
 
 
 def invalidate_locator_cache(locator_id: str) -> None:
-    """Drop the Redis entry for a locator (used when admin deletes a cache row)."""
+    """Drop the Redis and L1 entries for a locator (used when admin deletes a cache row)."""
+    local_cache.locators.delete(locator_id)
     try:
         _redis().delete(_locator_key(locator_id))
     except Exception as e:
         logger.warning(f"Redis invalidate failed for {locator_id}: {e}")
+    _publish_invalidation(locator_id)
 
 
-def save_locator(
+def _locator_html_id(url, html_backbone, html, html_id) -> str:
+    if html_id:
+        return html_id
+    src = (url or "").strip() or (html_backbone or "").strip() or (html or "")
+    return hashlib.sha256(src.encode("utf-8")).hexdigest()
+
+
+def _snapshot_fingerprint(url, html_backbone) -> Optional[int]:
+    # 没有 url 的页面按骨架指纹建索引,供近似快照查找
+    if url or simhash.MAX_DISTANCE <= 0:
+        return None
+    return simhash.fingerprint(html_backbone)
+
+
+_LOCATOR_COLUMNS = (
+    "url",
+    "user_instruction",
+    "html_id",
+    "selector_type",
+    "selector_value",
+    "action",
+)
+
+
+def _db_save_locators(entries: list) -> None:
+    """Persist a batch of queued ``asave_locator`` writes in one transaction.
+
+    Snapshots and locators are written with one multi-row
+    ``INSERT ... ON CONFLICT`` each. If the batch fails the entries are
+    retried one by one; only when none of them can be saved does this raise,
+    so the batch stays queued.
+    """
+    session = SessionLocal()
+    try:
+        snapshots = {}
+        for entry in entries:
+            snapshots.setdefault(entry["html_id"], entry)
+        fingerprints = {
+            html_id: _snapshot_fingerprint(entry["url"], entry["html_backbone"])
+            for html_id, entry in snapshots.items()
+        }
+        inserted = session.execute(
+            insert(HTML)
+            .values(
+                [
+                    {
+                        "id": html_id,
+                        "url": entry["url"] or "",
+                        "backbone": entry["html_backbone"],
+                        "row_html": entry["html"],
+                        "simhash": (
+                            simhash.to_hex(fingerprints[html_id])
+                            if fingerprints[html_id] is not None
+                            else None
+                        ),
+                    }
+                    for html_id, entry in snapshots.items()
+                ]
+            )
+            .on_conflict_do_nothing(index_elements=["id"])
+            .returning(HTML.id)
+        ).scalars()
+        bands = [
+            {"html_id": html_id, "band": i, "value": value}
+            for html_id in inserted
+            if fingerprints[html_id] is not None
+            for i, value in enumerate(simhash.bands(fingerprints[html_id]))
+        ]
+        if bands:
+            session.execute(insert(HTMLSimhashBand).values(bands))
+
+        # 同一条语句里不能两次更新同一行,同一 locator 只保留最后一次写入
+        locators = {entry["locator_id"]: entry for entry in entries}
+        stmt = insert(UILocatorCache).values(
+            [
+                {
+                    "id": locator_id,
+                    "url": entry["url"],
+                    "user_instruction": entry["instruction"],
+                    "html_id": entry["html_id"],
+                    "selector_type": entry["selector_type"],
+                    "selector_value": entry["selector_value"],
+                    "action": entry["action"],
+                    "project_id": entry["project_id"],
+                }
+                for locator_id, entry in locators.items()
+            ]
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["id"],
+            set_={
+                **{column: stmt.excluded[column] for column in _LOCATOR_COLUMNS},
+                "updated_at": datetime.utcnow(),
+            },
+        )
+        session.execute(stmt)
+        session.commit()
+        logger.debug(f"Saved {len(locators)} locators in one batch")
+        return
+    except Exception as e:
+        session.rollback()
+        logger.warning(f"Batch locator save failed, retrying one by one: {e}")
+    finally:
+        session.close()
+
+    failed = [entry for entry in entries if not _db_save_locator(**entry)]
+    if failed and len(failed) == len(entries):
+        raise RuntimeError(f"Could not save any of {len(entries)} locators")
+    if failed:
+        metrics.incr("write_behind.dropped", len(failed))
+
+
+def _db_save_locator(
+    locator_id: str,
     instruction: str,
     html_backbone: str,
     selector_type: str,
     selector_value: str,
-    action: Optional[str] = None,
-    url: Optional[str] = None,
-    project_id=None,
-    html=str,
-):
-    if SessionLocal is None:
-        return None
-
-    src = (url or "").strip() or (html_backbone or "").strip() or (html or "")
-    html_id = hashlib.sha256(src.encode("utf-8")).hexdigest()
-    locator_id = compute_locator_id(instruction, html_id, url, project_id)
+    action: Optional[str],
+    url: Optional[str],
+    project_id,
+    html,
+    html_id: str,
+) -> bool:
     session = SessionLocal()
 
     try:
         existing_html = session.query(HTML).filter_by(id=html_id).first()
         if not existing_html:
-            session.add(
-                HTML(id=html_id, row_html=html, backbone=html_backbone, url=url or "")
+            snapshot = HTML(
+                id=html_id, row_html=html, backbone=html_backbone, url=url or ""
             )
+            fp = _snapshot_fingerprint(url, html_backbone)
+            if fp is not None:
+                snapshot.simhash = simhash.to_hex(fp)
+                snapshot.simhash_bands = [
+                    HTMLSimhashBand(band=i, value=value)
+                    for i, value in enumerate(simhash.bands(fp))
+                ]
+            session.add(snapshot)
         stmt = (
             insert(UILocatorCache)
             .values(
@@ -208,7 +875,119 @@ def save_locator(
         session.rollback()
         logger.error(f"Error saving locator: {e}")
         return False
+    finally:
+        session.close()
+
+
+def save_locator(
+    instruction: str,
+    html_backbone: str,
+    selector_type: str,
+    selector_value: str,
+    action: Optional[str] = None,
+    url: Optional[str] = None,
+    project_id=None,
+    html=str,
+    html_id: Optional[str] = None,
+):
+    if SessionLocal is None:
+        return None
+
+    html_id = _locator_html_id(url, html_backbone, html, html_id)
+    locator_id = compute_locator_id(instruction, html_id, url, project_id)
+    try:
+        return _db_save_locator(
+            locator_id,
+            instruction,
+            html_backbone,
+            selector_type,
+            selector_value,
+            action,
+            url,
+            project_id,
+            html,
+            html_id,
+        )
     finally:
         # Write-through cache so reads don't have to hit DB
         _redis_set_locator(locator_id, selector_type, selector_value, action)
-        session.close()
+        _redis_index_locator(html_id, project_id, instruction, locator_id)
+        _publish_invalidation(locator_id)
+
+
+async def asave_locator(
+    instruction: str,
+    html_backbone: str,
+    selector_type: str,
+    selector_value: str,
+    action: Optional[str] = None,
+    url: Optional[str] = None,
+    project_id=None,
+    html=str,
+    html_id: Optional[str] = None,
+):
+    """Async ``save_locator``: the upsert runs in a worker thread."""
+    if SessionLocal is None:
+        return None
+
+    html_id = _locator_html_id(url, html_backbone, html, html_id)
+    locator_id = compute_locator_id(instruction, html_id, url, project_id)
+    try:
+        # 落库交给后台批量写,Redis 仍同步写入,读到的总是最新值
+        entry = {
+            "locator_id": locator_id,
+            "instruction": instruction,
+            "html_backbone": html_backbone,
+            "selector_type": selector_type,
+            "selector_value": selector_value,
+            "action": action,
+            "url": url,
+            "project_id": str(project_id) if project_id else None,
+            "html": html,
+            "html_id": html_id,
+        }
+        if await _writer.aenqueue(entry):
+            return True
+        metrics.incr("write_behind.sync_writes")
+        return await asyncio.to_thread(
+            _db_save_locator,
+            locator_id,
+            instruction,
+            html_backbone,
+            selector_type,
+            selector_value,
+            action,
+            url,
+            project_id,
+            html,
+            html_id,
+        )
+    finally:
+        await _aredis_set_locator(locator_id, selector_type, selector_value, action)
+        await _aredis_index_locator(html_id, project_id, instruction, locator_id)
+        await _apublish_invalidation(locator_id)
+
+
+def _stream_client():
+    # XREADGROUP 会阻塞 FLUSH_MS,不能用带 0.5s socket_timeout 的共享客户端
+    return redis.from_url(
+        _redis_url(),
+        decode_responses=True,
+        socket_timeout=write_behind.FLUSH_MS / 1000 + 5,
+    )
+
+
+_writer = write_behind.WriteBehind(
+    _stream_client, _aredis, f"{_NS}:write_behind", _db_save_locators
+)
+
+
+def start_write_behind() -> None:
+    """Start the background locator writer (app startup)."""
+    if SessionLocal is not None:
+        _writer.start()
+
+
+def stop_write_behind() -> None:
+    """Flush queued locator writes and stop the writer (app shutdown)."""
+    _writer.stop()
@@ -0,0 +1,99 @@
+import hashlib
+import json
+from typing import Optional
+
+from loguru import logger
+
+from talk2dom.api.utils import metrics
+from talk2dom.db import cache, local_cache
+
+# 缓存的上下文按用户、项目和 API Key 打标签,任一变化时按标签删除
+
+
+def key_digest(api_key: str) -> str:
+    # 不把明文 API Key 写进 Redis 键名
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+
+
+def _context_key(api_key: str, project_id) -> str:
+    return f"{cache._NS}:ctx:{key_digest(api_key)}:{project_id}"
+
+
+def _tag_key(kind: str, value) -> str:
+    return f"{cache._NS}:ctx:tag:{kind}:{value}"
+
+
+def _tags(api_key: str, context: dict) -> list:
+    return [
+        _tag_key("user", context["user_id"]),
+        _tag_key("user", context["owner_id"]),
+        _tag_key("project", context["project_id"]),
+        _tag_key("key", key_digest(api_key)),
+    ]
+
+
+async def aget(api_key: str, project_id) -> Optional[dict]:
+    """Cached request context for this key and project: L1, then Redis."""
+    if local_cache.CONTEXT_TTL_SECONDS <= 0:
+        return None
+    key = _context_key(api_key, project_id)
+    hit = local_cache.contexts.get(key)
+    if hit is not None:
+        metrics.incr("auth_context.l1_hit")
+        return json.loads(hit[0])
+    try:
+        data = await cache._aredis().get(key)
+    except Exception as e:
+        logger.warning(f"Redis get request context failed: {e}")
+        data = None
+    if not data:
+        metrics.incr("auth_context.miss")
+        return None
+    local_cache.contexts.set(key, (data,))
+    metrics.incr("auth_context.l2_hit")
+    return json.loads(data)
+
+
+async def aset(api_key: str, project_id, context: dict) -> None:
+    if local_cache.CONTEXT_TTL_SECONDS <= 0:
+        return
+    key = _context_key(api_key, project_id)
+    data = json.dumps(context)
+    local_cache.contexts.set(key, (data,))
+    try:
+        async with cache._aredis().pipeline(transaction=False) as pipe:
+            pipe.set(key, data, ex=local_cache.CONTEXT_TTL_SECONDS)
+            for tag in _tags(api_key, context):
+                pipe.sadd(tag, key)
+                pipe.expire(tag, local_cache.CONTEXT_TTL_SECONDS)
+            await pipe.execute()
+    except Exception as e:
+        logger.warning(f"Redis set request context failed: {e}")
+
+
+def _invalidate(tag: str) -> None:
+    local_cache.contexts.clear()
+    try:
+        client = cache._redis()
+        keys = client.smembers(tag)
+        client.delete(tag, *keys)
+    except Exception as e:
+        # 删除失败时最多 CONTEXT_TTL_SECONDS 后自然过期
+        logger.warning(f"Redis invalidate request contexts failed for {tag}: {e}")
+    cache._publish_invalidation(local_cache.CLEAR_CONTEXTS)
+    metrics.incr("auth_context.invalidations")
+
+
+def invalidate_user(user_id) -> None:
+    """Drop contexts of keys owned by, or projects owned by, this user (plan changes)."""
+    _invalidate(_tag_key("user", user_id))
+
+
+def invalidate_project(project_id) -> None:
+    """Drop contexts of this project (membership and settings changes)."""
+    _invalidate(_tag_key("project", project_id))
+
+
+def invalidate_key(api_key: str) -> None:
+    """Drop contexts resolved through this API key (key deleted or disabled)."""
+    _invalidate(_tag_key("key", key_digest(api_key)))
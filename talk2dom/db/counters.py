@@ -0,0 +1,406 @@
+import os
+import threading
+import time
+import uuid
+from typing import Optional, Tuple
+
+from loguru import logger
+
+from talk2dom.api.utils import metrics
+from talk2dom.db import cache
+from talk2dom.db.models import Project, User
+from talk2dom.db.session import SessionLocal
+
+# 额度与项目调用次数记在 Redis 里,由后台 reconciler 定期把增量写回数据库;0 表示直接写库
+ENABLED = os.getenv("T2D_REDIS_COUNTERS", "1") == "1"
+RECONCILE_MS = int(os.getenv("T2D_COUNTERS_RECONCILE_MS", "5000"))
+BATCH_SIZE = 500
+# 没有待写回增量的余额缓存多久(秒),过期后下次请求从数据库重新加载
+IDLE_TTL = 3600
+
+# 余额 hash: s/o 为订阅/一次性额度余额,ds/do 为尚未写回数据库的增量
+_SEED = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+  redis.call('HSET', KEYS[1], 's', ARGV[1], 'o', ARGV[2], 'ds', 0, 'do', 0)
+  redis.call('EXPIRE', KEYS[1], ARGV[3])
+end
+return redis.call('HMGET', KEYS[1], 's', 'o')
+"""
+
+# 先扣订阅额度再扣一次性额度,不会扣成负数;返回透支(未能扣到)的数量,余额未缓存时返回 -1
+_CHARGE = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+  return -1
+end
+local n = tonumber(ARGV[1])
+local s = tonumber(redis.call('HGET', KEYS[1], 's'))
+local o = tonumber(redis.call('HGET', KEYS[1], 'o'))
+local from_s = math.min(s, n)
+local from_o = math.min(o, n - from_s)
+redis.call('HINCRBY', KEYS[1], 's', -from_s)
+redis.call('HINCRBY', KEYS[1], 'ds', -from_s)
+redis.call('HINCRBY', KEYS[1], 'o', -from_o)
+redis.call('HINCRBY', KEYS[1], 'do', -from_o)
+redis.call('PERSIST', KEYS[1])
+redis.call('SADD', KEYS[2], ARGV[2])
+if ARGV[3] ~= '' then
+  redis.call('INCRBY', KEYS[3], n)
+  redis.call('SADD', KEYS[4], ARGV[3])
+end
+return n - from_s - from_o
+"""
+
+# 只在余额已缓存时加额度;返回 0 时调用方直接写库
+_TOP_UP = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+  return 0
+end
+redis.call('HINCRBY', KEYS[1], 'o', ARGV[1])
+redis.call('HINCRBY', KEYS[1], 'do', ARGV[1])
+redis.call('PERSIST', KEYS[1])
+redis.call('SADD', KEYS[2], ARGV[2])
+return 1
+"""
+
+# 取走待写回的增量并清零;没有增量后余额只保留 IDLE_TTL
+_TAKE = """
+redis.call('SREM', KEYS[2], ARGV[1])
+if redis.call('EXISTS', KEYS[1]) == 0 then
+  return {0, 0}
+end
+local ds = tonumber(redis.call('HGET', KEYS[1], 'ds'))
+local d_o = tonumber(redis.call('HGET', KEYS[1], 'do'))
+redis.call('HSET', KEYS[1], 'ds', 0, 'do', 0)
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return {ds, d_o}
+"""
+
+# 写库失败时把取走的增量放回去
+_RESTORE = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+  redis.call('HINCRBY', KEYS[1], 'ds', ARGV[2])
+  redis.call('HINCRBY', KEYS[1], 'do', ARGV[3])
+  redis.call('PERSIST', KEYS[1])
+  redis.call('SADD', KEYS[2], ARGV[1])
+end
+return 1
+"""
+
+# 写回后 Redis 余额应等于数据库余额加上之后新产生的增量;不相等即漂移,以数据库为准
+_RESYNC = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+  return {0, 0}
+end
+local s = tonumber(redis.call('HGET', KEYS[1], 's'))
+local o = tonumber(redis.call('HGET', KEYS[1], 'o'))
+local s_expected = tonumber(ARGV[1]) + tonumber(redis.call('HGET', KEYS[1], 'ds'))
+local o_expected = tonumber(ARGV[2]) + tonumber(redis.call('HGET', KEYS[1], 'do'))
+if s ~= s_expected or o ~= o_expected then
+  redis.call('HSET', KEYS[1], 's', math.max(s_expected, 0), 'o', math.max(o_expected, 0))
+end
+return {s - s_expected, o - o_expected}
+"""
+
+# 删除缓存的余额并返回尚未写回的增量
+_EVICT = """
+redis.call('SREM', KEYS[2], ARGV[1])
+if redis.call('EXISTS', KEYS[1]) == 0 then
+  return {0, 0}
+end
+local pending = redis.call('HMGET', KEYS[1], 'ds', 'do')
+redis.call('DEL', KEYS[1])
+return {tonumber(pending[1]), tonumber(pending[2])}
+"""
+
+_UNLOCK = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+_TAKE_CALLS = """
+redis.call('SREM', KEYS[2], ARGV[1])
+local n = redis.call('GET', KEYS[1])
+redis.call('DEL', KEYS[1])
+return tonumber(n) or 0
+"""
+
+_RESTORE_CALLS = """
+redis.call('INCRBY', KEYS[1], ARGV[2])
+redis.call('SADD', KEYS[2], ARGV[1])
+return 1
+"""
+
+
+def _credit_key(user_id) -> str:
+    return f"{cache._NS}:credits:{user_id}"
+
+
+def _calls_key(project_id) -> str:
+    return f"{cache._NS}:calls:{project_id}"
+
+
+def _dirty_users_key() -> str:
+    return f"{cache._NS}:credits:dirty"
+
+
+def _dirty_projects_key() -> str:
+    return f"{cache._NS}:calls:dirty"
+
+
+def _lock_key() -> str:
+    return f"{cache._NS}:counters:lock"
+
+
+def _eval(script: str, keys: list, args: list):
+    return cache._redis().eval(script, len(keys), *keys, *args)
+
+
+def _credit_keys(user_id) -> list:
+    return [_credit_key(user_id), _dirty_users_key()]
+
+
+def _calls_keys(project_id) -> list:
+    return [_calls_key(project_id), _dirty_projects_key()]
+
+
+class Reconciler:
+    """Background thread folding the Redis counter deltas back into the DB.
+
+    Every pod runs one, but a Redis lock lets only one fold at a time. After
+    each fold the cached balance is compared with the DB (plus anything
+    charged since); a mismatch counts as drift and the balance is reset from
+    the DB.
+    """
+
+    def __init__(self):
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        # 没有 reconciler 时增量永远不会写回,调用方走原来的写库路径
+        return self._thread is not None
+
+    def start(self) -> None:
+        if self._thread is not None or not ENABLED or SessionLocal is None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="t2d-counter-reconciler", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is None:
+            return
+        self._thread.join(timeout=RECONCILE_MS / 1000 + 5)
+        self._thread = None
+        try:
+            while reconcile_once():
+                pass
+        except Exception as e:
+            logger.error(f"Counter reconcile on shutdown failed: {e}")
+
+    def _run(self) -> None:
+        backoff = 1.0
+        while not self._stop.wait(RECONCILE_MS / 1000):
+            try:
+                while reconcile_once() >= BATCH_SIZE:
+                    pass
+                backoff = 1.0
+            except Exception as e:
+                logger.error(f"Counter reconcile failed: {e}")
+                metrics.incr("counters.reconcile_errors")
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, 30.0)
+
+
+reconciler = Reconciler()
+
+
+def _seed(user_id) -> Optional[Tuple[int, int]]:
+    # 从数据库行加载余额;请求上下文里缓存的 User 可能已经过期,不能用来初始化
+    session = SessionLocal()
+    try:
+        user = session.get(User, uuid.UUID(str(user_id)))
+        if user is None:
+            return None
+        seed = [int(user.subscription_credits), int(user.one_time_credits)]
+    finally:
+        session.close()
+    s, o = _eval(_SEED, [_credit_key(user_id)], seed + [IDLE_TTL])
+    return int(s), int(o)
+
+
+def balance(user: User) -> Optional[int]:
+    """Credits left for ``user``, loading the cached balance from the DB if absent.
+
+    None means the counters are not in use and the caller reads the row.
+    """
+    if not reconciler.running:
+        return None
+    try:
+        s, o = cache._redis().hmget(_credit_key(user.id), "s", "o")
+        if s is None or o is None:
+            seeded = _seed(user.id)
+            if seeded is None:
+                return None
+            s, o = seeded
+    except Exception as e:
+        logger.warning(f"Credit counter read failed: {e}")
+        return None
+    return int(s) + int(o)
+
+
+def balances(user: User) -> Tuple[int, int]:
+    """(subscription, one-time) credits, including charges not yet written back."""
+    if reconciler.running:
+        try:
+            s, o = cache._redis().hmget(_credit_key(user.id), "s", "o")
+            if s is not None and o is not None:
+                return int(s), int(o)
+        except Exception as e:
+            logger.warning(f"Credit counter read failed: {e}")
+    return int(user.subscription_credits), int(user.one_time_credits)
+
+
+def charge(user: User, project_id, amount: int) -> bool:
+    """Charge ``amount`` credits and count the project's calls in Redis.
+
+    False means nothing was recorded and the caller has to write the DB.
+    """
+    if not reconciler.running:
+        return False
+    keys = _credit_keys(user.id) + (
+        _calls_keys(project_id) if project_id is not None else ["", ""]
+    )
+    args = [amount, str(user.id), str(project_id) if project_id is not None else ""]
+    try:
+        overdraft = int(_eval(_CHARGE, keys, args))
+        if overdraft < 0 and _seed(user.id) is not None:
+            overdraft = int(_eval(_CHARGE, keys, args))
+    except Exception as e:
+        logger.warning(f"Credit counter charge failed: {e}")
+        metrics.incr("counters.fallbacks")
+        return False
+    if overdraft < 0:
+        metrics.incr("counters.fallbacks")
+        return False
+    metrics.incr("counters.charged", amount)
+    if overdraft:
+        metrics.incr("usage.credit_overdraft", int(overdraft))
+        logger.warning(f"User {user.id} overdrew {overdraft} credits")
+    return True
+
+
+def top_up(user_id, amount: int) -> bool:
+    """Add one-time credits to a cached balance; False means write the row instead."""
+    if not reconciler.running:
+        return False
+    try:
+        return bool(_eval(_TOP_UP, _credit_keys(user_id), [int(amount), str(user_id)]))
+    except Exception as e:
+        logger.warning(f"Credit counter top-up failed: {e}")
+        return False
+
+
+def evict(user_id) -> Tuple[int, int]:
+    """Drop the cached balance after the row was overwritten and committed.
+
+    Returns the (subscription, one-time) deltas that were not written back
+    yet, for the caller to apply or deliberately discard.
+    """
+    if not reconciler.running:
+        return 0, 0
+    try:
+        ds, d_o = _eval(_EVICT, _credit_keys(user_id), [str(user_id)])
+    except Exception as e:
+        logger.warning(f"Credit counter evict failed: {e}")
+        return 0, 0
+    return int(ds), int(d_o)
+
+
+def _dirty(key: str) -> list:
+    return list(cache._redis().srandmember(key, BATCH_SIZE) or [])
+
+
+def reconcile_once() -> int:
+    """Fold one batch of pending deltas into the DB; returns how many were folded."""
+    token = uuid.uuid4().hex
+    # 同一时间只有一个 reconciler 写回,否则漂移检查会把别人刚取走的增量当成漂移
+    if not cache._redis().set(_lock_key(), token, nx=True, px=RECONCILE_MS * 6):
+        return 0
+    try:
+        return _fold()
+    finally:
+        _eval(_UNLOCK, [_lock_key()], [token])
+
+
+def _fold() -> int:
+    user_ids = _dirty(_dirty_users_key())
+    project_ids = _dirty(_dirty_projects_key())
+    if not user_ids and not project_ids:
+        return 0
+
+    start = time.perf_counter()
+    session = SessionLocal()
+    credits, calls, written = {}, {}, {}
+    try:
+        for user_id in user_ids:
+            ds, d_o = _eval(_TAKE, _credit_keys(user_id), [user_id, IDLE_TTL])
+            if ds or d_o:
+                credits[user_id] = (int(ds), int(d_o))
+        for project_id in project_ids:
+            n = _eval(_TAKE_CALLS, _calls_keys(project_id), [project_id])
+            if n:
+                calls[project_id] = int(n)
+
+        for user_id, (ds, d_o) in credits.items():
+            user = session.get(User, uuid.UUID(str(user_id)), with_for_update=True)
+            if user is None:
+                continue
+            user.subscription_credits = max(user.subscription_credits + ds, 0)
+            user.one_time_credits = max(user.one_time_credits + d_o, 0)
+            written[user_id] = (user.subscription_credits, user.one_time_credits)
+        for project_id, n in calls.items():
+            session.query(Project).filter(
+                Project.id == uuid.UUID(str(project_id))
+            ).update(
+                {Project.api_call_count: Project.api_call_count + n},
+                synchronize_session=False,
+            )
+        session.commit()
+    except Exception:
+        session.rollback()
+        for user_id, (ds, d_o) in credits.items():
+            _eval(_RESTORE, _credit_keys(user_id), [user_id, ds, d_o])
+        for project_id, n in calls.items():
+            _eval(_RESTORE_CALLS, _calls_keys(project_id), [project_id, n])
+        raise
+    finally:
+        session.close()
+
+    for user_id, (s, o) in written.items():
+        drift_s, drift_o = _eval(_RESYNC, [_credit_key(user_id)], [s, o])
+        if drift_s or drift_o:
+            metrics.incr("counters.drift")
+            logger.warning(
+                f"Credit counter drift for user {user_id}: "
+                f"subscription {drift_s:+d}, one-time {drift_o:+d}; reset from DB"
+            )
+    metrics.incr("counters.reconciled", len(credits) + len(calls))
+    metrics.observe("counters.reconcile_ms", (time.perf_counter() - start) * 1000)
+    return len(user_ids) + len(project_ids)
+
+
+def start() -> None:
+    """Start the counter reconciler (app startup)."""
+    reconciler.start()
+
+
+def stop() -> None:
+    """Write pending counter deltas back and stop the reconciler (app shutdown)."""
+    reconciler.stop()
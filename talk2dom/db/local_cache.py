@@ -0,0 +1,166 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Optional
+
+from loguru import logger
+
+from talk2dom.api.utils import metrics
+
+# 进程内 L1 缓存,挡在 Redis 前面;TTL 为 0 时关闭
+MAX_ENTRIES = int(os.getenv("T2D_L1_MAX_ENTRIES", "10000"))
+MAX_BYTES = int(os.getenv("T2D_L1_MAX_BYTES", str(16 * 1024 * 1024)))
+TTL_SECONDS = float(os.getenv("T2D_L1_TTL", "60"))
+# 每条记录在 key/value 之外的估算开销(字典槽位、元组等)
+_ENTRY_OVERHEAD = 128
+# 本进程发出的失效消息带上这个标识,收到自己的消息时跳过
+ORIGIN = uuid.uuid4().hex
+
+
+def _size(key: str, value: tuple) -> int:
+    return len(key) + sum(len(v or "") for v in value) + _ENTRY_OVERHEAD
+
+
+class LocalCache:
+    """Thread-safe LRU with a per-entry TTL, bounded in entries and bytes."""
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl: float):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.bytes = 0
+        self._entries = OrderedDict()  # key -> (expires_at, size, value)
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.max_entries > 0 and self.max_bytes > 0
+
+    def _drop(self, key: str) -> None:
+        _, size, _ = self._entries.pop(key)
+        self.bytes -= size
+
+    def get(self, key: str) -> Optional[tuple]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                self._drop(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[2]
+
+    def set(self, key: str, value: tuple) -> None:
+        if not self.enabled:
+            return
+        size = _size(key, value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (time.monotonic() + self.ttl, size, value)
+            self.bytes += size
+            while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                metrics.incr("l1.evictions")
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl,
+            }
+
+
+locators = LocalCache(MAX_ENTRIES, MAX_BYTES, TTL_SECONDS)
+
+# API Key 请求的鉴权/项目上下文缓存时间(秒),Redis 里也用这个 TTL;0 表示关闭
+CONTEXT_TTL_SECONDS = int(os.getenv("T2D_AUTH_CACHE_TTL", "30"))
+contexts = LocalCache(MAX_ENTRIES, MAX_BYTES, min(TTL_SECONDS, CONTEXT_TTL_SECONDS))
+# 上下文失效很少发生,收到这条消息时整个清空
+CLEAR_CONTEXTS = "ctx:*"
+
+
+def message(key: str) -> str:
+    return f"{ORIGIN}|{key}"
+
+
+def _handle(data: str) -> None:
+    origin, _, key = (data or "").partition("|")
+    if origin != ORIGIN and key:
+        if key == CLEAR_CONTEXTS:
+            contexts.clear()
+        else:
+            locators.delete(key)
+        metrics.incr("l1.invalidations")
+
+
+class InvalidationListener:
+    """Background thread applying other pods' invalidations to the L1 cache."""
+
+    def __init__(self, client_factory, channel: str):
+        self.client_factory = client_factory
+        self.channel = channel
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread is not None or not (locators.enabled or contexts.enabled):
+            return
+        self._thread = threading.Thread(
+            target=self._run, name="t2d-l1-invalidation", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+            self._thread = None
+
+    def _run(self) -> None:
+        backoff = 1.0
+        while not self._stop.is_set():
+            pubsub = None
+            try:
+                pubsub = self.client_factory().pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                # 断线期间可能漏掉了失效消息,重新订阅后清空 L1
+                locators.clear()
+                contexts.clear()
+                backoff = 1.0
+                while not self._stop.is_set():
+                    msg = pubsub.get_message(timeout=1.0)
+                    if msg and msg.get("type") == "message":
+                        _handle(msg.get("data"))
+            except Exception as e:
+                locators.clear()
+                contexts.clear()
+                logger.warning(f"L1 invalidation listener disconnected: {e}")
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, 30.0)
+            finally:
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except Exception:
+                        pass
@@ -213,6 +213,10 @@ class Project(Base):
     owner_id = Column(UUID, ForeignKey("users.id"))
     created_at = Column(DateTime, default=datetime.utcnow)
     api_call_count = Column(BigInteger, nullable=False, default=0, server_default="0")
+    # provider:model[@timeout] 列表,覆盖全局的 T2D_MODEL_CASCADE
+    model_cascade = Column(String, nullable=True)
+    # 逗号分隔的路径模板(如 /product/{sku}),匹配的页面共用定位缓存
+    url_templates = Column(Text, nullable=True)
 
     memberships = relationship("ProjectMembership", back_populates="project")
     locator_cache = relationship(
@@ -289,7 +293,26 @@ class HTML(Base):
     url = Column(String, nullable=True)
     backbone = Column(Text, nullable=False)
     row_html = Column(Text, nullable=False)
+    # 骨架的 64 位 SimHash(十六进制),用于查找结构相近的快照
+    simhash = Column(String(16), nullable=True)
 
     locator_cache = relationship(
         "UILocatorCache", back_populates="html", cascade="all, delete-orphan"
     )
+    simhash_bands = relationship(
+        "HTMLSimhashBand", back_populates="html", cascade="all, delete-orphan"
+    )
+
+
+class HTMLSimhashBand(Base):
+    """One band of an ``HTML.simhash``; near-duplicate backbones share at least one."""
+
+    __tablename__ = "html_simhash_bands"
+    __table_args__ = (Index("ix_html_simhash_bands_band_value", "band", "value"),)
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    html_id = Column(String, ForeignKey("html.id", ondelete="CASCADE"), nullable=False)
+    band = Column(Integer, nullable=False)
+    value = Column(String(4), nullable=False)
+
+    html = relationship("HTML", back_populates="simhash_bands")
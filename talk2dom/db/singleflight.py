@@ -0,0 +1,127 @@
+import asyncio
+import os
+import uuid
+
+from loguru import logger
+
+from talk2dom.api.utils import deadline, metrics
+from talk2dom.db import cache
+
+# 跨 pod 的锁最长持有时间,也是 follower 最长等待时间
+_LOCK_TTL_MS = int(os.getenv("T2D_SINGLEFLIGHT_LOCK_MS", "30000"))
+_POLL_INTERVAL_MS = int(os.getenv("T2D_SINGLEFLIGHT_POLL_MS", "200"))
+
+# compare-and-delete: only the holder may release the lock
+_RELEASE_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+_inflight: dict = {}
+
+
+def _lock_key(key: str) -> str:
+    return f"{cache._NS}:lock:{key}"
+
+
+async def _acquire(key: str):
+    """Return the lock token, ``None`` if another pod holds it, or ``""`` if Redis is down."""
+    token = uuid.uuid4().hex
+    try:
+        acquired = await cache._aredis().set(
+            _lock_key(key), token, nx=True, px=_LOCK_TTL_MS
+        )
+    except Exception as e:
+        logger.warning(f"Single-flight lock unavailable for {key}: {e}")
+        return ""
+    return token if acquired else None
+
+
+async def _release(key: str, token: str) -> None:
+    try:
+        await cache._aredis().eval(_RELEASE_SCRIPT, 1, _lock_key(key), token)
+    except Exception as e:
+        logger.warning(f"Single-flight unlock failed for {key}: {e}")
+
+
+async def _wait_for_leader(key: str, poll):
+    loop = asyncio.get_running_loop()
+    # 不等过本请求的截止时间
+    until = loop.time() + deadline.bound(_LOCK_TTL_MS / 1000)
+    while loop.time() < until:
+        await asyncio.sleep(min(_POLL_INTERVAL_MS / 1000, until - loop.time()))
+        result = await poll()
+        if result is not None:
+            return result
+        try:
+            if not await cache._aredis().exists(_lock_key(key)):
+                # leader 已经结束但没有写缓存(失败或未通过校验)
+                return await poll()
+        except Exception:
+            return None
+    return None
+
+
+async def _lead(key: str, produce, poll):
+    token = await _acquire(key)
+    if token is None and poll is not None:
+        result = await _wait_for_leader(key, poll)
+        if result is not None:
+            metrics.incr("singleflight.remote_follower")
+            return result, "remote"
+        if deadline.expired():
+            metrics.incr("deadline.exceeded")
+            raise deadline.DeadlineExceeded()
+        logger.info(f"Single-flight leader for {key} produced nothing, computing")
+    metrics.incr("singleflight.leader")
+    try:
+        return await produce(), "leader"
+    finally:
+        if token:
+            await _release(key, token)
+
+
+async def run(key: str, produce, poll=None) -> tuple:
+    """Coalesce concurrent ``produce()`` calls for the same ``key``.
+
+    Within the process, callers that arrive while a call is in flight share its
+    result. Across processes a Redis lock elects one leader; the others call
+    ``poll()`` until it returns something (e.g. the leader's write-through
+    cache entry) and only compute themselves if the leader leaves nothing.
+    Followers never wait past the request deadline; they raise
+    ``DeadlineExceeded`` instead.
+
+    Returns ``(result, role)`` with role ``"leader"``, ``"local"`` or ``"remote"``.
+    """
+    future = _inflight.get(key)
+    if future is not None:
+        metrics.incr("singleflight.local_follower")
+        try:
+            result = await asyncio.wait_for(
+                asyncio.shield(future), deadline.bound(None)
+            )
+        except asyncio.TimeoutError:
+            # 只放弃等待,leader 的调用继续进行
+            metrics.incr("deadline.exceeded")
+            raise deadline.DeadlineExceeded()
+        return result, "local"
+
+    future = asyncio.get_running_loop().create_future()
+    _inflight[key] = future
+    try:
+        result, role = await _lead(key, produce, poll)
+    except BaseException as e:
+        if isinstance(e, asyncio.CancelledError):
+            future.cancel()
+        else:
+            future.set_exception(e)
+            # 没有 follower 时避免 "exception was never retrieved"
+            future.exception()
+        raise
+    else:
+        future.set_result(result)
+        return result, role
+    finally:
+        _inflight.pop(key, None)
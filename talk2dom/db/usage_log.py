@@ -0,0 +1,255 @@
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from datetime import datetime
+from typing import Optional
+
+from loguru import logger
+from sqlalchemy import insert
+
+from talk2dom.api.utils import metrics
+from talk2dom.db import cache, write_behind
+from talk2dom.db.models import APIUsage, Project, User
+from talk2dom.db.session import SessionLocal
+
+# T2D_WRITE_BEHIND=redis 时用量事件写入 Redis stream,确认落库后才删除;
+# 否则(或 Redis 不可用时)进进程内缓冲,后台线程按时间或条数批量落库;0 表示同步写库
+BUFFER_SIZE = int(os.getenv("T2D_USAGE_BUFFER_SIZE", "10000"))
+FLUSH_MS = int(os.getenv("T2D_USAGE_FLUSH_MS", "1000"))
+FLUSH_ROWS = int(os.getenv("T2D_USAGE_FLUSH_ROWS", "500"))
+
+
+def apply_credits(user: User, amount: int) -> None:
+    """Charge ``amount`` credits, subscription first; never goes below zero.
+
+    Buffered calls were admitted against a slightly stale balance, so a
+    batch can ask for more than is left; the excess is logged, not raised.
+    """
+    from_subscription = min(user.subscription_credits, amount)
+    user.subscription_credits -= from_subscription
+    rest = amount - from_subscription
+    from_one_time = min(user.one_time_credits, rest)
+    user.one_time_credits -= from_one_time
+    if rest > from_one_time:
+        metrics.incr("usage.credit_overdraft", rest - from_one_time)
+        logger.warning(f"User {user.id} overdrew {rest - from_one_time} credits")
+
+
+def write(session, events: list) -> None:
+    """Insert the events' usage rows and apply their counter deltas in aggregate."""
+    rows = [row for event in events for row in event["rows"]]
+    credits = defaultdict(int)
+    calls = defaultdict(int)
+    for event in events:
+        if event["credits"]:
+            credits[event["credit_owner_id"]] += event["credits"]
+            if event["project_id"] is not None:
+                calls[event["project_id"]] += event["credits"]
+
+    if rows:
+        session.execute(insert(APIUsage), rows)
+    for user_id, amount in credits.items():
+        user = session.get(User, user_id, with_for_update=True)
+        if user is not None:
+            apply_credits(user, amount)
+    for project_id, count in calls.items():
+        session.query(Project).filter(Project.id == project_id).update(
+            {Project.api_call_count: Project.api_call_count + count},
+            synchronize_session=False,
+        )
+    session.commit()
+
+
+class UsageBuffer:
+    """Bounded in-process buffer of usage events with a background flusher.
+
+    At most ``BUFFER_SIZE`` events are held. When the database falls that far
+    behind, the oldest events that charge no credits are dropped (and
+    counted); events that charge credits are never dropped: once the buffer
+    holds nothing else ``push`` refuses and the caller writes synchronously.
+    A crash loses what was buffered since the last flush; ``stop`` flushes
+    what is left.
+    """
+
+    def __init__(self, size: int = BUFFER_SIZE):
+        self._events = deque()
+        self._size = size
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def __len__(self) -> int:
+        with self._cond:
+            return len(self._events)
+
+    def push(self, event: dict) -> bool:
+        """Buffer one event; False when the flusher is not running."""
+        if not self.running:
+            return False
+        with self._cond:
+            if not self._make_room(self._size - 1):
+                metrics.incr("usage.buffer_full")
+                return False
+            self._events.append(event)
+            if len(self._events) >= FLUSH_ROWS:
+                self._cond.notify()
+        metrics.incr("usage.buffered")
+        return True
+
+    def _make_room(self, limit: int) -> bool:
+        # 只丢不扣费的事件(最旧的先丢),扣费事件一条都不丢
+        while len(self._events) > limit:
+            victim = next((e for e in self._events if not e.get("credits")), None)
+            if victim is None:
+                return False
+            self._events.remove(victim)
+            metrics.incr("usage.dropped")
+        return True
+
+    def start(self) -> None:
+        if self._thread is not None or self._size <= 0 or SessionLocal is None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="t2d-usage-flusher", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        with self._cond:
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout=FLUSH_MS / 1000 + 5)
+            self._thread = None
+        try:
+            while self.flush():
+                pass
+        except Exception as e:
+            logger.error(f"Usage flush on shutdown failed: {e}")
+
+    def _take(self) -> list:
+        with self._cond:
+            batch = [
+                self._events.popleft()
+                for _ in range(min(FLUSH_ROWS, len(self._events)))
+            ]
+        return batch
+
+    def flush(self) -> int:
+        """Write one batch; on failure the batch goes back to the buffer."""
+        batch = self._take()
+        if not batch:
+            return 0
+        start = time.perf_counter()
+        session = None
+        try:
+            session = SessionLocal()
+            write(session, batch)
+        except Exception:
+            if session is not None:
+                session.rollback()
+            with self._cond:
+                # 扣费事件可以暂时超出容量
+                self._events.extendleft(reversed(batch))
+                self._make_room(self._size)
+            raise
+        finally:
+            if session is not None:
+                session.close()
+        metrics.incr("usage.flushed", len(batch))
+        metrics.observe("usage.flush_ms", (time.perf_counter() - start) * 1000)
+        return len(batch)
+
+    def _run(self) -> None:
+        backoff = 1.0
+        while not self._stop.is_set():
+            with self._cond:
+                if len(self._events) < FLUSH_ROWS:
+                    self._cond.wait(FLUSH_MS / 1000)
+            try:
+                while self.flush() >= FLUSH_ROWS:
+                    pass
+                backoff = 1.0
+            except Exception as e:
+                logger.error(f"Usage flush failed: {e}")
+                metrics.incr("usage.flush_errors")
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, 30.0)
+
+
+buffer = UsageBuffer()
+
+
+def _decode(event: dict) -> dict:
+    # stream 里是 JSON,时间和 UUID 需要还原
+    def as_uuid(value):
+        return uuid.UUID(value) if isinstance(value, str) else value
+
+    rows = [
+        {
+            **row,
+            "api_key_id": as_uuid(row["api_key_id"]),
+            "user_id": as_uuid(row["user_id"]),
+            "project_id": as_uuid(row["project_id"]),
+            "request_time": datetime.fromisoformat(row["request_time"]),
+            "response_time": datetime.fromisoformat(row["response_time"]),
+        }
+        for row in event["rows"]
+    ]
+    return {
+        **event,
+        "rows": rows,
+        "credit_owner_id": as_uuid(event["credit_owner_id"]),
+        "project_id": as_uuid(event["project_id"]),
+    }
+
+
+def _write_stream_batch(events: list) -> None:
+    session = SessionLocal()
+    try:
+        write(session, [_decode(event) for event in events])
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
+stream = write_behind.WriteBehind(
+    cache._stream_client,
+    cache._aredis,
+    f"{cache._NS}:usage",
+    _write_stream_batch,
+    sync_factory=cache._redis,
+)
+
+
+def push(event: dict) -> bool:
+    """Queue one usage event; False means the caller has to write it synchronously.
+
+    The Redis stream is used when it is running and reachable, the in-process
+    buffer otherwise.
+    """
+    if write_behind.MODE == "redis" and stream.enqueue(event):
+        return True
+    return buffer.push(event)
+
+
+def start() -> None:
+    """Start the usage writers (app startup)."""
+    if write_behind.MODE == "redis" and SessionLocal is not None:
+        stream.start()
+    buffer.start()
+
+
+def stop() -> None:
+    """Flush queued usage and stop the writers (app shutdown)."""
+    stream.stop()
+    buffer.stop()
@@ -0,0 +1,210 @@
+import json
+import os
+import queue
+import socket
+import threading
+import time
+from typing import Optional
+
+from loguru import logger
+
+from talk2dom.api.utils import metrics
+
+# redis: 写入 Redis stream,后台批量落库;local: 进程内队列(重启会丢);off: 同步写库
+MODE = os.getenv("T2D_WRITE_BEHIND", "redis").strip().lower()
+BATCH_SIZE = int(os.getenv("T2D_WRITE_BEHIND_BATCH", "200"))
+FLUSH_MS = int(os.getenv("T2D_WRITE_BEHIND_FLUSH_MS", "500"))
+LOCAL_MAX = int(os.getenv("T2D_WRITE_BEHIND_LOCAL_MAX", "10000"))
+GROUP = "t2d-writers"
+# 消费者崩溃后,超过这个时间未确认的消息由其他 worker 接手
+CLAIM_IDLE_MS = 60000
+
+
+class WriteBehind:
+    """Queue of pending DB writes, flushed in batches by a background thread.
+
+    ``flush(entries)`` must persist the whole batch or raise; entries are only
+    acknowledged (removed from the stream) after it returns, so a crash between
+    enqueue and flush loses nothing in redis mode.
+    """
+
+    def __init__(
+        self, redis_factory, aredis_factory, stream: str, flush, sync_factory=None
+    ):
+        self.redis_factory = redis_factory
+        self.aredis_factory = aredis_factory
+        # 同步入队用的客户端(请求线程里调用),默认与消费者相同
+        self.sync_factory = sync_factory or redis_factory
+        self.stream = stream
+        self.flush = flush
+        self.consumer = f"{socket.gethostname()}-{os.getpid()}"
+        self._local = queue.Queue(maxsize=LOCAL_MAX)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._client = None
+        self._group_ready = False
+
+    @property
+    def enabled(self) -> bool:
+        return MODE in ("redis", "local")
+
+    @property
+    def running(self) -> bool:
+        # 没有启动 worker(脚本、测试)时不入队,否则写入永远不会落库
+        return self._thread is not None
+
+    async def aenqueue(self, entry: dict) -> bool:
+        """Queue one write; False means the caller has to write synchronously."""
+        if not self.running:
+            return False
+        if MODE == "local":
+            try:
+                self._local.put_nowait(entry)
+            except queue.Full:
+                metrics.incr("write_behind.queue_full")
+                return False
+        elif MODE == "redis":
+            try:
+                await self.aredis_factory().xadd(
+                    self.stream, {"p": json.dumps(entry, default=str)}
+                )
+            except Exception as e:
+                logger.warning(f"Write-behind enqueue failed: {e}")
+                return False
+        else:
+            return False
+        metrics.incr("write_behind.enqueued")
+        return True
+
+    def enqueue(self, entry: dict) -> bool:
+        """Synchronous ``aenqueue`` for callers running in a worker thread."""
+        if not self.running:
+            return False
+        if MODE == "local":
+            try:
+                self._local.put_nowait(entry)
+            except queue.Full:
+                metrics.incr("write_behind.queue_full")
+                return False
+        elif MODE == "redis":
+            try:
+                self.sync_factory().xadd(
+                    self.stream, {"p": json.dumps(entry, default=str)}
+                )
+            except Exception as e:
+                logger.warning(f"Write-behind enqueue failed: {e}")
+                return False
+        else:
+            return False
+        metrics.incr("write_behind.enqueued")
+        return True
+
+    def start(self) -> None:
+        if self._thread is not None or not self.enabled:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="t2d-write-behind", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the worker and flush what is already queued (app shutdown)."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=FLUSH_MS / 1000 + 5)
+            self._thread = None
+        try:
+            while self.drain_once(block=False):
+                pass
+        except Exception as e:
+            logger.error(f"Write-behind flush on shutdown failed: {e}")
+
+    def _run(self) -> None:
+        backoff = 1.0
+        while not self._stop.is_set():
+            try:
+                self.drain_once()
+                backoff = 1.0
+            except Exception as e:
+                # 批次未确认,稍后重试(stream 模式下也可能被其他 worker 接手)
+                logger.error(f"Write-behind flush failed: {e}")
+                metrics.incr("write_behind.flush_errors")
+                self._client = None
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, 30.0)
+
+    def drain_once(self, block: bool = True) -> int:
+        """Read one batch, flush it and acknowledge it; returns the batch size."""
+        batch = self._read_local(block) if MODE == "local" else self._read_stream(block)
+        if not batch:
+            return 0
+        start = time.perf_counter()
+        try:
+            self.flush([entry for _, entry in batch])
+        except Exception:
+            if MODE == "local":
+                # 本地队列没有 pending 列表,失败的批次放回去
+                for _, entry in batch:
+                    try:
+                        self._local.put_nowait(entry)
+                    except queue.Full:
+                        metrics.incr("write_behind.dropped")
+            raise
+        if MODE == "redis":
+            ids = [message_id for message_id, _ in batch]
+            client = self._redis()
+            client.xack(self.stream, GROUP, *ids)
+            client.xdel(self.stream, *ids)
+        metrics.incr("write_behind.flushed", len(batch))
+        metrics.observe("write_behind.batch_size", len(batch))
+        metrics.observe("write_behind.flush_ms", (time.perf_counter() - start) * 1000)
+        return len(batch)
+
+    def _read_local(self, block: bool) -> list:
+        batch = []
+        try:
+            entry = self._local.get(timeout=FLUSH_MS / 1000) if block else None
+            if entry is not None:
+                batch.append((None, entry))
+            while len(batch) < BATCH_SIZE:
+                batch.append((None, self._local.get_nowait()))
+        except queue.Empty:
+            pass
+        return batch
+
+    def _redis(self):
+        if self._client is None:
+            self._client = self.redis_factory()
+            self._group_ready = False
+        if not self._group_ready:
+            try:
+                self._client.xgroup_create(self.stream, GROUP, id="0", mkstream=True)
+            except Exception as e:
+                if "BUSYGROUP" not in str(e):
+                    raise
+            self._group_ready = True
+        return self._client
+
+    def _read_stream(self, block: bool) -> list:
+        client = self._redis()
+        # 先接手崩溃的 worker 留下的消息
+        _, messages, *_ = client.xautoclaim(
+            self.stream, GROUP, self.consumer, CLAIM_IDLE_MS, count=BATCH_SIZE
+        )
+        if not messages:
+            response = client.xreadgroup(
+                GROUP,
+                self.consumer,
+                {self.stream: ">"},
+                count=BATCH_SIZE,
+                block=FLUSH_MS if block else None,
+            )
+            messages = response[0][1] if response else []
+        batch = []
+        for message_id, fields in messages:
+            if fields and "p" in fields:
+                batch.append((message_id, json.loads(fields["p"])))
+            else:
+                client.xack(self.stream, GROUP, message_id)
+        return batch
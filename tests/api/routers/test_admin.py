@@ -95,6 +95,14 @@ def test_admin_requires_login(client):
     assert resp.headers["location"] == "/admin/login"
 
 
+def test_status_metrics_need_admin_session(client):
+    resp = client.get("/api/v1/status/metrics")
+    assert resp.status_code == 401
+    login(client)
+    resp = client.get("/api/v1/status/metrics")
+    assert resp.status_code == 200
+    assert client.get("/api/v1/status/healthz").status_code == 200
+
 def test_login_with_wrong_token(client):
     resp = client.post("/admin/login", data={"token": "nope"})
     assert resp.status_code == 401
@@ -228,20 +236,23 @@ def test_locator_call_records_meta(client, db_session, test_user, monkeypatch):
     from talk2dom.api.routers import inference
     from talk2dom.api.deps import get_current_user
 
-    monkeypatch.setattr(
-        inference, "get_cached_locator", lambda *a, **k: (None, None, None)
-    )
-    monkeypatch.setattr(
-        inference,
-        "call_selector_llm",
-        lambda *a, **k: SimpleNamespace(
+    async def fake_get_cached_locator(*a, **k):
+        return None, None, None
+
+    async def fake_call_selector_llm(*a, **k):
+        return SimpleNamespace(
             action_type="click",
             action_value="",
             selector_type="css selector",
             selector_value="button#plus",
-        ),
-    )
-    monkeypatch.setattr(inference, "save_locator", lambda *a, **k: None)
+        )
+
+    async def fake_save_locator(*a, **k):
+        return None
+
+    monkeypatch.setattr(inference, "aget_cached_locator", fake_get_cached_locator)
+    monkeypatch.setattr(inference, "acall_selector_llm", fake_call_selector_llm)
+    monkeypatch.setattr(inference, "asave_locator", fake_save_locator)
     app.dependency_overrides[get_current_user] = lambda: test_user
 
     resp = client.post(
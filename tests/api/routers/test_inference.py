@@ -158,3 +158,30 @@ def test_locator_playground_echoes_payload_if_present(client):
     data = r.json()
     assert data.get("ok") is True
     assert data.get("echo") == payload
+
+
+def test_oversized_batch_is_rejected_with_422():
+    from talk2dom.api import deps
+    from talk2dom.api.routers import inference
+    from talk2dom.api.schemas import BATCH_MAX_INSTRUCTIONS
+    from talk2dom.db.session import get_db
+
+    app = FastAPI()
+    app.include_router(inference.router, prefix="/api/v1/inference")
+    app.dependency_overrides = {
+        get_db: lambda: None,
+        deps.get_api_key_user: lambda: None,
+        deps.get_api_key_id: lambda: None,
+        deps.get_current_project_id: lambda: None,
+    }
+
+    resp = TestClient(app).post(
+        "/api/v1/inference/locator/batch",
+        json={
+            "url": "https://example.com",
+            "html": "<button>Go</button>",
+            "user_instructions": ["click go"] * (BATCH_MAX_INSTRUCTIONS + 1),
+        },
+    )
+
+    assert resp.status_code == 422
@@ -1,3 +1,4 @@
+import asyncio
 import inspect
 from types import SimpleNamespace
 
@@ -6,22 +7,30 @@ from talk2dom.api.schemas import LocatorRequest
 
 
 def test_locator_playground_cache_action_split(monkeypatch):
+    async def fake_get_cached_locator(*_args, **_kwargs):
+        return "css selector", "#login", "click:email"
+
     monkeypatch.setattr(
         inference,
-        "get_cached_locator",
-        lambda *_args, **_kwargs: ("css selector", "#login", "click:email"),
+        "aget_cached_locator",
+        fake_get_cached_locator,
     )
 
-    class DummyValidator:
-        def __init__(self, _html):
-            pass
+    class DummyDocument:
+        def __init__(self, html):
+            self.cleaned_html = html
+            self.structure_html = html
+
+        def html_id(self, _url):
+            return "html-id"
+
+        async def ahtml_id(self, url):
+            return self.html_id(url)
 
-        def verify(self, _type, _selector):
+        async def averify(self, _type, _selector):
             return True
 
-    monkeypatch.setattr(inference, "SelectorValidator", DummyValidator)
-    monkeypatch.setattr(inference, "clean_html", lambda html: html)
-    monkeypatch.setattr(inference, "clean_html_keep_structure_only", lambda html: html)
+    monkeypatch.setattr(inference, "ParsedDocument", DummyDocument)
 
     req = LocatorRequest(
         url="https://example.com", html="<div></div>", user_instruction="click"
@@ -30,9 +39,609 @@ def test_locator_playground_cache_action_split(monkeypatch):
     user = SimpleNamespace(id="u1", email="u@example.com")
 
     func = inspect.unwrap(inference.locate_playground)
-    resp = func(req=req, request=request, db=None, user=user)
+    resp = asyncio.run(func(req=req, request=request, db=None, user=user))
 
     assert resp.action_type == "click"
     assert resp.action_value == "email"
     assert resp.selector_type == "css selector"
     assert resp.selector_value == "#login"
+
+
+def test_locator_cache_hit_with_url_skips_cleaning(monkeypatch):
+    calls = {}
+
+    async def fake_get_cached_locator(instruction, html, url, *_args, **kwargs):
+        calls["html_id"] = kwargs.get("html_id")
+        return "id", "login", "click:"
+
+    monkeypatch.setattr(inference, "aget_cached_locator", fake_get_cached_locator)
+
+    class NoCleanDocument:
+        def __init__(self, html):
+            self.html = html
+
+        @property
+        def cleaned_html(self):
+            raise AssertionError("cache hits must not clean the html")
+
+        structure_html = cleaned_html
+
+        def html_id(self, url):
+            return f"id:{url}"
+
+        async def ahtml_id(self, url):
+            return self.html_id(url)
+
+        async def averify(self, _type, _selector):
+            return True
+
+    monkeypatch.setattr(inference, "ParsedDocument", NoCleanDocument)
+
+    req = LocatorRequest(
+        url="https://example.com/login?next=/",
+        html="<button id='login'></button>",
+        user_instruction="click login",
+    )
+    request = SimpleNamespace(state=SimpleNamespace())
+    user = SimpleNamespace(id="u1", email="u@example.com")
+
+    func = inspect.unwrap(inference.locate)
+    resp = asyncio.run(
+        func(
+            req=req,
+            request=request,
+            db=None,
+            user=user,
+            api_key_id="k1",
+            project_id="p1",
+        )
+    )
+
+    assert resp.selector_type == "id"
+    assert resp.selector_value == "login"
+    assert calls["html_id"] == "id:https://example.com/login"
+    assert request.state.usage_metadata["cache_hit"] is True
+
+
+def test_concurrent_misses_call_the_llm_once(monkeypatch):
+    from talk2dom.db import singleflight
+
+    async def miss(*_args, **_kwargs):
+        return None, None, None
+
+    llm_calls = []
+
+    async def fake_llm(*_args, **_kwargs):
+        llm_calls.append(1)
+        await asyncio.sleep(0.01)
+        return SimpleNamespace(
+            action_type="click",
+            action_value="",
+            selector_type="id",
+            selector_value="login",
+        )
+
+    async def fake_save(*_args, **_kwargs):
+        return True
+
+    async def no_redis_lock(_key):
+        return ""
+
+    monkeypatch.setattr(inference, "aget_cached_locator", miss)
+    monkeypatch.setattr(inference, "acall_selector_llm", fake_llm)
+    monkeypatch.setattr(inference, "asave_locator", fake_save)
+    monkeypatch.setattr(singleflight, "_acquire", no_redis_lock)
+
+    func = inspect.unwrap(inference.locate_playground)
+    user = SimpleNamespace(id="u1", email="u@example.com")
+    requests = [SimpleNamespace(state=SimpleNamespace()) for _ in range(3)]
+
+    async def main():
+        req = LocatorRequest(
+            url="https://example.com",
+            html="<body><button id='login'>Log in</button></body>",
+            user_instruction="click login",
+        )
+        return await asyncio.gather(
+            *[func(req=req, request=r, db=None, user=user) for r in requests]
+        )
+
+    responses = asyncio.run(main())
+
+    assert len(llm_calls) == 1
+    assert {r.selector_value for r in responses} == {"login"}
+    assert sum(r.state.call_llm for r in requests) == 1
+    assert sorted(r.state.usage_metadata.get("coalesced", "") for r in requests) == [
+        "",
+        "local",
+        "local",
+    ]
+
+
+
+def test_local_follower_verifies_leader_selector_on_its_own_html(monkeypatch):
+    from talk2dom.db import singleflight
+
+    async def miss(*_args, **_kwargs):
+        return None, None, None
+
+    async def fake_llm(_instruction, html, *_args, **_kwargs):
+        await asyncio.sleep(0.01)
+        value = "login" if "login" in html else "signin"
+        return SimpleNamespace(
+            action_type="click",
+            action_value="",
+            selector_type="id",
+            selector_value=value,
+        )
+
+    async def fake_save(*_args, **_kwargs):
+        return True
+
+    async def no_redis_lock(_key):
+        return ""
+
+    monkeypatch.setattr(inference, "aget_cached_locator", miss)
+    monkeypatch.setattr(inference, "acall_selector_llm", fake_llm)
+    monkeypatch.setattr(inference, "asave_locator", fake_save)
+    monkeypatch.setattr(singleflight, "_acquire", no_redis_lock)
+
+    func = inspect.unwrap(inference.locate_playground)
+    user = SimpleNamespace(id="u1", email="u@example.com")
+    requests = [SimpleNamespace(state=SimpleNamespace()) for _ in range(2)]
+
+    async def main():
+        # 同一个 url,页面内容不同(例如 A/B 实验)
+        pages = [
+            "<body><button id='login'>Log in</button></body>",
+            "<body><button id='signin'>Log in</button></body>",
+        ]
+        return await asyncio.gather(
+            *[
+                func(
+                    req=LocatorRequest(
+                        url="https://example.com",
+                        html=html,
+                        user_instruction="click login",
+                    ),
+                    request=r,
+                    db=None,
+                    user=user,
+                )
+                for html, r in zip(pages, requests)
+            ]
+        )
+
+    responses = asyncio.run(main())
+
+    assert [r.selector_value for r in responses] == ["login", "signin"]
+    assert all(r.state.call_llm for r in requests)
+    assert "coalesced" not in requests[1].state.usage_metadata
+
+
+def test_local_follower_does_not_reuse_not_found_for_other_html(monkeypatch):
+    from talk2dom.db import singleflight
+
+    async def miss(*_args, **_kwargs):
+        return None, None, None
+
+    async def no_negative(*_args, **_kwargs):
+        return None
+
+    saved_negative = []
+
+    async def fake_save_negative(locator_id, digest, action):
+        saved_negative.append(digest)
+
+    async def fake_llm(_instruction, html, *_args, **_kwargs):
+        await asyncio.sleep(0.01)
+        found = "signin" in html
+        return SimpleNamespace(
+            action_type="click",
+            action_value="",
+            selector_type="id" if found else "not found",
+            selector_value="signin" if found else "",
+        )
+
+    async def fake_save(*_args, **_kwargs):
+        return True
+
+    async def no_redis_lock(_key):
+        return ""
+
+    monkeypatch.setattr(inference, "aget_cached_locator", miss)
+    monkeypatch.setattr(inference, "aget_negative_locator", no_negative)
+    monkeypatch.setattr(inference, "asave_negative_locator", fake_save_negative)
+    monkeypatch.setattr(inference, "acall_selector_llm", fake_llm)
+    monkeypatch.setattr(inference, "asave_locator", fake_save)
+    monkeypatch.setattr(singleflight, "_acquire", no_redis_lock)
+
+    func = inspect.unwrap(inference.locate_playground)
+    user = SimpleNamespace(id="u1", email="u@example.com")
+    requests = [SimpleNamespace(state=SimpleNamespace()) for _ in range(2)]
+    # leader 看到的是加载中的页面,follower 的页面已经渲染出按钮
+    pages = [
+        "<body><div class='spinner'></div></body>",
+        "<body><button id='signin'>Log in</button></body>",
+    ]
+
+    async def main():
+        return await asyncio.gather(
+            *[
+                func(
+                    req=LocatorRequest(
+                        url="https://example.com",
+                        html=html,
+                        user_instruction="click login",
+                    ),
+                    request=r,
+                    db=None,
+                    user=user,
+                )
+                for html, r in zip(pages, requests)
+            ]
+        )
+
+    responses = asyncio.run(main())
+
+    assert [r.selector_type for r in responses] == ["not found", "id"]
+    assert responses[1].selector_value == "signin"
+    assert all(r.state.call_llm for r in requests)
+    # 只有 leader 的页面记入 negative cache
+    assert len(saved_negative) == 1
+
+def test_locator_batch_resolves_misses_in_one_llm_call(monkeypatch):
+    from talk2dom.api.schemas import LocatorBatchRequest
+
+    async def cached(instructions, *_args, **_kwargs):
+        return [
+            ("id", "login", "click:") if text == "click login" else (None, None, None)
+            for text in instructions
+        ]
+
+    llm_calls = []
+
+    async def fake_batch_llm(instructions, *_args, **_kwargs):
+        llm_calls.append(list(instructions))
+        return [
+            SimpleNamespace(
+                action_type="type",
+                action_value="x",
+                selector_type="name",
+                selector_value="email",
+            ),
+            SimpleNamespace(
+                action_type="",
+                action_value="",
+                selector_type="id",
+                selector_value="missing",
+            ),
+        ]
+
+    saved = []
+
+    async def fake_save(instruction, *_args, **_kwargs):
+        saved.append(instruction)
+
+    monkeypatch.setattr(inference, "aget_cached_locators", cached)
+    monkeypatch.setattr(inference, "acall_selector_batch_llm", fake_batch_llm)
+    monkeypatch.setattr(inference, "asave_locator", fake_save)
+
+    req = LocatorBatchRequest(
+        url="https://example.com/login",
+        html="<body><button id='login'></button><input name='email'/></body>",
+        user_instructions=["click login", "type x into email", "find the logo"],
+    )
+    request = SimpleNamespace(state=SimpleNamespace())
+    user = SimpleNamespace(id="u1", email="u@example.com")
+
+    func = inspect.unwrap(inference.locate_batch)
+    resp = asyncio.run(
+        func(
+            req=req,
+            request=request,
+            db=None,
+            user=user,
+            api_key_id="k1",
+            project_id="p1",
+        )
+    )
+
+    assert llm_calls == [["type x into email", "find the logo"]]
+    assert [r.cache_hit for r in resp.results] == [True, False, False]
+    assert [r.selector_value for r in resp.results] == ["login", "email", "missing"]
+    # only selectors that verify against the page are cached
+    assert saved == ["type x into email"]
+    items = request.state.usage_items
+    assert [i["call_llm"] for i in items] == [False, True, True]
+    assert items[0]["metadata"]["user_instruction"] == "click login"
+
+
+def test_index_mode_builds_selector_from_picked_element(monkeypatch):
+    from talk2dom.api.utils import element_index
+    from talk2dom.db import singleflight
+
+    async def miss(*_args, **_kwargs):
+        return None, None, None
+
+    prompts = []
+
+    async def fake_pick(_instruction, html, *_args, **_kwargs):
+        prompts.append(html)
+        return SimpleNamespace(element_index=3, action_type="click", action_value="")
+
+    saved = []
+
+    async def fake_save(_instruction, _structure, selector_type, selector_value, **_kw):
+        saved.append((selector_type, selector_value))
+        return True
+
+    async def no_redis_lock(_key):
+        return ""
+
+    monkeypatch.setattr(element_index, "SELECTOR_MODE", "index")
+    monkeypatch.setattr(inference, "aget_cached_locator", miss)
+    monkeypatch.setattr(inference, "acall_element_index_llm", fake_pick)
+    monkeypatch.setattr(inference, "asave_locator", fake_save)
+    monkeypatch.setattr(singleflight, "_acquire", no_redis_lock)
+
+    req = LocatorRequest(
+        url="https://example.com",
+        html="<body><form><button>Back</button><button>Log in</button></form></body>",
+        user_instruction="click log in",
+    )
+    request = SimpleNamespace(state=SimpleNamespace())
+    user = SimpleNamespace(id="u1", email="u@example.com")
+
+    func = inspect.unwrap(inference.locate_playground)
+    resp = asyncio.run(func(req=req, request=request, db=None, user=user))
+
+    assert 'data-t2d-idx="3">Log in' in prompts[0]
+    assert (resp.selector_type, resp.selector_value) == (
+        "css selector",
+        "button:nth-of-type(2)",
+    )
+    assert resp.action_type == "click"
+    assert saved == [("css selector", "button:nth-of-type(2)")]
+
+
+def test_unverified_selector_escalates_to_next_model(monkeypatch):
+    from talk2dom.api.utils import cascade
+    from talk2dom.db import singleflight
+
+    async def miss(*_args, **_kwargs):
+        return None, None, None
+
+    models = []
+
+    async def fake_llm(_instruction, _html, model, _provider, *_args, **_kwargs):
+        models.append(model)
+        value = "missing" if model == "small" else "login"
+        return SimpleNamespace(
+            action_type="click",
+            action_value="",
+            selector_type="id",
+            selector_value=value,
+        )
+
+    saved = []
+
+    async def fake_save(_instruction, _structure, selector_type, selector_value, **_kw):
+        saved.append(selector_value)
+        return True
+
+    async def no_redis_lock(_key):
+        return ""
+
+    monkeypatch.setattr(cascade, "MODEL_CASCADE", "openai:small,openai:large")
+    monkeypatch.setattr(inference, "aget_cached_locator", miss)
+    monkeypatch.setattr(inference, "acall_selector_llm", fake_llm)
+    monkeypatch.setattr(inference, "asave_locator", fake_save)
+    monkeypatch.setattr(singleflight, "_acquire", no_redis_lock)
+
+    req = LocatorRequest(
+        url="https://example.com",
+        html="<body><button id='login'>Log in</button></body>",
+        user_instruction="click login",
+    )
+    request = SimpleNamespace(state=SimpleNamespace())
+    user = SimpleNamespace(id="u1", email="u@example.com")
+
+    func = inspect.unwrap(inference.locate_playground)
+    resp = asyncio.run(func(req=req, request=request, db=None, user=user))
+
+    assert models == ["small", "large"]
+    assert resp.selector_value == "login"
+    assert saved == ["login"]
+    meta = request.state.usage_metadata
+    assert meta["model"] == "openai:large"
+    assert [step["outcome"] for step in meta["cascade"]] == ["rejected", "accepted"]
+
+
+def test_not_found_is_negatively_cached_for_the_same_html(monkeypatch):
+    from talk2dom.db import singleflight
+
+    async def miss(*_args, **_kwargs):
+        return None, None, None
+
+    negative = {}
+
+    async def fake_get_negative(locator_id, digest):
+        return negative.get((locator_id, digest))
+
+    async def fake_save_negative(locator_id, digest, action):
+        negative[(locator_id, digest)] = action
+
+    llm_calls = []
+
+    async def fake_llm(*_args, **_kwargs):
+        llm_calls.append(1)
+        return SimpleNamespace(
+            action_type="click",
+            action_value="",
+            selector_type="not found",
+            selector_value="",
+        )
+
+    async def no_redis_lock(_key):
+        return ""
+
+    monkeypatch.setattr(inference, "aget_cached_locator", miss)
+    monkeypatch.setattr(inference, "aget_negative_locator", fake_get_negative)
+    monkeypatch.setattr(inference, "asave_negative_locator", fake_save_negative)
+    monkeypatch.setattr(inference, "acall_selector_llm", fake_llm)
+    monkeypatch.setattr(singleflight, "_acquire", no_redis_lock)
+
+    func = inspect.unwrap(inference.locate_playground)
+    user = SimpleNamespace(id="u1", email="u@example.com")
+
+    def locate(html):
+        req = LocatorRequest(
+            url="https://example.com", html=html, user_instruction="click save"
+        )
+        request = SimpleNamespace(state=SimpleNamespace())
+        resp = asyncio.run(func(req=req, request=request, db=None, user=user))
+        return resp, request.state
+
+    loading = "<body><div class='spinner'></div></body>"
+    first, _ = locate(loading)
+    second, state = locate(loading)
+
+    assert first.selector_type == second.selector_type == "not found"
+    assert second.action_type == "click"
+    assert state.usage_metadata["negative_cache_hit"] is True
+    assert state.call_llm is False
+    assert len(llm_calls) == 1
+
+    # 页面变化后摘要不同,重新调用 LLM
+    locate("<body><button>Save</button></body>")
+    assert len(llm_calls) == 2
+
+
+def test_similar_instruction_reuses_verified_locator(monkeypatch):
+    async def miss(*_args, **_kwargs):
+        return None, None, None
+
+    async def similar(instruction, html_id, project_id):
+        return "id", "login", "click:", 0.9
+
+    async def no_llm(*_args, **_kwargs):
+        raise AssertionError("a fuzzy hit must not call the LLM")
+
+    monkeypatch.setattr(inference, "aget_cached_locator", miss)
+    monkeypatch.setattr(inference, "aget_similar_locator", similar)
+    monkeypatch.setattr(inference, "acall_selector_llm", no_llm)
+
+    req = LocatorRequest(
+        url="https://example.com",
+        html="<button id='login'>Login</button>",
+        user_instruction="press the login button",
+    )
+    request = SimpleNamespace(state=SimpleNamespace())
+    user = SimpleNamespace(id="u1", email="u@example.com")
+
+    func = inspect.unwrap(inference.locate_playground)
+    resp = asyncio.run(func(req=req, request=request, db=None, user=user))
+
+    assert resp.selector_value == "login"
+    meta = request.state.usage_metadata
+    assert meta["cache_hit"] is True
+    assert meta["cache_match"] == "fuzzy"
+    assert meta["similarity"] == 0.9
+
+
+def test_product_pages_share_html_id_when_backbones_match(monkeypatch):
+    from talk2dom.api.utils import url_template
+    from talk2dom.api.utils.document import ParsedDocument
+
+    monkeypatch.setattr(url_template, "AUTO_DETECT", True)
+
+    page = "<html><body><div><h1>{}</h1><button>Buy</button></div></body></html>"
+    stored = url_template.backbone_signature(
+        ParsedDocument(page.format("first")).structure_html
+    )
+
+    async def fake_signature(html_id):
+        return stored
+
+    monkeypatch.setattr(inference, "aget_backbone_signature", fake_signature)
+    request = SimpleNamespace(state=SimpleNamespace(url_templates=None))
+
+    async def page_id(html, url):
+        return await inference._page_html_id(
+            request, ParsedDocument(html), url, inference._url_path(url)
+        )
+
+    first = asyncio.run(page_id(page.format("a"), "https://shop.com/product/1?utm=x"))
+    second = asyncio.run(page_id(page.format("b"), "https://shop.com/product/2"))
+    other = asyncio.run(
+        page_id(
+            "<body><table><tr><td></td></tr></table></body>",
+            "https://shop.com/product/3",
+        )
+    )
+
+    assert first == second
+    assert first[1] == "https://shop.com/product/{id}"
+    # 骨架不同的页面不共用缓存
+    assert other == (ParsedDocument("").html_id("https://shop.com/product/3"), None)
+
+
+
+def test_untemplated_urls_keep_their_own_html_id(monkeypatch):
+    from talk2dom.api.utils.document import ParsedDocument
+
+    async def no_lookup(_html_id):
+        raise AssertionError("ordinary URLs must not take the template branch")
+
+    monkeypatch.setattr(inference, "aget_backbone_signature", no_lookup)
+    request = SimpleNamespace(state=SimpleNamespace(url_templates=None))
+    doc = ParsedDocument("<body></body>")
+
+    for url in ("https://Shop.com/cart/", "https://shop.com/cart#summary"):
+        url_path = inference._url_path(url)
+        result = asyncio.run(inference._page_html_id(request, doc, url, url_path))
+        assert result == (doc.html_id(url_path), None)
+
+def test_url_less_miss_reuses_nearest_snapshot(monkeypatch):
+    async def miss(*_args, **_kwargs):
+        return None, None, None
+
+    async def no_similar(*_args, **_kwargs):
+        return None
+
+    async def nearest(instruction, structure_html, html_id, project_id):
+        return [("id", "gone", "click:", 1), ("id", "login", "click:", 2)]
+
+    saved = []
+
+    async def fake_save(*args, **kwargs):
+        saved.append(kwargs)
+        return True
+
+    async def no_llm(*_args, **_kwargs):
+        raise AssertionError("a nearest-snapshot hit must not call the LLM")
+
+    monkeypatch.setattr(inference, "aget_cached_locator", miss)
+    monkeypatch.setattr(inference, "aget_similar_locator", no_similar)
+    monkeypatch.setattr(inference, "aget_nearest_locators", nearest)
+    monkeypatch.setattr(inference, "asave_locator", fake_save)
+    monkeypatch.setattr(inference, "acall_selector_llm", no_llm)
+
+    req = LocatorRequest(
+        url="",
+        html="<body><div class='banner'></div><button id='login'>Login</button></body>",
+        user_instruction="click login",
+    )
+    request = SimpleNamespace(state=SimpleNamespace())
+    user = SimpleNamespace(id="u1", email="u@example.com")
+
+    func = inspect.unwrap(inference.locate_playground)
+    resp = asyncio.run(func(req=req, request=request, db=None, user=user))
+
+    assert resp.selector_value == "login"
+    meta = request.state.usage_metadata
+    assert meta["cache_match"] == "nearest"
+    assert meta["hamming_distance"] == 2
+    # 命中结果写回本页面自己的键
+    assert saved and saved[0]["html_id"] == meta["html_id"]
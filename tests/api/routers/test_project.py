@@ -461,3 +461,48 @@ def test_list_locator_cache_pagination(client, app, db, current_user):
     d2 = r2.json()
     assert d2["has_next"] is False
     assert len(d2["items"]) == 1
+
+
+def test_update_project_model_cascade(client, db, current_user):
+    project = _mk_project(db, current_user.id, name="Cascade")
+    _add_member(db, project.id, current_user.id, role="owner")
+
+    bad = client.put(
+        f"/api/v1/{project.id}", json={"name": "Cascade", "model_cascade": "gpt-4o"}
+    )
+    assert bad.status_code == 400
+
+    spec = "openai:gpt-4o-mini@8,openai:gpt-4o@30"
+    r = client.put(
+        f"/api/v1/{project.id}", json={"name": "Cascade", "model_cascade": spec}
+    )
+    assert r.status_code == 200
+    assert r.json()["model_cascade"] == spec
+
+    # 只改名字时保留级联配置,空字符串恢复全局配置
+    r = client.put(f"/api/v1/{project.id}", json={"name": "Renamed"})
+    assert r.json()["model_cascade"] == spec
+    r = client.put(
+        f"/api/v1/{project.id}", json={"name": "Renamed", "model_cascade": ""}
+    )
+    assert r.json()["model_cascade"] is None
+
+
+def test_update_project_url_templates(client, db, current_user):
+    project = _mk_project(db, current_user.id, name="Shop")
+    _add_member(db, project.id, current_user.id, role="owner")
+
+    bad = client.put(
+        f"/api/v1/{project.id}", json={"name": "Shop", "url_templates": "product/*"}
+    )
+    assert bad.status_code == 400
+
+    spec = "/product/{sku}, /category/*"
+    r = client.put(
+        f"/api/v1/{project.id}", json={"name": "Shop", "url_templates": spec}
+    )
+    assert r.status_code == 200
+    assert r.json()["url_templates"] == spec
+
+    r = client.put(f"/api/v1/{project.id}", json={"name": "Shop", "url_templates": ""})
+    assert r.json()["url_templates"] is None
@@ -2,6 +2,17 @@ from fastapi import FastAPI
 from fastapi.testclient import TestClient
 
 from talk2dom.api.routers import status as status_router
+from talk2dom.db.session import get_db
+
+ADMIN_TOKEN = "test-admin-token"
+
+
+def _admin_client(monkeypatch):
+    monkeypatch.setenv("ADMIN_TOKEN", ADMIN_TOKEN)
+    app = FastAPI()
+    app.include_router(status_router.router, prefix="/api/v1")
+    app.dependency_overrides[get_db] = lambda: None
+    return TestClient(app, headers={"Authorization": f"Bearer {ADMIN_TOKEN}"})
 
 
 def test_healthz_ok():
@@ -12,3 +23,66 @@ def test_healthz_ok():
     resp = client.get("/api/v1/healthz")
     assert resp.status_code == 200
     assert resp.json() == {"status": "ok"}
+
+
+def test_metrics_exposes_snapshot(monkeypatch):
+    from talk2dom.api.utils import metrics
+
+    metrics.reset()
+    metrics.incr("offload.inline")
+    metrics.observe("offload.process.run_ms", 4.0)
+    client = _admin_client(monkeypatch)
+
+    resp = client.get("/api/v1/metrics")
+    assert resp.status_code == 200
+    body = resp.json()
+    assert body["counters"]["offload.inline"] == 1
+    assert body["timings"]["offload.process.run_ms"] == {
+        "count": 1,
+        "avg": 4.0,
+        "max": 4.0,
+    }
+    metrics.reset()
+
+
+def test_breakers_exposes_provider_state(monkeypatch):
+    from talk2dom.api.utils import breaker
+
+    breaker.get("openai").record(False, 10)
+    client = _admin_client(monkeypatch)
+
+    resp = client.get("/api/v1/breakers")
+    assert resp.status_code == 200
+    body = resp.json()
+    assert body["breakers"]["openai"]["state"] == "closed"
+    assert body["breakers"]["openai"]["calls"] == 1
+
+
+def test_cache_reports_hit_ratio_per_tier(monkeypatch):
+    from talk2dom.api.utils import metrics
+
+    metrics.reset()
+    metrics.incr("locator_cache.l1_hit", 6)
+    metrics.incr("locator_cache.l2_hit", 2)
+    metrics.incr("locator_cache.db_hit", 1)
+    metrics.incr("locator_cache.miss", 1)
+    client = _admin_client(monkeypatch)
+
+    body = client.get("/api/v1/cache").json()
+    assert body["lookups"] == 10
+    assert body["ratios"]["l1_hit"] == 0.6
+    assert body["ratios"]["miss"] == 0.1
+    assert body["l1"]["entries"] == 0
+    metrics.reset()
+
+
+def test_status_routes_require_admin(monkeypatch):
+    client = _admin_client(monkeypatch)
+
+    for path in ("/api/v1/metrics", "/api/v1/breakers", "/api/v1/cache"):
+        assert client.get(path, headers={"Authorization": ""}).status_code == 401
+        wrong = {"Authorization": "Bearer nope"}
+        assert client.get(path, headers=wrong).status_code == 401
+    # 没有配置 ADMIN_TOKEN 时 bearer 入口关闭
+    monkeypatch.delenv("ADMIN_TOKEN")
+    assert client.get("/api/v1/metrics").status_code == 401
@@ -66,9 +66,95 @@ def test_webhook_payment_intent_updates_credits(monkeypatch):
     }
 
     monkeypatch.setattr(webhook_router.stripe.Webhook, "construct_event", lambda *_args, **_kwargs: event)
+    invalidated = []
+    monkeypatch.setattr(
+        webhook_router.context_cache, "invalidate_user", invalidated.append
+    )
 
     resp = client.post("/api/v1/stripe", data=b"{}", headers={"stripe-signature": "sig"})
     assert resp.status_code == 200
 
     refreshed = db.query(User).filter(User.email == "u@example.com").first()
     assert refreshed.one_time_credits == 5
+    # 写库后作废缓存的请求上下文,否则余额要等上下文过期才更新
+    assert invalidated == [refreshed.id]
+
+
+def test_webhook_payment_intent_tops_up_cached_balance(monkeypatch):
+    db = make_db_session()
+    db.add(User(email="u@example.com", provider_user_id="local:u", one_time_credits=0))
+    db.commit()
+    client = TestClient(make_app(db))
+    topped_up = []
+
+    def fake_top_up(user_id, amount):
+        topped_up.append(amount)
+        return True
+
+    event = {
+        "type": "payment_intent.succeeded",
+        "data": {"object": {"metadata": {"email": "u@example.com", "credit": "5"}}},
+    }
+    monkeypatch.setattr(
+        webhook_router.stripe.Webhook, "construct_event", lambda *_a, **_k: event
+    )
+    monkeypatch.setattr(webhook_router.counters, "top_up", fake_top_up)
+
+    resp = client.post("/api/v1/stripe", data=b"{}", headers={"stripe-signature": "sig"})
+    assert resp.status_code == 200
+    assert topped_up == [5]
+    # 余额在 Redis 计数器里,由 reconciler 写回
+    assert db.query(User).first().one_time_credits == 0
+
+
+def test_webhook_subscription_reset_evicts_cached_balance_after_commit(monkeypatch):
+    db = make_db_session()
+    db.add(
+        User(
+            email="u@example.com",
+            provider_user_id="local:u",
+            subscription_credits=3,
+            one_time_credits=10,
+        )
+    )
+    db.commit()
+    client = TestClient(make_app(db))
+    evicted = []
+
+    def fake_evict(user_id):
+        # 提交前清掉的话,并发请求会用旧数据库行重新加载余额
+        evicted.append(bool(db.dirty))
+        return -3, -2
+
+    event = {
+        "type": "invoice.payment_succeeded",
+        "data": {
+            "object": {
+                "subscription": "sub_1",
+                "subscription_details": {
+                    "metadata": {"email": "u@example.com", "plan": "developer"}
+                },
+                "customer": "cus_1",
+                "status": "paid",
+            }
+        },
+    }
+    monkeypatch.setattr(
+        webhook_router.stripe.Webhook, "construct_event", lambda *_a, **_k: event
+    )
+    monkeypatch.setattr(
+        webhook_router.stripe.Subscription,
+        "retrieve",
+        lambda _id: {"items": {"data": [{"current_period_end": 1700000000}]}},
+    )
+    monkeypatch.setattr(webhook_router.counters, "evict", fake_evict)
+
+    resp = client.post("/api/v1/stripe", data=b"{}", headers={"stripe-signature": "sig"})
+    assert resp.status_code == 200
+    assert evicted == [False]
+    user = db.query(User).first()
+    assert (user.plan, user.subscription_credits, user.one_time_credits) == (
+        "developer",
+        1000,
+        8,
+    )
@@ -100,3 +100,290 @@ def test_handle_pending_invites_creates_membership():
     assert membership is not None
     refreshed_invite = db.query(ProjectInvite).first()
     assert refreshed_invite.accepted is True
+
+
+def test_track_api_usage_supports_async_endpoints():
+    import asyncio
+    from types import SimpleNamespace
+
+    from talk2dom.db.models import APIUsage
+
+    db = make_session()
+    owner = User(
+        email="o@example.com",
+        provider_user_id="local:o",
+        subscription_credits=2,
+        one_time_credits=0,
+    )
+    db.add(owner)
+    db.commit()
+    project = Project(name="P", owner_id=owner.id)
+    db.add(project)
+    db.commit()
+
+    @deps.track_api_usage()
+    async def endpoint(request, db, user, project_id, api_key_id=None):
+        request.state.call_llm = True
+        request.state.usage_metadata = {"cache_hit": False}
+        return {"ok": True}
+
+    request = SimpleNamespace(
+        state=SimpleNamespace(), url=SimpleNamespace(path="/api/v1/inference/locator")
+    )
+    result = asyncio.run(
+        endpoint(request=request, db=db, user=owner, project_id=project.id)
+    )
+
+    assert result == {"ok": True}
+    usage = db.query(APIUsage).one()
+    assert usage.status_code == 200
+    assert usage.call_llm is True
+    assert owner.subscription_credits == 1
+    db.refresh(project)
+    assert project.api_call_count == 1
+
+
+def test_track_api_usage_records_batch_items_individually():
+    import asyncio
+    from types import SimpleNamespace
+
+    from talk2dom.db.models import APIUsage
+
+    db = make_session()
+    owner = User(
+        email="o@example.com",
+        provider_user_id="local:o",
+        subscription_credits=5,
+        one_time_credits=0,
+    )
+    db.add(owner)
+    db.commit()
+    project = Project(name="P", owner_id=owner.id)
+    db.add(project)
+    db.commit()
+
+    @deps.track_api_usage()
+    async def endpoint(request, db, user, project_id, api_key_id=None):
+        request.state.call_llm = True
+        request.state.usage_items = [
+            {"call_llm": False, "metadata": {"cache_hit": True}},
+            {"call_llm": True, "input_tokens": 10, "metadata": {"cache_hit": False}},
+            {"call_llm": True, "input_tokens": 12, "metadata": {"cache_hit": False}},
+        ]
+        return {"ok": True}
+
+    request = SimpleNamespace(
+        state=SimpleNamespace(),
+        url=SimpleNamespace(path="/api/v1/inference/locator/batch"),
+    )
+    asyncio.run(endpoint(request=request, db=db, user=owner, project_id=project.id))
+
+    usages = db.query(APIUsage).all()
+    assert len(usages) == 3
+    assert sorted(u.call_llm for u in usages) == [False, True, True]
+    assert owner.subscription_credits == 2
+    db.refresh(project)
+    assert project.api_call_count == 3
+
+
+
+def test_batch_is_rejected_up_front_without_credits_for_every_item():
+    import asyncio
+    from types import SimpleNamespace
+
+    from talk2dom.db.models import APIUsage
+
+    db = make_session()
+    owner = User(
+        email="o@example.com",
+        provider_user_id="local:o",
+        subscription_credits=1,
+        one_time_credits=1,
+    )
+    db.add(owner)
+    db.commit()
+    project = Project(name="P", owner_id=owner.id)
+    db.add(project)
+    db.commit()
+    calls = []
+
+    @deps.track_api_usage()
+    async def endpoint(req, request, db, user, project_id, api_key_id=None):
+        calls.append(1)
+        return {"ok": True}
+
+    request = SimpleNamespace(
+        state=SimpleNamespace(),
+        url=SimpleNamespace(path="/api/v1/inference/locator/batch"),
+    )
+    req = SimpleNamespace(user_instructions=["a", "b", "c"])
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(
+            endpoint(req=req, request=request, db=db, user=owner, project_id=project.id)
+        )
+
+    assert exc.value.status_code == 402
+    assert calls == []
+    assert db.query(APIUsage).count() == 0
+
+    req = SimpleNamespace(user_instructions=["a", "b"])
+    asyncio.run(
+        endpoint(req=req, request=request, db=db, user=owner, project_id=project.id)
+    )
+    assert calls == [1]
+
+def test_track_api_usage_keeps_http_error_status():
+    import asyncio
+    from types import SimpleNamespace
+
+    from talk2dom.api.utils.deadline import DeadlineExceeded
+    from talk2dom.db.models import APIUsage
+
+    db = make_session()
+    owner = User(
+        email="o@example.com",
+        provider_user_id="local:o",
+        subscription_credits=2,
+        one_time_credits=0,
+    )
+    db.add(owner)
+    db.commit()
+    project = Project(name="P", owner_id=owner.id)
+    db.add(project)
+    db.commit()
+
+    @deps.track_api_usage()
+    async def endpoint(request, db, user, project_id, api_key_id=None):
+        raise DeadlineExceeded()
+
+    request = SimpleNamespace(
+        state=SimpleNamespace(), url=SimpleNamespace(path="/api/v1/inference/locator")
+    )
+    result = asyncio.run(
+        endpoint(request=request, db=db, user=owner, project_id=project.id)
+    )
+
+    assert result.status_code == 504
+    assert db.query(APIUsage).one().status_code == 504
+    assert owner.subscription_credits == 2
+
+
+def _context_fixture(monkeypatch, key_active=True):
+    from sqlalchemy import event
+
+    from talk2dom.db import cache
+    from talk2dom.db.models import APIKey
+
+    def no_redis():
+        raise ConnectionError("redis unavailable")
+
+    monkeypatch.setattr(cache, "_aredis", no_redis)
+    monkeypatch.setattr(cache, "_redis", no_redis)
+
+    db = make_session()
+    owner = User(
+        email="o@example.com",
+        provider_user_id="local:o",
+        plan="developer",
+        subscription_credits=3,
+        one_time_credits=0,
+    )
+    member = User(email="m@example.com", provider_user_id="local:m")
+    db.add_all([owner, member])
+    db.commit()
+    project = Project(name="P", owner_id=owner.id, model_cascade="openai:gpt-4o")
+    db.add(project)
+    db.commit()
+    db.add(ProjectMembership(user_id=owner.id, project_id=project.id, role="owner"))
+    db.add(APIKey(user_id=member.id, key="member-key", is_active=key_active))
+    db.commit()
+    for obj in (owner, member, project):
+        db.refresh(obj)
+
+    statements = []
+    event.listen(
+        db.get_bind(),
+        "before_cursor_execute",
+        lambda *args: statements.append(args[2]),
+    )
+    return db, owner, member, project, statements
+
+
+def _api_request(project_id, key="member-key"):
+    from types import SimpleNamespace
+
+    return SimpleNamespace(
+        headers={"Authorization": f"Bearer {key}", "X-Project-ID": str(project_id)},
+        query_params={},
+        state=SimpleNamespace(),
+    )
+
+
+def test_request_context_is_resolved_in_one_query_and_cached(monkeypatch):
+    import asyncio
+
+    db, owner, member, project, statements = _context_fixture(monkeypatch)
+
+    context = asyncio.run(deps.get_request_context(_api_request(project.id), db))
+    assert len(statements) == 1
+    assert context["user_id"] == str(member.id)
+    assert context["owner_id"] == str(owner.id)
+    assert context["member_count"] == 1
+    assert context["has_access"] is False
+
+    request = _api_request(project.id)
+    asyncio.run(deps.get_request_context(request, db))
+    assert len(statements) == 1
+    assert request.state.model_cascade == "openai:gpt-4o"
+
+    # 成为成员后上下文失效,重新查询
+    db.add(ProjectMembership(user_id=member.id, project_id=project.id))
+    db.commit()
+    deps.context_cache.invalidate_project(project.id)
+    statements.clear()
+    context = asyncio.run(deps.get_request_context(_api_request(project.id), db))
+    assert len(statements) == 1
+    assert context["has_access"] is True
+    assert context["member_count"] == 2
+
+
+def test_request_context_rejects_unknown_or_inactive_keys(monkeypatch):
+    import asyncio
+
+    db, _, _, project, _ = _context_fixture(monkeypatch, key_active=False)
+
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(deps.get_request_context(_api_request(project.id), db))
+    assert exc.value.status_code == 403
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(deps.get_request_context(_api_request(project.id, "nope"), db))
+    assert exc.value.status_code == 403
+
+
+def test_track_api_usage_checks_quota_from_request_context(monkeypatch):
+    import asyncio
+    from types import SimpleNamespace
+
+    db, owner, member, project, statements = _context_fixture(monkeypatch)
+    db.add(ProjectMembership(user_id=member.id, project_id=project.id))
+    db.commit()
+
+    @deps.track_api_usage()
+    async def endpoint(request, db, user, project_id, api_key_id=None):
+        return {"ok": True}
+
+    request = _api_request(project.id)
+    request.url = SimpleNamespace(path="/api/v1/inference/locator")
+    context = asyncio.run(deps.get_request_context(request, db))
+    user = asyncio.run(deps.get_api_key_user(context))
+    statements.clear()
+
+    result = asyncio.run(
+        endpoint(request=request, db=db, user=user, project_id=project.id)
+    )
+
+    assert result == {"ok": True}
+    # 只剩扣费前取回 owner 与写入用量
+    assert not any("project_memberships" in s for s in statements)
+    db.refresh(owner)
+    assert owner.subscription_credits == 2
@@ -12,3 +12,15 @@ def test_locator_request_defaults():
 def test_invite_request_requires_email():
     with pytest.raises(ValidationError):
         schemas.InviteRequest(email="not-an-email")
+
+
+def test_batch_request_bounds_instruction_count():
+    html = "<button>Go</button>"
+    with pytest.raises(ValidationError):
+        schemas.LocatorBatchRequest(url="", html=html, user_instructions=[])
+    with pytest.raises(ValidationError):
+        schemas.LocatorBatchRequest(
+            url="",
+            html=html,
+            user_instructions=["click"] * (schemas.BATCH_MAX_INSTRUCTIONS + 1),
+        )
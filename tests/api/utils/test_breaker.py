@@ -0,0 +1,94 @@
+import asyncio
+
+import pytest
+
+from talk2dom.api.utils import breaker, cascade
+from talk2dom.api.utils.cascade import ModelTier
+
+
+@pytest.fixture
+def fast_breaker(monkeypatch):
+    monkeypatch.setattr(breaker, "MIN_CALLS", 4)
+    monkeypatch.setattr(breaker, "ERROR_RATE", 0.5)
+    monkeypatch.setattr(breaker, "OPEN_SECONDS", 0)
+
+
+def _trip(name):
+    b = breaker.get(name)
+    for ok in (True, False, False, False):
+        b.record(ok, 100)
+    return b
+
+
+def test_breaker_opens_on_error_rate_and_closes_after_probe(fast_breaker, monkeypatch):
+    b = _trip("openai")
+    assert b.state == breaker.OPEN
+    assert "error rate 75%" in b.reason
+
+    # 半开状态一次只放行一个探测请求
+    assert b.allow() is True
+    assert b.state == breaker.HALF_OPEN
+    assert b.allow() is False
+    b.record(True, 50)
+    assert b.state == breaker.CLOSED
+    assert b.allow() is True
+
+
+def test_failed_probe_reopens(fast_breaker, monkeypatch):
+    b = _trip("openai")
+    monkeypatch.setattr(breaker, "OPEN_SECONDS", 60)
+    assert b.allow() is False
+    monkeypatch.setattr(breaker, "OPEN_SECONDS", 0)
+    assert b.allow() is True
+    b.record(False, 50)
+    assert b.state == breaker.OPEN
+
+
+def test_open_provider_is_rerouted_to_fallback(fast_breaker, monkeypatch):
+    monkeypatch.setattr(breaker, "FALLBACK_MODEL", "google_genai:gemini-flash")
+    b = _trip("openai")
+    b.opened_at = float("inf")  # 保持熔断
+
+    called = []
+
+    async def attempt(tier):
+        called.append(tier.label)
+        return "ok"
+
+    async def accept(_result):
+        return True
+
+    result, trace = asyncio.run(
+        cascade.run([ModelTier("openai", "gpt-4o", 5)], attempt, accept)
+    )
+
+    assert result == "ok"
+    assert called == ["google_genai:gemini-flash"]
+    assert trace[0]["breaker_open"] == "openai:gpt-4o"
+    assert trace[0]["model"] == "google_genai:gemini-flash"
+
+    monkeypatch.setattr(breaker, "FALLBACK_MODEL", "")
+    result, trace = asyncio.run(
+        cascade.run([ModelTier("openai", "gpt-4o")], attempt, accept)
+    )
+    assert result is None
+    assert trace[0]["outcome"] == "skipped"
+
+
+def test_cascade_feeds_breaker():
+    async def attempt(tier):
+        return None if tier.model == "bad" else "ok"
+
+    async def accept(_result):
+        return True
+
+    asyncio.run(
+        cascade.run(
+            [ModelTier("groq", "bad"), ModelTier("openai", "good")], attempt, accept
+        )
+    )
+
+    stats = breaker.snapshot()
+    assert stats["groq"]["calls"] == 1
+    assert stats["groq"]["error_rate"] == 1.0
+    assert stats["openai"]["error_rate"] == 0.0
@@ -0,0 +1,74 @@
+import asyncio
+
+import pytest
+
+from talk2dom.api.utils import cascade, metrics
+from talk2dom.api.utils.cascade import ModelTier
+
+
+def test_parse_cascade_reads_tiers_and_timeouts():
+    tiers = cascade.parse_cascade(" openai:gpt-4o-mini@8 , anthropic:claude-x ")
+
+    assert tiers == [
+        ModelTier("openai", "gpt-4o-mini", 8.0),
+        ModelTier("anthropic", "claude-x", None),
+    ]
+    for spec in ("gpt-4o", "openai:gpt-4o@0", " , "):
+        with pytest.raises(ValueError):
+            cascade.parse_cascade(spec)
+
+
+def test_resolve_tiers_prefers_project_override(monkeypatch):
+    monkeypatch.setattr(cascade, "MODEL_CASCADE", "openai:small,openai:large")
+
+    assert cascade.resolve_tiers("groq:fast", "m", "p") == [ModelTier("groq", "fast")]
+    assert len(cascade.resolve_tiers(None, "m", "p")) == 2
+    # 配置有误时退回全局配置
+    assert len(cascade.resolve_tiers("broken", "m", "p")) == 2
+
+    monkeypatch.setattr(cascade, "MODEL_CASCADE", "")
+    assert cascade.resolve_tiers(None, "m", "p") == [ModelTier("p", "m")]
+
+
+def test_run_escalates_on_rejection_and_timeout():
+    metrics.reset()
+    tiers = [
+        ModelTier("p", "slow", 0.01),
+        ModelTier("p", "small"),
+        ModelTier("p", "large"),
+        ModelTier("p", "unused"),
+    ]
+
+    async def attempt(tier):
+        if tier.model == "slow":
+            await asyncio.sleep(1)
+        return tier.model
+
+    async def accept(result):
+        return result == "large"
+
+    result, trace = asyncio.run(cascade.run(tiers, attempt, accept))
+
+    assert result == "large"
+    assert [step["outcome"] for step in trace] == ["timeout", "rejected", "accepted"]
+    assert cascade.answered_by(trace) == "p:large"
+    counters = metrics.snapshot()["counters"]
+    assert counters["cascade.escalations"] == 2
+    assert counters["cascade.tier2.accepted"] == 1
+    metrics.reset()
+
+
+def test_run_returns_last_answer_when_nothing_is_accepted():
+    tiers = [ModelTier("p", "small"), ModelTier("p", "large")]
+
+    async def attempt(tier):
+        return None if tier.model == "large" else "guess"
+
+    async def accept(_result):
+        return False
+
+    result, trace = asyncio.run(cascade.run(tiers, attempt, accept))
+
+    assert result == "guess"
+    assert not cascade.accepted(trace)
+    assert cascade.answered_by(trace) == "p:small"
@@ -0,0 +1,115 @@
+import asyncio
+
+import pytest
+
+from talk2dom.api.utils import cascade, deadline
+from talk2dom.api.utils.cascade import ModelTier
+
+
+def test_start_reads_header_and_caps_it(monkeypatch):
+    monkeypatch.setattr(deadline, "DEFAULT_MS", 60000)
+    monkeypatch.setattr(deadline, "MAX_MS", 5000)
+
+    async def budgets():
+        return [
+            deadline.start(None),
+            deadline.start("1500"),
+            deadline.start("999999"),
+            deadline.start("soon"),
+        ]
+
+    assert asyncio.run(budgets()) == [60.0, 1.5, 5.0, 60.0]
+
+
+def test_retry_call_retries_failed_calls(monkeypatch):
+    monkeypatch.setattr(deadline, "BACKOFF_MS", 1)
+    calls = []
+
+    async def flaky(value):
+        calls.append(value)
+        return value if len(calls) == 3 else None
+
+    async def main():
+        deadline.start("5000")
+        return await deadline.retry_call(flaky, "ok")
+
+    assert asyncio.run(main()) == "ok"
+    assert calls == ["ok", "ok", "ok"]
+
+
+def test_retry_call_stops_at_the_deadline(monkeypatch):
+    monkeypatch.setattr(deadline, "BACKOFF_MS", 10000)
+    calls = []
+
+    async def failing():
+        calls.append(1)
+        return None
+
+    async def slow():
+        await asyncio.sleep(1)
+        return "late"
+
+    async def main():
+        deadline.start("50")
+        # 退避时间超过剩余预算,不再重试
+        first = await deadline.retry_call(failing)
+        second = await deadline.retry_call(slow)
+        return first, second
+
+    assert asyncio.run(main()) == (None, None)
+    assert calls == [1]
+
+
+def test_cascade_stops_escalating_when_budget_is_spent():
+    async def attempt(tier):
+        await asyncio.sleep(1)
+        return tier.model
+
+    async def accept(_result):
+        return True
+
+    async def main():
+        deadline.start("30")
+        return await cascade.run(
+            [ModelTier("p", "small"), ModelTier("p", "large")], attempt, accept
+        )
+
+    result, trace = asyncio.run(main())
+
+    assert result is None
+    assert [step["outcome"] for step in trace] == ["deadline"]
+
+
+def test_locator_returns_timeout_when_deadline_spent(monkeypatch):
+    import inspect
+    from types import SimpleNamespace
+
+    from talk2dom.api.routers import inference
+    from talk2dom.api.schemas import LocatorRequest
+    from talk2dom.db import singleflight
+
+    async def miss(*_args, **_kwargs):
+        return None, None, None
+
+    async def slow_llm(*_args, **_kwargs):
+        await asyncio.sleep(1)
+
+    async def no_redis_lock(_key):
+        return ""
+
+    monkeypatch.setattr(inference, "aget_cached_locator", miss)
+    monkeypatch.setattr(inference, "acall_selector_llm", slow_llm)
+    monkeypatch.setattr(singleflight, "_acquire", no_redis_lock)
+
+    req = LocatorRequest(
+        url="https://example.com",
+        html="<body><button id='login'>Log in</button></body>",
+        user_instruction="click login",
+    )
+    request = SimpleNamespace(state=SimpleNamespace(), headers={deadline.HEADER: "50"})
+    user = SimpleNamespace(id="u1", email="u@example.com")
+
+    func = inspect.unwrap(inference.locate_playground)
+    with pytest.raises(deadline.DeadlineExceeded) as err:
+        asyncio.run(func(req=req, request=request, db=None, user=user))
+    assert err.value.status_code == 504
@@ -0,0 +1,72 @@
+from talk2dom.api.utils.document import ParsedDocument
+from talk2dom.api.utils.html_cleaner import (
+    clean_html,
+    clean_html_keep_structure_only,
+)
+from talk2dom.db.cache import compute_html_id
+
+HTML = """
+<!DOCTYPE html>
+<html>
+<head><title>T</title><script>var a = "<div>";</script></head>
+<body class="page">
+  <!-- banner -->
+  <div id="wrapper">
+    <button id="login" name="login-btn">Log in</button>
+    <noscript><p>enable js</p></noscript>
+    <svg><path d="M0"></path></svg>
+    <input type="text" name="email"/>
+  </div>
+</body>
+</html>
+""".strip()
+
+
+def test_outputs_match_standalone_cleaners():
+    doc = ParsedDocument(HTML)
+    cleaned = clean_html(HTML)
+
+    assert doc.cleaned_html == cleaned
+    assert doc.structure_html == clean_html_keep_structure_only(cleaned)
+    assert doc.structure_html == ("<body><div><button></button><input/></div></body>")
+
+
+def test_fragment_without_body_is_cleaned_as_a_whole():
+    html = "<div id='a'>x<script>y</script></div><!-- c --><br>"
+    doc = ParsedDocument(html)
+
+    assert doc.cleaned_html == clean_html(html)
+    assert doc.structure_html == "<div></div><br/>"
+
+
+def test_html_id_matches_cache_key_derivation():
+    doc = ParsedDocument(HTML)
+
+    assert doc.html_id("https://example.com/a") == compute_html_id(
+        "https://example.com/a", doc.structure_html
+    )
+    assert doc.html_id("") == compute_html_id("", doc.structure_html)
+
+
+def test_verification_uses_the_raw_document():
+    doc = ParsedDocument(HTML)
+
+    assert doc.validator.soup is doc.soup
+    assert doc.verify("id", "login") is True
+    assert doc.verify("css selector", "noscript p") is True
+    assert doc.verify("xpath", "//input[@name='email']") is True
+    assert doc.verify("id", "missing") is False
+    # rendering must not have mutated the shared soup
+    assert doc.soup.find("script") is not None
+
+
+def test_lxml_engine_matches_bs4_engine():
+    bs4_doc = ParsedDocument(HTML, engine="bs4")
+    lxml_doc = ParsedDocument(HTML, engine="lxml")
+
+    assert lxml_doc.cleaned_html == bs4_doc.cleaned_html
+    assert lxml_doc.structure_html == bs4_doc.structure_html
+    # the soup is only parsed once a CSS selector needs verifying
+    assert lxml_doc.verify("xpath", "//button[@id='login']") is True
+    assert lxml_doc.validator._soup is None
+    assert lxml_doc.verify("css selector", "#wrapper input") is True
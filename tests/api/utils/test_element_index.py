@@ -0,0 +1,64 @@
+import json
+from pathlib import Path
+
+from talk2dom.api.utils import element_index
+from talk2dom.api.utils.document import ParsedDocument
+from talk2dom.api.utils.outline import build_prompt_html
+
+FIXTURES = Path(__file__).resolve().parents[2] / "fixtures" / "prompt_pages.json"
+
+PAGE = (
+    "<body><div id='app'><form id='signin'>"
+    "<input name='email'/><input name='email'/>"
+    "<input placeholder='Password'/>"
+    "<button id='btn-9f8e7d6c5b'>Sign in</button><button>Cancel</button>"
+    "</form><ul><li>a</li><li>b</li></ul><ul><li>c</li><li>d</li></ul></div></body>"
+)
+
+
+def test_annotate_numbers_elements_in_document_order():
+    annotated = element_index.annotate("<body><div><p>a</p></div><p>b</p></body>")
+
+    assert annotated == (
+        '<body><div data-t2d-idx="1"><p data-t2d-idx="2">a</p></div>'
+        '<p data-t2d-idx="3">b</p></body>'
+    )
+
+
+def test_build_selector_prefers_stable_and_unique_attributes():
+    build = element_index.build_selector
+
+    assert build(PAGE, 2) == ("id", "signin")
+    # 重复的 name 不能用,退回到 CSS 路径
+    assert build(PAGE, 4) == ("css selector", "input:nth-of-type(2)")
+    assert build(PAGE, 5) == ("css selector", "input[placeholder='Password']")
+    # 看起来是自动生成的 id 不用
+    assert build(PAGE, 6) == ("css selector", "button:nth-of-type(1)")
+    assert build(PAGE, 13) == ("css selector", "ul:nth-of-type(2) > li:nth-of-type(2)")
+
+
+def test_build_selector_not_found_and_out_of_range():
+    assert element_index.build_selector(PAGE, 0) == element_index.NOT_FOUND
+    assert element_index.build_selector(PAGE, 99) == element_index.NOT_FOUND
+
+
+def test_indexed_outline_prefixes_numbers():
+    prompt = build_prompt_html(PAGE, "sign in", "outline", indexed=True)
+
+    assert "\n    [2] form#signin\n" in prompt
+    assert '[6] button#btn-9f8e7d6c5b "Sign in"' in prompt
+
+
+def test_every_element_selector_verifies_on_the_raw_page():
+    pages = json.loads(FIXTURES.read_text(encoding="utf-8"))
+    for page in pages:
+        doc = ParsedDocument(page["html"])
+        cleaned = doc.cleaned_html
+        count = element_index.annotate(cleaned).count(element_index.INDEX_ATTRIBUTE)
+        for index in range(1, count + 1):
+            selector_type, selector_value = element_index.build_selector(cleaned, index)
+            assert doc.verify(selector_type, selector_value), (
+                page["name"],
+                index,
+                selector_value,
+            )
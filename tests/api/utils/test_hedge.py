@@ -0,0 +1,134 @@
+import asyncio
+
+import pytest
+
+from talk2dom.api.utils import cascade, hedge, metrics
+from talk2dom.api.utils.cascade import ModelTier
+
+PRIMARY = ModelTier("openai", "gpt-4o-mini")
+SECONDARY = ModelTier("google_genai", "gemini-flash")
+
+
+@pytest.fixture(autouse=True)
+def _fresh(monkeypatch):
+    monkeypatch.setattr(hedge, "_latencies", {})
+    monkeypatch.setattr(hedge, "HEDGE_DELAY_MS", 20)
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+def _attempt(delays, calls, cancelled):
+    async def attempt(tier):
+        calls.append(tier.model)
+        try:
+            await asyncio.sleep(delays[tier.model])
+        except asyncio.CancelledError:
+            cancelled.append(tier.model)
+            raise
+        return tier.model
+
+    return attempt
+
+
+async def _accept_all(_result):
+    return True
+
+
+def test_delay_uses_latency_percentile_once_warm(monkeypatch):
+    monkeypatch.setattr(hedge, "HEDGE_PERCENTILE", 90)
+    assert hedge.delay_for(PRIMARY.label) == 0.02
+    for i in range(1, 101):
+        hedge.record(PRIMARY.label, i / 100)
+    assert hedge.delay_for(PRIMARY.label) == 0.9
+
+
+def test_fast_primary_is_not_hedged():
+    calls, cancelled = [], []
+    attempt = _attempt({"gpt-4o-mini": 0, "gemini-flash": 0}, calls, cancelled)
+
+    result, ok, info = asyncio.run(hedge.race(PRIMARY, SECONDARY, attempt, _accept_all))
+
+    assert (result, ok, info) == (
+        "gpt-4o-mini",
+        True,
+        {"hedged": False, "winner": "primary"},
+    )
+    assert calls == ["gpt-4o-mini"]
+    assert "hedge.fired" not in metrics.snapshot()["counters"]
+
+
+def test_slow_primary_is_hedged_and_cancelled():
+    calls, cancelled = [], []
+    attempt = _attempt({"gpt-4o-mini": 1, "gemini-flash": 0}, calls, cancelled)
+
+    result, ok, info = asyncio.run(hedge.race(PRIMARY, SECONDARY, attempt, _accept_all))
+
+    assert (result, ok, info) == (
+        "gemini-flash",
+        True,
+        {"hedged": True, "winner": "hedge"},
+    )
+    assert cancelled == ["gpt-4o-mini"]
+    counters = metrics.snapshot()["counters"]
+    assert counters["hedge.fired"] == 1
+    assert counters["hedge.won_by_hedge"] == 1
+    # 被取消的主调用仍计入延迟样本
+    assert len(hedge._latencies[PRIMARY.label]) == 1
+
+
+def test_rejected_hedge_waits_for_primary():
+    calls, cancelled = [], []
+    attempt = _attempt({"gpt-4o-mini": 0.05, "gemini-flash": 0}, calls, cancelled)
+
+    async def accept(result):
+        return result == "gpt-4o-mini"
+
+    result, ok, info = asyncio.run(hedge.race(PRIMARY, SECONDARY, attempt, accept))
+
+    assert (result, ok, info["winner"]) == ("gpt-4o-mini", True, "primary")
+    assert metrics.snapshot()["counters"]["hedge.won_by_primary"] == 1
+
+
+def test_cascade_records_hedge_in_trace(monkeypatch):
+    monkeypatch.setattr(hedge, "HEDGE_MODEL", "google_genai:gemini-flash")
+    calls, cancelled = [], []
+    attempt = _attempt({"gpt-4o-mini": 1, "gemini-flash": 0}, calls, cancelled)
+
+    result, trace = asyncio.run(
+        cascade.run([PRIMARY], attempt, _accept_all, cascade.hedge_tier(PRIMARY))
+    )
+
+    assert result == "gemini-flash"
+    assert trace[0]["hedged"] is True
+    assert trace[0]["winner"] == "hedge"
+    assert cascade.answered_by(trace) == SECONDARY.label
+    assert cascade.hedge_tier(SECONDARY) is None
+
+
+def test_hedge_goes_through_the_secondary_breaker(monkeypatch):
+    from talk2dom.api.utils import breaker
+
+    monkeypatch.setattr(hedge, "HEDGE_MODEL", "google_genai:gemini-flash")
+    breaker.reset()
+    calls, cancelled = [], []
+    attempt = _attempt({"gpt-4o-mini": 0.05, "gemini-flash": 0}, calls, cancelled)
+    secondary_breaker = breaker.get(SECONDARY.provider)
+    verdicts = iter([True, False])
+    monkeypatch.setattr(secondary_breaker, "allow", lambda: next(verdicts))
+
+    result, trace = asyncio.run(
+        cascade.run([PRIMARY], attempt, _accept_all, cascade.hedge_tier(PRIMARY))
+    )
+    assert result == "gemini-flash"
+    # 对冲调用的结果计入备用模型的熔断器
+    assert secondary_breaker.snapshot()["calls"] == 1
+
+    # allow() 拒绝时不对冲,等待主模型
+    result, trace = asyncio.run(
+        cascade.run([PRIMARY], attempt, _accept_all, cascade.hedge_tier(PRIMARY))
+    )
+    assert result == "gpt-4o-mini"
+    assert trace[0]["hedged"] is False
+    assert calls == ["gpt-4o-mini", "gemini-flash", "gpt-4o-mini"]
+    assert metrics.snapshot()["counters"]["hedge.breaker_rejected"] == 1
@@ -7,6 +7,7 @@ from talk2dom.api.utils.html_cleaner import (
     clean_html_keep_structure_only,
     clean_html,
     convert_relative_paths_to_absolute,
+    lxml_clean,
 )
 
 SAMPLE_HTML = """
@@ -136,3 +137,29 @@ def test_convert_relative_paths_to_absolute_for_assets_and_links():
 
     # absolute anchor remains unchanged
     assert soup.find("a", id="absolute")["href"] == "https://example.org/x"
+
+
+def test_lxml_engine_renders_byte_identical_output():
+    html = (
+        "<!DOCTYPE html><html><head><title>T</title></head>"
+        "<body id='b'>\n  <ul class=' nav  main '><li><a href='/a?x=1&amp;y=2'>"
+        'Tom &amp; Jerry&nbsp;</a></li>\n  <li><input disabled="" name=q></li></ul>'
+        "<!-- c --><pre>  </pre><script>if (a && b) {}</script></body></html>"
+    )
+    cleaned = clean_html(html)
+
+    assert lxml_clean(html) == (cleaned, clean_html_keep_structure_only(cleaned))
+
+
+@pytest.mark.parametrize(
+    "html",
+    [
+        "<html><body><ul><li>a<li>b</ul></body></html>",  # implied end tags
+        "<html><body><p>a<div>b</div></p></body></html>",  # p closed by div
+        "<html><body><b id='a' id='b'>x</b></body></html>",  # duplicate attribute
+        "<html><body><textarea><b>x</b></textarea></body></html>",  # RCDATA
+        "<div>fragment without body</div>",
+    ],
+)
+def test_lxml_engine_defers_to_bs4_when_trees_may_differ(html):
+    assert lxml_clean(html) is None
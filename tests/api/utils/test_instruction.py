@@ -0,0 +1,52 @@
+from talk2dom.api.utils import instruction
+
+
+def test_canonicalize_drops_case_punctuation_and_stopwords():
+    assert (
+        instruction.canonicalize("Click the  Login button, please!")
+        == "click login button"
+    )
+    assert instruction.canonicalize("") == ""
+
+
+def test_similar_phrasings_score_high():
+    a = instruction.canonicalize("click the login button")
+    b = instruction.canonicalize("Click login button.")
+    c = instruction.canonicalize("press the login button")
+
+    assert instruction.similarity(a, b) == 1.0
+    assert instruction.similarity(a, c) > 0.6
+    assert instruction.similarity(a, "open settings menu") < 0.3
+
+
+def test_positional_words_and_numbers_must_match():
+    first = instruction.canonicalize("click the first result")
+    second = instruction.canonicalize("click the second result")
+    row_2 = instruction.canonicalize("select row 2")
+    row_3 = instruction.canonicalize("select row 3")
+
+    assert instruction.similarity(first, second) == 0.0
+    assert instruction.similarity(row_2, row_3) == 0.0
+
+
+def test_best_match_respects_threshold():
+    candidates = {"click login button": "a", "open settings menu": "b"}
+
+    match = instruction.best_match("click login btn", candidates, 0.6)
+    assert match[0] == "click login button"
+    assert instruction.best_match("click login btn", candidates, 0.99) is None
+    assert instruction.best_match("click login button", candidates, 0) is None
+
+
+def test_different_targets_never_match():
+    pairs = [
+        ("sign in", "sign up"),
+        ("Save", "Save As"),
+        ("Add", "Add to cart"),
+        ("select", "deselect"),
+    ]
+    for a, b in pairs:
+        a, b = instruction.canonicalize(a), instruction.canonicalize(b)
+        assert instruction.similarity(a, b) == 0.0
+        assert instruction.best_match(a, {b: "x"}, 0.5) is None
+
@@ -0,0 +1,96 @@
+import asyncio
+
+import pytest
+
+from talk2dom.api.utils import metrics, offload
+from talk2dom.api.utils.document import ParsedDocument
+from talk2dom.api.utils.html_cleaner import clean_html
+
+HTML = "<html><body><div id='a'><button name='go'>Go</button></div></body></html>"
+
+
+@pytest.fixture(autouse=True)
+def _reset_metrics():
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+def test_small_pages_stay_in_process(monkeypatch):
+    monkeypatch.setattr(offload, "POOL_SIZE", 2)
+    monkeypatch.setattr(offload, "MIN_SIZE", 10_000)
+
+    result = asyncio.run(offload.run(clean_html, HTML, size=len(HTML)))
+
+    assert result == clean_html(HTML)
+    counters = metrics.snapshot()["counters"]
+    assert counters["offload.inline"] == 1
+    assert "offload.process.submitted" not in counters
+
+
+def test_large_pages_run_in_the_process_pool(monkeypatch):
+    monkeypatch.setattr(offload, "POOL_SIZE", 1)
+    monkeypatch.setattr(offload, "MIN_SIZE", 0)
+    try:
+        doc = ParsedDocument(HTML, engine="bs4")
+        cleaned, structure = asyncio.run(doc.aclean())
+        found = asyncio.run(doc.averify("css selector", "#a button"))
+    finally:
+        offload.shutdown()
+
+    assert cleaned == clean_html(HTML)
+    assert structure == "<body><div><button></button></div></body>"
+    assert found is True
+    # 渲染和校验都在子进程里完成,本进程从未解析过
+    assert doc.__dict__.get("validator") is None
+    snap = metrics.snapshot()
+    assert snap["counters"]["offload.process.submitted"] == 2
+    assert snap["gauges"]["offload.process.inflight"] == 0
+    assert snap["timings"]["offload.process.run_ms"]["count"] == 2
+
+
+def test_url_less_html_id_cleans_off_the_event_loop(monkeypatch):
+    from talk2dom.api.routers import inference
+
+    submitted = []
+
+    async def fake_run(func, *args, size=0):
+        submitted.append((func, size))
+        return func(*args)
+
+    monkeypatch.setattr(offload, "should_offload", lambda size: True)
+    monkeypatch.setattr(offload, "run", fake_run)
+    doc = ParsedDocument(HTML, engine="bs4")
+    request = type("Request", (), {"state": type("State", (), {})()})()
+
+    html_id, templated = asyncio.run(inference._page_html_id(request, doc, None, ""))
+
+    # 骨架摘要来自进程池的清洗结果,而不是在事件循环里同步解析
+    assert submitted and submitted[0][1] == len(HTML)
+    assert "validator" not in doc.__dict__
+    assert html_id == ParsedDocument(HTML).html_id("")
+    assert templated is None
+
+
+def test_clean_and_verifications_share_one_worker_parse(monkeypatch):
+    submitted = []
+
+    async def fake_run(func, *args, size=0):
+        submitted.append(args)
+        return func(*args)
+
+    monkeypatch.setattr(offload, "should_offload", lambda size: True)
+    monkeypatch.setattr(offload, "run", fake_run)
+    doc = ParsedDocument(HTML, engine="bs4")
+
+    verdicts = asyncio.run(
+        doc.analyze([("id", "a"), ("css selector", "#missing")], clean=True)
+    )
+    again = asyncio.run(doc.averify("id", "a"))
+    cleaned, _ = asyncio.run(doc.aclean())
+
+    assert verdicts == [True, False]
+    assert again is True
+    assert cleaned == clean_html(HTML)
+    # 一次进程池调用完成清洗和两次校验,之后的结果都来自缓存
+    assert len(submitted) == 1
@@ -0,0 +1,55 @@
+import json
+from pathlib import Path
+
+from talk2dom.api.utils.document import ParsedDocument
+from talk2dom.api.utils.outline import (
+    OUTLINE_HEADER,
+    build_prompt_html,
+    serialize_for_prompt,
+    to_outline,
+)
+
+FIXTURES = Path(__file__).resolve().parents[2] / "fixtures" / "prompt_pages.json"
+
+
+def test_outline_keeps_selector_attributes_only():
+    html = (
+        "<body><form id='login-form' class='a b c d e' style='color:red'>"
+        "<input name='email' type='email' data-blob='xxxxxxxx' placeholder='Email'/>"
+        "<button id='go' class='btn'>  Sign\n   in  </button>"
+        "<img src='data:image/png;base64,AAAA' alt='logo'/></form></body>"
+    )
+
+    assert to_outline(html) == OUTLINE_HEADER + (
+        "body\n"
+        "  form#login-form.a.b.c.d\n"
+        '    input[name="email"][type="email"][placeholder="Email"]\n'
+        '    button#go.btn "Sign in"\n'
+        '    img[alt="logo"]'
+    )
+
+
+def test_outline_truncates_long_text_and_renders_pruned_markers():
+    html = "<body><p>" + "word " * 40 + "</p><!-- 12 omitted --></body>"
+
+    lines = to_outline(html).splitlines()
+
+    assert lines[-2].startswith('  p "word word')
+    assert lines[-2].endswith('…"')
+    assert len(lines[-2]) < 100
+    assert lines[-1] == "  … 12 omitted"
+
+
+def test_html_format_is_passthrough():
+    assert serialize_for_prompt("<body></body>", "html") == "<body></body>"
+
+
+def test_outline_is_smaller_and_keeps_expected_anchors_on_fixtures():
+    pages = json.loads(FIXTURES.read_text(encoding="utf-8"))
+    for page in pages:
+        cleaned = ParsedDocument(page["html"]).cleaned_html
+        for case in page["cases"]:
+            prompt = build_prompt_html(cleaned, case["instruction"], "outline")
+            assert len(prompt) < len(cleaned) * 0.5
+            if case["selector_type"] in ("id", "name"):
+                assert case["selector_value"] in prompt
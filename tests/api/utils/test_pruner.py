@@ -0,0 +1,48 @@
+from lxml import etree
+
+from talk2dom.api.utils.pruner import prune_html, score_elements
+
+ROWS = "".join(
+    f"<li class='item'><a href='/p/{i}'>Product {i}</a><span>in stock</span></li>"
+    for i in range(300)
+)
+PAGE = (
+    "<body><header id='top'><form id='search'>"
+    "<input name='q' placeholder='Search products'/><button>Go</button>"
+    f"</form></header><main><ul id='list'>{ROWS}</ul></main>"
+    "<footer><a href='/login' aria-label='Sign in'>Log in</a></footer></body>"
+)
+
+
+def test_pages_within_budget_are_untouched():
+    assert prune_html(PAGE, "click log in", token_budget=0) == PAGE
+    assert prune_html(PAGE, "click log in", token_budget=len(PAGE)) == PAGE
+
+
+def test_keeps_the_matching_region_and_its_ancestors():
+    pruned = prune_html(PAGE, "type shoes into the search box", token_budget=200)
+
+    assert len(pruned) < len(PAGE) // 10
+    assert pruned.startswith('<body><header id="top"><form id="search">')
+    assert 'placeholder="Search products"' in pruned
+    assert "Product 7" not in pruned
+    assert "omitted" in pruned
+
+
+def test_numbered_items_match_on_their_own_text():
+    pruned = prune_html(PAGE, "click Product 217", token_budget=200)
+
+    assert '<a href="/p/217">Product 217</a>' in pruned
+    assert "Search products" not in pruned
+
+
+def test_attributes_are_scored():
+    root = etree.HTML(PAGE).find("body")
+    scores = score_elements(root, "sign in")
+
+    best = max(scores, key=scores.get)
+    assert best.get("aria-label") == "Sign in"
+
+
+def test_unrelated_instruction_keeps_the_full_page():
+    assert prune_html(PAGE, "zzzz", token_budget=200) == PAGE
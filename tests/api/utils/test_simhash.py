@@ -0,0 +1,27 @@
+from talk2dom.api.utils import simhash
+
+
+def _page(banner: str = "") -> str:
+    rows = "".join(
+        f"<div><h2></h2><ul>{'<li><a></a></li>' * (i % 4 + 1)}</ul><p></p></div>"
+        for i in range(30)
+    )
+    return f"<body>{banner}<header><nav></nav></header>{rows}<footer></footer></body>"
+
+
+def test_small_edit_keeps_fingerprint_close():
+    base = simhash.fingerprint(_page())
+    banner = simhash.fingerprint(_page("<div><span></span></div>"))
+    other = simhash.fingerprint("<body>" + "<table><tr><td></td></tr></table>" * 30)
+
+    assert simhash.distance(base, banner) <= simhash.MAX_DISTANCE
+    assert simhash.distance(base, other) > 10
+
+
+def test_near_fingerprints_share_a_band():
+    fp = simhash.fingerprint(_page())
+    flipped = fp ^ (1 << 3) ^ (1 << 40) ^ (1 << 63)
+
+    assert len(simhash.bands(fp)) == simhash.BANDS
+    assert set(enumerate(simhash.bands(fp))) & set(enumerate(simhash.bands(flipped)))
+    assert simhash.from_hex(simhash.to_hex(fp)) == fp
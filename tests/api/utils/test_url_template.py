@@ -0,0 +1,91 @@
+import pytest
+
+from talk2dom.api.utils import url_template
+
+
+def test_template_replaces_ids_and_drops_tracking(monkeypatch):
+    monkeypatch.setattr(url_template, "AUTO_DETECT", True)
+    template = url_template.template
+
+    assert template("https://Shop.example.com/product/123?utm_source=x#top") == (
+        "https://shop.example.com/product/{id}"
+    )
+    assert template("https://a.com/orders/7f1d3c2e-9b4a-4c8e-a1f0-0123456789ab") == (
+        "https://a.com/orders/{uuid}"
+    )
+    assert template("https://a.com/p/blue-cotton-shirt-48213;jsessionid=AB12") == (
+        "https://a.com/p/{slug}"
+    )
+    assert template("https://a.com/blog/how-to-reset-your-password") == (
+        "https://a.com/blog/{slug}"
+    )
+    # 普通的路径段保持不变
+    assert template("https://a.com/category/running-shoes/") == (
+        "https://a.com/category/running-shoes"
+    )
+    assert template("https://a.com") == "https://a.com"
+
+
+def test_project_rules_take_precedence():
+    rules = url_template.parse_rules("/product/{sku}, /docs/*/intro")
+
+    assert url_template.template("https://a.com/product/abc", rules) == (
+        "https://a.com/product/{sku}"
+    )
+    assert url_template.template("https://a.com/docs/v2/intro", rules) == (
+        "https://a.com/docs/*/intro"
+    )
+    assert url_template.template("https://a.com/docs/v2/setup", rules) == (
+        "https://a.com/docs/v2/setup"
+    )
+
+
+def test_parse_rules_rejects_bad_templates():
+    assert url_template.parse_rules("") == []
+    with pytest.raises(ValueError):
+        url_template.parse_rules("product/{sku}")
+    with pytest.raises(ValueError):
+        url_template.parse_rules("/product//{sku}")
+
+
+def test_backbone_signature_ignores_repeated_siblings():
+    three = "<body><ul><li></li><li></li><li></li></ul><img></body>"
+    thirty = "<body><ul>" + "<li></li>" * 30 + "</ul><img></body>"
+    other = "<body><table><tr><td></td></tr></table></body>"
+
+    signature = url_template.backbone_signature(three)
+    assert signature == url_template.backbone_signature(thirty)
+    assert signature != url_template.backbone_signature(other)
+
+
+def test_auto_detection_is_off_by_default():
+    assert url_template.AUTO_DETECT is False
+    url = "HTTPS://Shop.example.com/product/123/?utm_source=x#reviews"
+    assert url_template.template(url) == "https://shop.example.com/product/123"
+    assert url_template.template(url) == url_template.normalize(url)
+
+
+def test_hash_routes_are_kept(monkeypatch):
+    monkeypatch.setattr(url_template, "AUTO_DETECT", True)
+    template = url_template.template
+
+    assert template("https://app.com/#/settings?tab=2") == "https://app.com/#/settings"
+    assert template("https://app.com/#/orders/42") == "https://app.com/#/orders/{id}"
+    assert template("https://app.com/#/inbox") != template("https://app.com/#/outbox")
+
+
+def test_backbone_signature_of_raw_html_matches_its_backbone():
+    from talk2dom.api.utils.document import ParsedDocument
+
+    page = """<!DOCTYPE html>
+<html><head><title>P</title><script>var x = "<div><p>";</script></head>
+<body class="x"><!-- <section> -->
+  <ul><li>one<li>two</ul>
+  <table><tr><td>1</td></tr></table>
+  <svg><g><path/></g></svg>
+  <img src="a.png"><br/>
+</body></html>"""
+
+    assert url_template.backbone_signature(page) == url_template.backbone_signature(
+        ParsedDocument(page).structure_html
+    )
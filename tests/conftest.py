@@ -17,3 +17,25 @@ def _stub_sendgrid(monkeypatch):
         return
     monkeypatch.setattr(user_routes, "send_verification_email", lambda *_args, **_kwargs: None)
     monkeypatch.setattr(user_routes, "send_welcome_email", lambda *_args, **_kwargs: None)
+
+
+@pytest.fixture(autouse=True)
+def _fresh_breakers():
+    # 熔断器是进程级状态,避免前面测试的失败影响后面的测试
+    from talk2dom.api.utils import breaker
+
+    breaker.reset()
+    yield
+    breaker.reset()
+
+
+@pytest.fixture(autouse=True)
+def _fresh_l1_cache():
+    # L1 是进程内缓存,测试之间不能共享
+    from talk2dom.db import local_cache
+
+    local_cache.locators.clear()
+    local_cache.contexts.clear()
+    yield
+    local_cache.locators.clear()
+    local_cache.contexts.clear()
@@ -3,10 +3,31 @@ from unittest.mock import MagicMock, patch
 
 
 # --- In-memory Redis stub for tests (no external service required) ---
+class _MiniPipeline:
+    def __init__(self, client):
+        self.client = client
+        self.ops = []
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.ops.append((name, args, kwargs))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self):
+        return [getattr(self.client, n)(*a, **k) for n, a, k in self.ops]
+
+
 class _MiniRedis:
     def __init__(self):
         self._store = {}
 
+    def pipeline(self, transaction=True):
+        return _MiniPipeline(self)
+
     def hset(self, key, mapping=None, **kwargs):
         if mapping:
             # Redis expects all values to be bytes, str, int, or float
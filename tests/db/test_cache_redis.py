@@ -1,10 +1,44 @@
 from talk2dom.db import cache
 
 
+class _Pipeline:
+    """Replays the queued commands against the dummy client on ``execute``."""
+
+    def __init__(self, client):
+        self.client = client
+        self.ops = []
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.ops.append((name, args, kwargs))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self):
+        return [getattr(self.client, n)(*a, **k) for n, a, k in self.ops]
+
+
+class _AsyncPipeline(_Pipeline):
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self):
+        return [await getattr(self.client, n)(*a, **k) for n, a, k in self.ops]
+
+
 def test_redis_set_and_get_locator(monkeypatch):
     stored = {}
 
     class DummyRedis:
+        def pipeline(self, transaction=True):
+            return _Pipeline(self)
+
         def hset(self, key, mapping=None):
             stored[key] = dict(mapping or {})
 
@@ -24,3 +58,434 @@ def test_redis_set_and_get_locator(monkeypatch):
     assert t == "css"
     assert v == "#id"
     assert a == "click"
+
+
+def test_async_get_cached_locator_backfills_from_db(monkeypatch):
+    import asyncio
+
+    stored = {}
+
+    class DummyAsyncRedis:
+        def pipeline(self, transaction=True):
+            return _AsyncPipeline(self)
+
+        async def hset(self, key, mapping=None):
+            stored[key] = dict(mapping or {})
+
+        async def hgetall(self, key):
+            return stored.get(key, {})
+
+        async def expire(self, key, ttl):
+            stored[f"{key}:ttl"] = ttl
+
+    db_calls = []
+
+    def fake_db_get(locator_id):
+        db_calls.append(locator_id)
+        return "id", "login", "click:"
+
+    monkeypatch.setattr(cache, "_aredis", lambda: DummyAsyncRedis())
+    monkeypatch.setattr(cache, "_db_get_locator", fake_db_get)
+    monkeypatch.setattr(cache, "SessionLocal", object())
+    monkeypatch.setattr(cache, "_NS", "test")
+
+    first = asyncio.run(cache.aget_cached_locator("click", "", "https://a", "p"))
+    second = asyncio.run(cache.aget_cached_locator("click", "", "https://a", "p"))
+
+    assert first == ("id", "login", "click:")
+    assert second == ("id", "login", "click:")
+    assert len(db_calls) == 1
+
+
+def test_async_batch_lookup_uses_one_pipeline(monkeypatch):
+    import asyncio
+
+    stored = {}
+    pipelines = []
+
+    class DummyPipeline:
+        def __init__(self):
+            self.ops = []
+
+        async def __aenter__(self):
+            pipelines.append(self)
+            return self
+
+        async def __aexit__(self, *exc):
+            return False
+
+        def hgetall(self, key):
+            self.ops.append(("hgetall", key))
+
+        def hset(self, key, mapping=None):
+            self.ops.append(("hset", key, mapping))
+
+        def expire(self, key, ttl):
+            self.ops.append(("expire", key))
+
+        async def execute(self):
+            out = []
+            for op in self.ops:
+                if op[0] == "hgetall":
+                    out.append(stored.get(op[1], {}))
+                elif op[0] == "hset":
+                    stored[op[1]] = dict(op[2])
+                    out.append(1)
+                else:
+                    out.append(True)
+            return out
+
+    class DummyAsyncRedis:
+        def pipeline(self, transaction=True):
+            return DummyPipeline()
+
+    monkeypatch.setattr(cache, "_aredis", lambda: DummyAsyncRedis())
+    monkeypatch.setattr(cache, "SessionLocal", object())
+    monkeypatch.setattr(cache, "_NS", "test")
+
+    hit_id = cache.compute_locator_id("click a", "h", "https://a", "p")
+    db_id = cache.compute_locator_id("click b", "h", "https://a", "p")
+    stored[cache._locator_key(hit_id)] = {"t": "id", "v": "a", "a": "click:"}
+    db_calls = []
+
+    def fake_db_get(locator_ids):
+        db_calls.append(list(locator_ids))
+        return {db_id: ("id", "b", "click:")}
+
+    monkeypatch.setattr(cache, "_db_get_locators", fake_db_get)
+
+    results = asyncio.run(
+        cache.aget_cached_locators(
+            ["click a", "click b", "click c"], "https://a", "p", html_id="h"
+        )
+    )
+
+    assert results == [
+        ("id", "a", "click:"),
+        ("id", "b", "click:"),
+        (None, None, None),
+    ]
+    assert len(db_calls) == 1 and len(db_calls[0]) == 2
+    # one pipeline for the lookup, one for the backfill
+    assert len(pipelines) == 2
+    assert stored[cache._locator_key(db_id)]["v"] == "b"
+
+
+def test_negative_locator_is_keyed_by_html_digest(monkeypatch):
+    import asyncio
+
+    from talk2dom.api.utils import metrics
+
+    stored = {}
+
+    class DummyAsyncRedis:
+        async def set(self, key, value, ex=None):
+            stored[key] = (value, ex)
+
+        async def get(self, key):
+            entry = stored.get(key)
+            return entry[0] if entry else None
+
+    monkeypatch.setattr(cache, "_aredis", lambda: DummyAsyncRedis())
+    monkeypatch.setattr(cache, "_NS", "test")
+    monkeypatch.setattr(cache, "_NEGATIVE_TTL_SECONDS", 15)
+    metrics.reset()
+
+    async def main():
+        await cache.asave_negative_locator("loc", "digest-a", "click:")
+        return (
+            await cache.aget_negative_locator("loc", "digest-a"),
+            await cache.aget_negative_locator("loc", "digest-b"),
+        )
+
+    assert asyncio.run(main()) == ("click:", None)
+    assert stored["test:neg:loc:digest-a"] == ("click:", 15)
+    counters = metrics.snapshot()["counters"]
+    assert counters["negative_cache.hit"] == 1
+    assert counters["negative_cache.miss"] == 1
+    metrics.reset()
+
+
+def test_similar_locator_uses_instruction_index(monkeypatch):
+    import asyncio
+
+    stored = {}
+
+    class DummyAsyncRedis:
+        def pipeline(self, transaction=True):
+            return _AsyncPipeline(self)
+
+        async def hset(self, key, mapping=None):
+            stored.setdefault(key, {}).update(mapping or {})
+
+        async def hgetall(self, key):
+            return dict(stored.get(key, {}))
+
+        async def hlen(self, key):
+            return len(stored.get(key, {}))
+
+        async def expire(self, key, ttl):
+            pass
+
+    monkeypatch.setattr(cache, "_aredis", lambda: DummyAsyncRedis())
+    monkeypatch.setattr(cache, "SessionLocal", object())
+    monkeypatch.setattr(cache, "_NS", "test")
+    monkeypatch.setattr(cache.instruction_utils, "FUZZY_THRESHOLD", 0.6)
+    monkeypatch.setattr(
+        cache, "_db_index_entries", lambda *_: {"fill email field": "typed"}
+    )
+
+    async def main():
+        await cache._aredis_index_locator("h", "p", "Click the Login button", "loc")
+        await cache._aredis_set_locator("loc", "id", "login", "click:")
+        await cache._aredis_set_locator("typed", "id", "email", "type:a@b.c")
+        return (
+            await cache.aget_similar_locator("press login button", "h", "p"),
+            await cache.aget_similar_locator("open settings", "h", "p"),
+            await cache.aget_similar_locator("fill in the email", "other", "p"),
+        )
+
+    hit, miss, typed = asyncio.run(main())
+
+    assert hit[:3] == ("id", "login", "click:") and 0.6 <= hit[3] < 1
+    assert miss is None
+    # typing actions carry the instruction's text, so only exact rephrasings reuse them
+    assert typed is None
+    assert stored["test:idx:other:p"] == {"fill email field": "typed"}
+
+
+def test_instruction_index_is_capped_on_write(monkeypatch):
+    import asyncio
+
+    stored = {}
+
+    class _Hashes:
+        def hset(self, key, mapping=None):
+            stored.setdefault(key, {}).update(mapping or {})
+
+        def hlen(self, key):
+            return len(stored.get(key, {}))
+
+        def hrandfield(self, key, count):
+            return list(stored.get(key, {}))[:count]
+
+        def hdel(self, key, *fields):
+            for field in fields:
+                stored[key].pop(field, None)
+
+        def expire(self, key, ttl):
+            pass
+
+    class DummyRedis(_Hashes):
+        def pipeline(self, transaction=True):
+            return _Pipeline(self)
+
+    class DummyAsyncRedis:
+        def __init__(self):
+            self.sync = _Hashes()
+
+        def pipeline(self, transaction=True):
+            return _AsyncPipeline(self)
+
+        def __getattr__(self, name):
+            method = getattr(self.sync, name)
+
+            async def call(*args, **kwargs):
+                return method(*args, **kwargs)
+
+            return call
+
+    monkeypatch.setattr(cache, "_redis", lambda: DummyRedis())
+    monkeypatch.setattr(cache, "_aredis", lambda: DummyAsyncRedis())
+    monkeypatch.setattr(cache, "_NS", "test")
+    monkeypatch.setattr(cache, "_INDEX_MAX_ENTRIES", 3)
+
+    for i in range(5):
+        cache._redis_index_locator("h", "p", f"click button {i}", f"loc{i}")
+
+    async def main():
+        for i in range(5):
+            await cache._aredis_index_locator("h", "a", f"click link {i}", f"a{i}")
+
+    asyncio.run(main())
+
+    assert len(stored["test:idx:h:p"]) == 3
+    assert stored["test:idx:h:p"]["click button 4"] == "loc4"
+    assert len(stored["test:idx:h:a"]) == 3
+    assert stored["test:idx:h:a"]["click link 4"] == "a4"
+
+
+def test_nearest_html_ids_uses_band_index(monkeypatch):
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from sqlalchemy.pool import StaticPool
+
+    from talk2dom.api.utils import simhash
+    from talk2dom.db.models import Base, HTML, HTMLSimhashBand
+
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+
+    fp = 0x0123456789ABCDEF
+    snapshots = {"near": fp ^ 0b101, "far": ~fp & (2**64 - 1), "self": fp}
+    session = Session()
+    for html_id, value in snapshots.items():
+        session.add(
+            HTML(
+                id=html_id,
+                url="",
+                backbone="<body></body>",
+                row_html="",
+                simhash=simhash.to_hex(value),
+                simhash_bands=[
+                    HTMLSimhashBand(band=i, value=band)
+                    for i, band in enumerate(simhash.bands(value))
+                ],
+            )
+        )
+    session.commit()
+    session.close()
+    monkeypatch.setattr(cache, "SessionLocal", Session)
+
+    assert cache._db_nearest_html_ids(fp, "self") == [(2, "near")]
+
+
+def test_l1_serves_repeat_lookups_and_save_publishes(monkeypatch):
+    import asyncio
+
+    from talk2dom.api.utils import metrics
+
+    stored, published = {}, []
+
+    class DummyAsyncRedis:
+        def pipeline(self, transaction=True):
+            return _AsyncPipeline(self)
+
+        async def hset(self, key, mapping=None):
+            stored[key] = dict(mapping or {})
+
+        async def hgetall(self, key):
+            return dict(stored.get(key, {}))
+
+        async def expire(self, key, ttl):
+            pass
+
+        async def publish(self, channel, message):
+            published.append((channel, message))
+
+    redis_client = DummyAsyncRedis()
+    monkeypatch.setattr(cache, "_aredis", lambda: redis_client)
+    monkeypatch.setattr(cache, "SessionLocal", object())
+    monkeypatch.setattr(cache, "_db_get_locator", lambda _id: ("id", "login", "click:"))
+    monkeypatch.setattr(cache, "_db_save_locator", lambda *a: True)
+    metrics.reset()
+
+    async def main():
+        for _ in range(3):
+            await cache.aget_cached_locator("click", "", "https://a", "p")
+        stored.clear()
+        # Redis 清空后仍由 L1 命中
+        return await cache.aget_cached_locator("click", "", "https://a", "p")
+
+    assert asyncio.run(main()) == ("id", "login", "click:")
+    counters = metrics.snapshot()["counters"]
+    assert counters["locator_cache.db_hit"] == 1
+    assert counters["locator_cache.l1_hit"] == 3
+
+    asyncio.run(
+        cache.asave_locator("click", "", "id", "x", url="https://a", project_id="p")
+    )
+    locator_id = cache.compute_locator_id(
+        "click", cache.compute_html_id("https://a", ""), "", "p"
+    )
+    assert published[-1][1].endswith(f"|{locator_id}")
+    assert (
+        asyncio.run(cache.aget_cached_locator("click", "", "https://a", "p"))[1] == "x"
+    )
+    metrics.reset()
+
+
+def test_set_locator_is_one_round_trip(monkeypatch):
+    executed = []
+
+    class CountingPipeline(_Pipeline):
+        def execute(self):
+            executed.append([op[0] for op in self.ops])
+            return super().execute()
+
+    class DummyRedis:
+        def pipeline(self, transaction=True):
+            return CountingPipeline(self)
+
+        def hset(self, key, mapping=None):
+            return 1
+
+        def expire(self, key, ttl):
+            return True
+
+    monkeypatch.setattr(cache, "_redis", lambda: DummyRedis())
+    monkeypatch.setattr(cache, "_TTL_SECONDS", 10)
+
+    cache._redis_set_locator("loc", "css", "#id", "click")
+
+    assert executed == [["hset", "expire"]]
+
+
+def test_pool_stats_reports_connection_usage(monkeypatch):
+    import redis
+
+    from talk2dom.api.utils import metrics
+
+    pool = redis.BlockingConnectionPool.from_url(
+        "redis://localhost:6379/0", max_connections=7
+    )
+    monkeypatch.setattr(cache, "_redis_client", redis.Redis(connection_pool=pool))
+    monkeypatch.setattr(cache, "_aredis_client", None)
+    metrics.reset()
+
+    assert cache.pool_stats() == {"sync": {"in_use": 0, "idle": 0, "max": 7}}
+    assert metrics.snapshot()["gauges"]["redis.pool.sync.in_use"] == 0
+    metrics.reset()
+
+
+def test_async_save_enqueues_instead_of_writing_db(monkeypatch):
+    import asyncio
+
+    queued = []
+
+    async def fake_enqueue(entry):
+        queued.append(entry)
+        return True
+
+    class DummyAsyncRedis:
+        def pipeline(self, transaction=True):
+            return _AsyncPipeline(self)
+
+        async def hset(self, key, mapping=None):
+            pass
+
+        async def expire(self, key, ttl):
+            pass
+
+        async def publish(self, channel, message):
+            pass
+
+    def no_db(*_args):
+        raise AssertionError("queued saves must not hit the DB on the request path")
+
+    monkeypatch.setattr(cache, "_aredis", lambda: DummyAsyncRedis())
+    monkeypatch.setattr(cache, "SessionLocal", object())
+    monkeypatch.setattr(cache, "_db_save_locator", no_db)
+    monkeypatch.setattr(cache._writer, "aenqueue", fake_enqueue)
+
+    saved = asyncio.run(
+        cache.asave_locator("click", "<body></body>", "id", "x", project_id="p")
+    )
+
+    assert saved is True
+    assert queued[0]["selector_value"] == "x" and queued[0]["project_id"] == "p"
+    # Redis 写穿仍是同步的
+    assert cache.local_cache.locators.get(queued[0]["locator_id"])[1] == "x"
@@ -0,0 +1,241 @@
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from talk2dom.api.utils import metrics
+from talk2dom.db import cache, counters
+from talk2dom.db.models import Base, Project, User
+
+
+class _CounterRedis:
+    """In-memory stand-in running the counter scripts' logic in Python."""
+
+    def __init__(self):
+        self.hashes = {}
+        self.values = {}
+        self.sets = {}
+        self.scripts = {
+            counters._SEED: self._seed,
+            counters._CHARGE: self._charge,
+            counters._TOP_UP: self._top_up,
+            counters._TAKE: self._take,
+            counters._RESTORE: self._restore,
+            counters._RESYNC: self._resync,
+            counters._EVICT: self._evict,
+            counters._UNLOCK: self._unlock,
+            counters._TAKE_CALLS: self._take_calls,
+            counters._RESTORE_CALLS: self._restore_calls,
+        }
+
+    def eval(self, script, numkeys, *args):
+        return self.scripts[script](list(args[:numkeys]), list(args[numkeys:]))
+
+    def set(self, key, value, nx=False, px=None):
+        if nx and key in self.values:
+            return None
+        self.values[key] = value
+        return True
+
+    def hmget(self, key, *fields):
+        h = self.hashes.get(key, {})
+        return [h.get(f) for f in fields]
+
+    def srandmember(self, key, count):
+        return list(self.sets.get(key, set()))[:count]
+
+    def _init(self, key, s, o):
+        self.hashes.setdefault(key, {"s": int(s), "o": int(o), "ds": 0, "do": 0})
+
+    def _seed(self, keys, argv):
+        self._init(keys[0], argv[0], argv[1])
+        return self.hmget(keys[0], "s", "o")
+
+    def _charge(self, keys, argv):
+        if keys[0] not in self.hashes:
+            return -1
+        h, n = self.hashes[keys[0]], int(argv[0])
+        from_s = min(h["s"], n)
+        from_o = min(h["o"], n - from_s)
+        h["s"] -= from_s
+        h["ds"] -= from_s
+        h["o"] -= from_o
+        h["do"] -= from_o
+        self.sets.setdefault(keys[1], set()).add(argv[1])
+        if argv[2]:
+            self.values[keys[2]] = self.values.get(keys[2], 0) + n
+            self.sets.setdefault(keys[3], set()).add(argv[2])
+        return n - from_s - from_o
+
+    def _top_up(self, keys, argv):
+        h = self.hashes.get(keys[0])
+        if h is None:
+            return 0
+        h["o"] += int(argv[0])
+        h["do"] += int(argv[0])
+        self.sets.setdefault(keys[1], set()).add(argv[1])
+        return 1
+
+    def _take(self, keys, argv):
+        self.sets.get(keys[1], set()).discard(argv[0])
+        h = self.hashes.get(keys[0])
+        if h is None:
+            return [0, 0]
+        pending = [h["ds"], h["do"]]
+        h["ds"] = h["do"] = 0
+        return pending
+
+    def _restore(self, keys, argv):
+        h = self.hashes.get(keys[0])
+        if h is not None:
+            h["ds"] += int(argv[1])
+            h["do"] += int(argv[2])
+            self.sets.setdefault(keys[1], set()).add(argv[0])
+        return 1
+
+    def _resync(self, keys, argv):
+        h = self.hashes.get(keys[0])
+        if h is None:
+            return [0, 0]
+        s_expected = int(argv[0]) + h["ds"]
+        o_expected = int(argv[1]) + h["do"]
+        drift = [h["s"] - s_expected, h["o"] - o_expected]
+        h["s"], h["o"] = max(s_expected, 0), max(o_expected, 0)
+        return drift
+
+    def _evict(self, keys, argv):
+        self.sets.get(keys[1], set()).discard(argv[0])
+        h = self.hashes.pop(keys[0], None)
+        return [h["ds"], h["do"]] if h else [0, 0]
+
+    def _unlock(self, keys, argv):
+        if self.values.get(keys[0]) == argv[0]:
+            del self.values[keys[0]]
+            return 1
+        return 0
+
+    def _take_calls(self, keys, argv):
+        self.sets.get(keys[1], set()).discard(argv[0])
+        return self.values.pop(keys[0], 0)
+
+    def _restore_calls(self, keys, argv):
+        self.values[keys[0]] = self.values.get(keys[0], 0) + int(argv[1])
+        self.sets.setdefault(keys[1], set()).add(argv[0])
+        return 1
+
+
+def _setup(monkeypatch):
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    monkeypatch.setattr(counters, "SessionLocal", Session)
+    fake = _CounterRedis()
+    monkeypatch.setattr(cache, "_redis", lambda: fake)
+    monkeypatch.setattr(counters.reconciler, "_thread", object())  # 视为已启动
+
+    db = Session()
+    owner = User(
+        email="o@example.com",
+        provider_user_id="local:o",
+        subscription_credits=2,
+        one_time_credits=5,
+    )
+    db.add(owner)
+    db.commit()
+    project = Project(name="P", owner_id=owner.id)
+    db.add(project)
+    db.commit()
+    return fake, db, owner, project
+
+
+def test_counters_are_not_used_without_a_reconciler():
+    user = User(subscription_credits=1, one_time_credits=0)
+
+    assert counters.balance(user) is None
+    assert counters.charge(user, None, 1) is False
+    assert counters.top_up(user.id, 5) is False
+
+
+def test_charges_are_folded_into_the_db(monkeypatch):
+    fake, db, owner, project = _setup(monkeypatch)
+
+    assert counters.balance(owner) == 7
+    assert counters.charge(owner, project.id, 3)
+    assert counters.charge(owner, project.id, 1)
+    assert counters.balances(owner) == (0, 3)
+    # 请求路径上不写库
+    db.refresh(owner)
+    assert owner.subscription_credits == 2
+
+    assert counters.reconcile_once() == 2
+    db.expire_all()
+    assert (owner.subscription_credits, owner.one_time_credits) == (0, 3)
+    assert db.get(Project, project.id).api_call_count == 4
+    assert counters.reconcile_once() == 0
+
+
+def test_top_up_goes_through_cached_balance(monkeypatch):
+    fake, db, owner, _ = _setup(monkeypatch)
+
+    assert counters.top_up(owner.id, 10) is False  # 未缓存,由调用方写库
+    counters.balance(owner)
+    assert counters.top_up(owner.id, 10)
+    assert counters.balances(owner) == (2, 15)
+
+    counters.reconcile_once()
+    db.expire_all()
+    assert owner.one_time_credits == 15
+
+
+def test_drift_resets_cached_balance_from_db(monkeypatch):
+    fake, db, owner, project = _setup(monkeypatch)
+    metrics.reset()
+
+    counters.charge(owner, project.id, 1)
+    # 绕过计数器直接改库
+    owner.one_time_credits = 50
+    db.commit()
+
+    counters.reconcile_once()
+    assert counters.balances(owner) == (1, 50)
+    assert metrics.snapshot()["counters"]["counters.drift"] == 1
+    metrics.reset()
+
+
+def test_failed_fold_puts_deltas_back(monkeypatch):
+    fake, db, owner, project = _setup(monkeypatch)
+    counters.charge(owner, project.id, 2)
+
+    session_factory = counters.SessionLocal
+
+    def broken_session():
+        session = session_factory()
+
+        def commit():
+            raise RuntimeError("db down")
+
+        session.commit = commit
+        return session
+
+    monkeypatch.setattr(counters, "SessionLocal", broken_session)
+    try:
+        counters.reconcile_once()
+    except RuntimeError:
+        pass
+
+    key = counters._credit_key(owner.id)
+    assert fake.hashes[key]["ds"] == -2
+    assert str(owner.id) in fake.sets[counters._dirty_users_key()]
+    assert fake.values[counters._calls_key(project.id)] == 2
+
+
+def test_balance_is_seeded_from_the_db_not_the_callers_user(monkeypatch):
+    fake, db, owner, project = _setup(monkeypatch)
+    # 请求上下文缓存里的旧余额
+    stale = User(id=owner.id, subscription_credits=100, one_time_credits=100)
+
+    assert counters.balance(stale) == 7
+    counters.evict(owner.id)
+    assert counters.charge(stale, project.id, 1)
+    assert counters.balances(owner) == (1, 5)
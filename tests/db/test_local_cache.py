@@ -0,0 +1,83 @@
+from talk2dom.db import local_cache
+
+
+def test_lru_evicts_oldest_by_entries_and_bytes():
+    cache = local_cache.LocalCache(max_entries=2, max_bytes=10_000, ttl=60)
+    cache.set("a", ("id", "a", None))
+    cache.set("b", ("id", "b", None))
+    cache.get("a")
+    cache.set("c", ("id", "c", None))
+
+    assert cache.get("b") is None
+    assert cache.get("a") == ("id", "a", None)
+
+    small = local_cache.LocalCache(max_entries=100, max_bytes=300, ttl=60)
+    small.set("x", ("css", "x" * 100, None))
+    small.set("y", ("css", "y" * 100, None))
+    assert small.get("x") is None and small.get("y") is not None
+    assert small.stats()["bytes"] <= 300
+    # 单条超过上限的不缓存
+    small.set("z", ("css", "z" * 1000, None))
+    assert small.get("z") is None
+
+
+def test_entries_expire(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(local_cache.time, "monotonic", lambda: now[0])
+    cache = local_cache.LocalCache(max_entries=10, max_bytes=10_000, ttl=5)
+    cache.set("a", ("id", "a", None))
+
+    now[0] += 4
+    assert cache.get("a") is not None
+    now[0] += 2
+    assert cache.get("a") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_invalidation_from_other_pods_only():
+    local_cache.locators.set("loc", ("id", "a", None))
+    local_cache._handle(local_cache.message("loc"))
+    assert local_cache.locators.get("loc") is not None
+
+    local_cache._handle("other-pod|loc")
+    assert local_cache.locators.get("loc") is None
+
+
+def test_listener_applies_published_invalidations():
+    import queue
+    import threading
+
+    subscribed = threading.Event()
+    inbox = queue.Queue()
+
+    class DummyPubSub:
+        def subscribe(self, channel):
+            assert channel == "t2d:invalidate"
+            subscribed.set()
+
+        def get_message(self, timeout=None):
+            try:
+                return inbox.get(timeout=0.05)
+            except queue.Empty:
+                return None
+
+        def close(self):
+            pass
+
+    class DummyRedis:
+        def pubsub(self, ignore_subscribe_messages=False):
+            return DummyPubSub()
+
+    listener = local_cache.InvalidationListener(DummyRedis, "t2d:invalidate")
+    listener.start()
+    try:
+        assert subscribed.wait(2)
+        local_cache.locators.set("loc", ("id", "a", None))
+        inbox.put({"type": "message", "data": "other-pod|loc"})
+        for _ in range(100):
+            if local_cache.locators.get("loc") is None:
+                break
+            threading.Event().wait(0.01)
+        assert local_cache.locators.get("loc") is None
+    finally:
+        listener.stop()
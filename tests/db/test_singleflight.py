@@ -0,0 +1,142 @@
+import asyncio
+
+import pytest
+
+from talk2dom.db import cache, singleflight
+
+
+class _FakeAsyncRedis:
+    def __init__(self, lock_free=True):
+        self.lock_free = lock_free
+        self.locks = {}
+
+    async def set(self, key, value, nx=False, px=None):
+        if not self.lock_free or (nx and key in self.locks):
+            return None
+        self.locks[key] = value
+        return True
+
+    async def eval(self, script, numkeys, key, token):
+        if self.locks.get(key) == token:
+            del self.locks[key]
+            return 1
+        return 0
+
+    async def exists(self, key):
+        return 1 if key in self.locks else 0
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    redis = _FakeAsyncRedis()
+    monkeypatch.setattr(cache, "_aredis", lambda: redis)
+    monkeypatch.setattr(singleflight, "_POLL_INTERVAL_MS", 1)
+    return redis
+
+
+def test_concurrent_callers_share_one_call(fake_redis):
+    calls = []
+
+    async def produce():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "selector"
+
+    async def main():
+        return await asyncio.gather(
+            *[singleflight.run("loc-1", produce) for _ in range(5)]
+        )
+
+    results = asyncio.run(main())
+
+    assert len(calls) == 1
+    assert [r for r, _ in results] == ["selector"] * 5
+    assert sorted(role for _, role in results) == ["leader"] + ["local"] * 4
+    assert fake_redis.locks == {}
+    assert singleflight._inflight == {}
+
+
+def test_follower_waits_for_remote_leader(fake_redis):
+    fake_redis.lock_free = False
+    fake_redis.locks[singleflight._lock_key("loc-2")] = "other-pod"
+    polls = []
+
+    async def produce():
+        raise AssertionError("follower must not call the LLM")
+
+    async def poll():
+        polls.append(1)
+        return "cached" if len(polls) >= 2 else None
+
+    result, role = asyncio.run(singleflight.run("loc-2", produce, poll))
+
+    assert (result, role) == ("cached", "remote")
+
+
+def test_follower_computes_when_leader_leaves_nothing(fake_redis):
+    fake_redis.lock_free = False
+
+    async def produce():
+        return "fresh"
+
+    async def poll():
+        return None
+
+    result, role = asyncio.run(singleflight.run("loc-3", produce, poll))
+
+    assert (result, role) == ("fresh", "leader")
+
+
+def test_leader_failure_propagates_to_local_followers(fake_redis):
+    async def produce():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("LLM invoke failed")
+
+    async def main():
+        return await asyncio.gather(
+            *[singleflight.run("loc-4", produce) for _ in range(3)],
+            return_exceptions=True,
+        )
+
+    results = asyncio.run(main())
+
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert singleflight._inflight == {}
+
+
+def test_followers_give_up_at_the_request_deadline(fake_redis):
+    from talk2dom.api.utils import deadline
+
+    async def slow():
+        await asyncio.sleep(0.5)
+        return "late"
+
+    async def local_follower():
+        leader = asyncio.ensure_future(singleflight.run("loc-5", slow))
+        await asyncio.sleep(0)
+        deadline.start("20")
+        with pytest.raises(deadline.DeadlineExceeded):
+            await singleflight.run("loc-5", slow)
+        # leader 不受 follower 超时影响
+        return await leader
+
+    assert asyncio.run(local_follower()) == ("late", "leader")
+
+    fake_redis.lock_free = False
+    fake_redis.locks[singleflight._lock_key("loc-6")] = "other-pod"
+
+    async def produce():
+        raise AssertionError("no time left to call the LLM")
+
+    async def poll():
+        return None
+
+    async def remote_follower():
+        deadline.start("20")
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        with pytest.raises(deadline.DeadlineExceeded):
+            await singleflight.run("loc-6", produce, poll)
+        return loop.time() - start
+
+    assert asyncio.run(remote_follower()) < 1
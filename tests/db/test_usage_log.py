@@ -0,0 +1,193 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from talk2dom.api import deps
+from talk2dom.api.utils import metrics
+from talk2dom.db import usage_log
+from talk2dom.db.models import APIUsage, Base, Project, User
+
+
+def _sessionmaker():
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def test_apply_credits_never_goes_negative():
+    user = User(subscription_credits=1, one_time_credits=2)
+
+    usage_log.apply_credits(user, 2)
+    assert (user.subscription_credits, user.one_time_credits) == (0, 1)
+    usage_log.apply_credits(user, 5)
+    assert (user.subscription_credits, user.one_time_credits) == (0, 0)
+
+
+def test_full_buffer_drops_oldest_events_without_credits(monkeypatch):
+    buffer = usage_log.UsageBuffer(size=2)
+    buffer._thread = object()  # 视为 flusher 已启动
+    metrics.reset()
+
+    assert buffer.push({"i": 0, "credits": 1})
+    assert buffer.push({"i": 1, "credits": 0})
+    assert buffer.push({"i": 2, "credits": 1})
+    # 只剩扣费事件时拒绝入队,由调用方同步写库
+    assert buffer.push({"i": 3, "credits": 1}) is False
+
+    assert [event["i"] for event in buffer._events] == [0, 2]
+    counters = metrics.snapshot()["counters"]
+    assert counters["usage.dropped"] == 1
+    assert counters["usage.buffer_full"] == 1
+    metrics.reset()
+
+
+def test_failed_flush_keeps_credit_events(monkeypatch):
+    def broken_session():
+        raise RuntimeError("db down")
+
+    monkeypatch.setattr(usage_log, "SessionLocal", broken_session)
+    buffer = usage_log.UsageBuffer(size=2)
+    buffer._thread = object()
+    buffer.push({"i": 0, "credits": 1})
+    buffer.push({"i": 1, "credits": 1})
+    batch = buffer._take()
+    buffer.push({"i": 2, "credits": 0})
+    buffer.push({"i": 3, "credits": 1})
+
+    monkeypatch.setattr(buffer, "_take", lambda: batch)
+    with pytest.raises(RuntimeError):
+        buffer.flush()
+
+    # 放回的批次超出容量时只丢不扣费的事件
+
+    assert [event["i"] for event in buffer._events] == [0, 1, 3]
+
+
+def test_buffered_usage_is_written_in_bulk_on_stop(monkeypatch):
+    Session = _sessionmaker()
+    monkeypatch.setattr(usage_log, "SessionLocal", Session)
+    monkeypatch.setattr(usage_log, "FLUSH_MS", 60_000)
+    buffer = usage_log.UsageBuffer(size=100)
+    monkeypatch.setattr(usage_log, "buffer", buffer)
+
+    db = Session()
+    owner = User(
+        email="o@example.com",
+        provider_user_id="local:o",
+        subscription_credits=1,
+        one_time_credits=5,
+    )
+    db.add(owner)
+    db.commit()
+    project = Project(name="P", owner_id=owner.id)
+    db.add(project)
+    db.commit()
+
+    @deps.track_api_usage()
+    async def endpoint(request, db, user, project_id, api_key_id=None):
+        request.state.call_llm = True
+        return {"ok": True}
+
+    buffer.start()
+    for _ in range(3):
+        request = SimpleNamespace(
+            state=SimpleNamespace(),
+            url=SimpleNamespace(path="/api/v1/inference/locator"),
+        )
+        asyncio.run(endpoint(request=request, db=db, user=owner, project_id=project.id))
+
+    # 请求路径上不写库
+    assert db.query(APIUsage).count() == 0
+
+    buffer.stop()
+
+    check = Session()
+    assert check.query(APIUsage).count() == 3
+    refreshed = check.get(User, owner.id)
+    assert (refreshed.subscription_credits, refreshed.one_time_credits) == (0, 3)
+    assert check.get(Project, project.id).api_call_count == 3
+
+
+class _SyncStream:
+    def __init__(self):
+        self.entries = {}
+        self.acked = []
+
+    def xadd(self, stream, fields):
+        message_id = f"{len(self.entries) + 1}-0"
+        self.entries[message_id] = fields
+        return message_id
+
+    def xgroup_create(self, stream, group, id="0", mkstream=False):
+        return True
+
+    def xautoclaim(self, stream, group, consumer, min_idle, count=None):
+        return "0-0", [], []
+
+    def xreadgroup(self, group, consumer, streams, count=None, block=None):
+        new = [(i, f) for i, f in self.entries.items() if i not in self.acked]
+        return [["stream", new[:count]]] if new else []
+
+    def xack(self, stream, group, *ids):
+        self.acked.extend(ids)
+
+    def xdel(self, stream, *ids):
+        for message_id in ids:
+            self.entries.pop(message_id, None)
+
+
+def test_usage_goes_through_the_redis_stream(monkeypatch):
+    from talk2dom.db import write_behind
+
+    Session = _sessionmaker()
+    monkeypatch.setattr(usage_log, "SessionLocal", Session)
+    monkeypatch.setattr(write_behind, "MODE", "redis")
+    fake = _SyncStream()
+    stream = write_behind.WriteBehind(
+        lambda: fake, None, "test:usage", usage_log._write_stream_batch
+    )
+    stream._thread = object()  # 视为消费者已启动
+    monkeypatch.setattr(usage_log, "stream", stream)
+
+    db = Session()
+    owner = User(
+        email="o@example.com",
+        provider_user_id="local:o",
+        subscription_credits=1,
+        one_time_credits=5,
+    )
+    db.add(owner)
+    db.commit()
+    project = Project(name="P", owner_id=owner.id)
+    db.add(project)
+    db.commit()
+
+    @deps.track_api_usage()
+    async def endpoint(request, db, user, project_id, api_key_id=None):
+        request.state.call_llm = True
+        return {"ok": True}
+
+    for _ in range(2):
+        request = SimpleNamespace(
+            state=SimpleNamespace(),
+            url=SimpleNamespace(path="/api/v1/inference/locator"),
+        )
+        asyncio.run(endpoint(request=request, db=db, user=owner, project_id=project.id))
+
+    assert len(fake.entries) == 2
+    assert db.query(APIUsage).count() == 0
+
+    # 消费者落库后才确认并删除
+    assert stream.drain_once(block=False) == 2
+    assert fake.entries == {}
+    check = Session()
+    assert check.query(APIUsage).count() == 2
+    refreshed = check.get(User, owner.id)
+    assert (refreshed.subscription_credits, refreshed.one_time_credits) == (0, 4)
+    assert check.get(Project, project.id).api_call_count == 2
@@ -0,0 +1,144 @@
+import asyncio
+
+import pytest
+
+from talk2dom.db import write_behind
+
+
+class FakeStream:
+    """Just enough of a Redis stream + consumer group for the writer."""
+
+    def __init__(self):
+        self.entries = {}
+        self.pending = set()
+        self.acked = []
+        self._seq = 0
+
+    async def xadd(self, stream, fields):
+        self._seq += 1
+        self.entries[f"{self._seq}-0"] = fields
+        return f"{self._seq}-0"
+
+    def xgroup_create(self, stream, group, id="0", mkstream=False):
+        return True
+
+    def xautoclaim(self, stream, group, consumer, min_idle, count=None):
+        return "0-0", [], []
+
+    def xreadgroup(self, group, consumer, streams, count=None, block=None):
+        new = [(i, f) for i, f in self.entries.items() if i not in self.pending]
+        new = new[:count]
+        self.pending.update(i for i, _ in new)
+        return [["stream", new]] if new else []
+
+    def xack(self, stream, group, *ids):
+        self.acked.extend(ids)
+        self.pending.difference_update(ids)
+
+    def xdel(self, stream, *ids):
+        for message_id in ids:
+            self.entries.pop(message_id, None)
+
+
+def _writer(monkeypatch, mode, flush, stream=None):
+    monkeypatch.setattr(write_behind, "MODE", mode)
+    monkeypatch.setattr(write_behind, "FLUSH_MS", 20)
+    writer = write_behind.WriteBehind(
+        lambda: stream, lambda: stream, "test:write_behind", flush
+    )
+    return writer
+
+
+def test_not_running_writer_asks_for_sync_write(monkeypatch):
+    writer = _writer(monkeypatch, "local", lambda entries: None)
+    assert asyncio.run(writer.aenqueue({"locator_id": "a"})) is False
+
+
+def test_local_queue_is_flushed_in_batches_and_on_stop(monkeypatch):
+    batches = []
+    writer = _writer(monkeypatch, "local", batches.append)
+    monkeypatch.setattr(write_behind, "BATCH_SIZE", 2)
+    writer.start()
+    writer._stop.set()  # 只验证 stop 时的最终 flush
+    writer._thread.join()
+
+    async def main():
+        for i in range(3):
+            assert await writer.aenqueue({"locator_id": str(i)})
+
+    asyncio.run(main())
+    writer.stop()
+
+    assert [len(batch) for batch in batches] == [2, 1]
+    assert [e["locator_id"] for batch in batches for e in batch] == ["0", "1", "2"]
+
+
+def test_stream_entries_are_acked_only_after_flush(monkeypatch):
+    stream = FakeStream()
+    flushed = []
+    fail = [True]
+
+    def flush(entries):
+        if fail[0]:
+            raise RuntimeError("db down")
+        flushed.extend(entries)
+
+    writer = _writer(monkeypatch, "redis", flush, stream)
+    writer._thread = object()  # 视为已启动,由测试手动驱动 drain_once
+
+    asyncio.run(writer.aenqueue({"locator_id": "a", "project_id": None}))
+    asyncio.run(writer.aenqueue({"locator_id": "b", "project_id": None}))
+
+    with pytest.raises(RuntimeError):
+        writer.drain_once(block=False)
+    assert stream.acked == [] and len(stream.entries) == 2
+
+    # 失败的批次仍在 pending 里,由 xautoclaim 交还后重新写入
+    stream.pending.clear()
+    fail[0] = False
+    assert writer.drain_once(block=False) == 2
+    assert [e["locator_id"] for e in flushed] == ["a", "b"]
+    assert stream.entries == {} and len(stream.acked) == 2
+
+
+def test_batch_flush_uses_one_multi_row_upsert_per_table(monkeypatch):
+    from unittest.mock import MagicMock
+
+    from sqlalchemy.dialects import postgresql
+
+    from talk2dom.db import cache
+
+    session = MagicMock()
+    session.execute.return_value.scalars.return_value = ["h1"]
+    monkeypatch.setattr(cache, "SessionLocal", lambda: session)
+
+    def entry(locator_id, html_id, value):
+        return {
+            "locator_id": locator_id,
+            "instruction": "click",
+            "html_backbone": "<body><div></div></body>",
+            "selector_type": "id",
+            "selector_value": value,
+            "action": "click:",
+            "url": "",
+            "project_id": None,
+            "html": "<body></body>",
+            "html_id": html_id,
+        }
+
+    cache._db_save_locators(
+        [entry("a", "h1", "old"), entry("b", "h2", "x"), entry("a", "h1", "new")]
+    )
+
+    statements = [
+        str(call.args[0].compile(dialect=postgresql.dialect()))
+        for call in session.execute.call_args_list
+    ]
+    html_sql, bands_sql, locator_sql = statements
+    assert "ON CONFLICT (id) DO NOTHING" in html_sql and "RETURNING" in html_sql
+    assert bands_sql.startswith("INSERT INTO html_simhash_bands")
+    assert "ON CONFLICT (id) DO UPDATE" in locator_sql
+    # 同一 locator 只写最后一次的值
+    params = session.execute.call_args_list[2].args[0].compile().params
+    assert params["selector_value_m0"] == "new" and "id_m2" not in params
+    session.commit.assert_called_once()
@@ -1,5 +1,6 @@
 from unittest.mock import MagicMock, patch
 
+import pytest
 
 from talk2dom.core import (
     call_selector_llm,
@@ -9,6 +10,14 @@ from talk2dom.core import (
     highlight_element,
     get_computed_styles,
 )
+from talk2dom import core
+
+
+@pytest.fixture(autouse=True)
+def _fresh_chains():
+    core.clear_chains()
+    yield
+    core.clear_chains()
 
 
 @patch("talk2dom.core.init_chat_model")
@@ -108,3 +117,100 @@ def test_get_computed_styles_all_properties():
 
     result = get_computed_styles(DummyDriver(), object())
     assert result == {"color": "red"}
+
+
+@patch("talk2dom.core.init_chat_model")
+@patch("talk2dom.core.load_prompt", return_value="prompt")
+def test_acall_selector_llm_awaits_chain(mock_prompt, mock_model):
+    import asyncio
+    from unittest.mock import AsyncMock
+
+    fake_chain = MagicMock()
+    fake_chain.ainvoke = AsyncMock(
+        return_value=[MagicMock(selector_type="id", selector_value="main")]
+    )
+    mock_model.return_value.bind_tools.return_value.__or__.return_value = fake_chain
+
+    from talk2dom.core import acall_selector_llm
+
+    result = asyncio.run(acall_selector_llm("click", "<div></div>", "model", "p"))
+    assert result.selector_value == "main"
+    fake_chain.invoke.assert_not_called()
+
+
+@patch("talk2dom.core.init_chat_model")
+@patch("talk2dom.core.load_prompt", return_value="prompt")
+def test_selector_chain_is_built_once_per_model(mock_prompt, mock_model):
+    fake_chain = MagicMock()
+    fake_chain.invoke.return_value = [MagicMock(selector_type="id")]
+    mock_model.return_value.bind_tools.return_value.__or__.return_value = fake_chain
+
+    call_selector_llm("a", "<div></div>", "model", "provider")
+    call_selector_llm("b", "<div></div>", "model", "provider")
+    call_selector_llm("c", "<div></div>", "other-model", "provider")
+
+    assert mock_model.call_count == 2
+    assert fake_chain.invoke.call_count == 3
+
+
+def test_load_prompt_reloads_when_file_changes(tmp_path, monkeypatch):
+    import os
+
+    prompts = tmp_path / "prompts"
+    prompts.mkdir()
+    prompt_file = prompts / "p.txt"
+    prompt_file.write_text("v1\n", encoding="utf-8")
+    monkeypatch.setattr(core, "__file__", str(tmp_path / "core.py"))
+
+    assert load_prompt("p.txt") == "v1"
+    prompt_file.write_text("v2\n", encoding="utf-8")
+    stat = prompt_file.stat()
+    os.utime(prompt_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    assert load_prompt("p.txt") == "v2"
+
+
+@patch("talk2dom.core.init_chat_model")
+@patch("talk2dom.core.load_prompt", return_value="prompt")
+def test_acall_selector_batch_llm_returns_selectors_in_order(mock_prompt, mock_model):
+    import asyncio
+    from unittest.mock import AsyncMock
+
+    from talk2dom.core import Selector, SelectorBatch, acall_selector_batch_llm
+
+    selectors = [
+        Selector(
+            selector_type="id", selector_value=v, action_type="click", action_value=""
+        )
+        for v in ("a", "b")
+    ]
+    fake_chain = MagicMock()
+    fake_chain.ainvoke = AsyncMock(return_value=[SelectorBatch(selectors=selectors)])
+    mock_model.return_value.bind_tools.return_value.__or__.return_value = fake_chain
+
+    result = asyncio.run(acall_selector_batch_llm(["a", "b"], "<div/>", "m", "p"))
+    assert [s.selector_value for s in result] == ["a", "b"]
+    query = fake_chain.ainvoke.call_args.args[0]
+    assert "1. a\n2. b" in query
+
+    # a short answer cannot be matched to instructions
+    assert asyncio.run(acall_selector_batch_llm(["a", "b", "c"], "<div/>", "m", "p")) is None
+
+
+@patch("talk2dom.core.init_chat_model")
+def test_acall_element_index_llm_uses_index_prompt(mock_model):
+    import asyncio
+    from unittest.mock import AsyncMock
+
+    fake_chain = MagicMock()
+    fake_chain.ainvoke = AsyncMock(return_value=[MagicMock(element_index=4)])
+    mock_model.return_value.bind_tools.return_value.__or__.return_value = fake_chain
+
+    result = asyncio.run(
+        core.acall_element_index_llm("click", "[4] button", "model", "p")
+    )
+
+    assert result.element_index == 4
+    mock_model.return_value.bind_tools.assert_called_once_with([core.ElementPick])
+    query = fake_chain.ainvoke.call_args[0][0]
+    assert "element_index" in query
+    assert query.endswith("## HTML: \n[4] button\n\nUser: click\n\nAssistant:")